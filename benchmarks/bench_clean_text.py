@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark data.clean_text against the sequential tag passes it replaced, on
+synthetic fullContent bodies of increasing size. Run from the repository root
+with:
+
+    python -m benchmarks.bench_clean_text
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import html
+import re
+import timeit
+import feedstream.data as data
+
+# Constants -------------------------------------------------------------------
+
+PARAGRAPH = (
+    '<p class="body">The committee&#8217;s report, published on '
+    '<b>Tuesday</b>, found that <a href="https://example.com/report">'
+    'spending</a> had risen by 4% ( in real terms ) .</p>\n'
+    '<figure><img src="https://example.com/chart.png" alt="Chart">'
+    '<figcaption>Figure 1: Spending &amp; outcomes</figcaption></figure>\n'
+    '<ul><li>First point</li><li>Second point !</li></ul>\n')
+
+RE_WHITESPACE = re.compile(r'\s+')
+RE_WHITESPACE_PUNCTUATION = re.compile(r'\s([?,;:.)}\]"](?:\s|$))')
+RE_WHITESPACE_EXCLAMATION = re.compile(r'\s(!+(?:\s|$))')
+
+SIZES = [1, 10, 100, 1000]
+REPEAT = 5
+
+# Sequential implementation ---------------------------------------------------
+
+def clean_text_sequential(text):
+
+    """The cleaning chain as it was before tags were removed in one scan."""
+
+    text = html.unescape(text)
+    text = data.remove_tags_sequential(text)
+    text = re.sub(RE_WHITESPACE, ' ', text)
+    text = re.sub(RE_WHITESPACE_PUNCTUATION, r'\1', text)
+    text = re.sub(RE_WHITESPACE_EXCLAMATION, r'\1', text)
+    return text.strip()
+
+# Benchmark -------------------------------------------------------------------
+
+def run():
+
+    print('{0:>10} {1:>12} {2:>12} {3:>8}'.format(
+        'bytes', 'sequential', 'single', 'speedup'))
+
+    for size in SIZES:
+
+        text = PARAGRAPH * size
+        assert clean_text_sequential(text) == data.clean_text(text)
+        number = max(1, 1000 // size)
+
+        sequential = min(timeit.repeat(lambda: clean_text_sequential(text),
+            number=number, repeat=REPEAT)) / number
+        single = min(timeit.repeat(lambda: data.clean_text(text),
+            number=number, repeat=REPEAT)) / number
+
+        print('{0:>10} {1:>10.1f}us {2:>10.1f}us {3:>7.2f}x'.format(
+            len(text.encode('utf-8')),
+            sequential * 1e6,
+            single * 1e6,
+            sequential / single))
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the sequential and concurrent download paths against a local stub
+of the Feedly API. The stub server adds a fixed latency to every response to
+simulate the network. Run from the repository root with:
+
+    python -m benchmarks.bench_download
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import http.server
+import json
+import threading
+import time
+import urllib
+import feedstream.download as download
+import feedstream.fetch as fetch
+from unittest.mock import patch
+from tests.test_data import get_mock_entry
+
+# Constants -------------------------------------------------------------------
+
+NUM_TAGS = 50
+PAGES_PER_TAG = 3
+ITEMS_PER_PAGE = 20
+LATENCY = 0.02
+WORKERS = [1, 2, 4, 8, 16]
+
+# Stub server -----------------------------------------------------------------
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+
+    """Serve tags and paginated stream contents with a fixed latency."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+
+        time.sleep(LATENCY)
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path.endswith('/tags'):
+            body = [{'id': 'tag_{0}'.format(i), 'label': 'Tag {0}'.format(i)}
+                for i in range(NUM_TAGS)]
+
+        elif url.path.endswith('/streams/contents'):
+            page = int(query.get('continuation', ['0'])[0])
+            body = {
+                'id': query['streamId'][0],
+                'items': [get_mock_entry() for i in range(ITEMS_PER_PAGE)]}
+            if page + 1 < PAGES_PER_TAG:
+                body['continuation'] = str(page + 1)
+
+        else:
+            self.send_error(404)
+            return
+
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+# Benchmark -------------------------------------------------------------------
+
+def run():
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    api_url = 'http://127.0.0.1:{0}/v3'.format(server.server_port)
+    requests_per_run = 1 + NUM_TAGS * PAGES_PER_TAG
+
+    print('{0} tags, {1} pages per tag, {2:.0f} ms latency per request'.format(
+        NUM_TAGS, PAGES_PER_TAG, LATENCY * 1000))
+
+    try:
+        with patch.object(fetch, 'API_URL', api_url), \
+            patch.object(download.settings, 'download_new', False), \
+            patch.object(download.settings, 'enterprise', False):
+
+            for workers in WORKERS:
+                with patch.object(download.settings,
+                    'download_workers', workers):
+
+                    start = time.perf_counter()
+                    entries = download.download_entries(flatten=True)
+                    elapsed = time.perf_counter() - start
+
+                print('workers={0:<3} {1:>6} items {2:>8.3f} s '
+                    '{3:>8.1f} req/s'.format(
+                        workers,
+                        len(entries['items']),
+                        elapsed,
+                        requests_per_run / elapsed))
+
+        stats = fetch.get_client().get_stats()
+        print('{0} requests over {1} connections ({2} reused)'.format(
+            stats['requests'], stats['connections'], stats['reused']))
+
+    finally:
+        server.shutdown()
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the time taken to import the package in a fresh interpreter. The
+last case loads everything the package used to load on import: every
+submodule, the settings, the mail templates and pandas. Run from the
+repository root with:
+
+    python -m benchmarks.bench_import
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import subprocess
+import sys
+import time
+
+# Constants -------------------------------------------------------------------
+
+REPEATS = 5
+
+CASES = [
+    ('python', 'pass'),
+    ('feedstream', 'import feedstream'),
+    ('fetch', 'import feedstream.fetch'),
+    ('submodules', 'import feedstream.download, feedstream.store, '
+        'feedstream.mail'),
+    ('everything', 'import feedstream, pandas; feedstream.settings.timezone; '
+        'feedstream.TEMPLATE_MAIL; feedstream.download_entries_df')]
+
+# Benchmark -------------------------------------------------------------------
+
+def timed(code):
+
+    best = None
+    for r in range(REPEATS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run():
+
+    print('{0:>12} {1:>10}'.format('import', 'time'))
+
+    for name, code in CASES:
+        print('{0:>12} {1:>9.3f}s'.format(name, timed(code)))
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
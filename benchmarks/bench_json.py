@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark decoding large pages of entries: decoding the bytes to a str and
+parsing that with the standard library, against each installed json backend
+parsing the bytes directly. The pages are the responses recorded in the
+response cache if there are any, otherwise synthetic pages of entries with
+full content. Run from the repository root with:
+
+    python -m benchmarks.bench_json
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import json
+import os
+import time
+import feedstream.fetch as fetch
+from feedstream.config import settings
+from tests.test_data import get_mock_entry
+
+# Constants -------------------------------------------------------------------
+
+NUM_PAGES = 10
+PAGE_SIZE = 1000
+CONTENT_SIZE = 2000
+REPEATS = 3
+
+# Benchmark -------------------------------------------------------------------
+
+def get_recorded_pages():
+
+    pages = []
+
+    if not os.path.isdir(settings.cache_dir):
+        return pages
+
+    for entry in os.scandir(settings.cache_dir):
+        if entry.name.endswith('.json'):
+            with open(entry.path, encoding='utf-8') as f:
+                pages.append(json.loads(f.read())['text'].encode('utf-8'))
+
+    return pages
+
+
+def get_synthetic_pages():
+
+    pages = []
+    content = '<p>{0}</p>'.format('Lorem ipsum dolor sit amet. ' *
+        (CONTENT_SIZE // 28))
+
+    for p in range(NUM_PAGES):
+        items = []
+        for i in range(PAGE_SIZE):
+            entry = get_mock_entry()
+            entry['id'] = 'entry_{0}_{1}'.format(p, i)
+            entry['fullContent'] = content
+            items.append(entry)
+        page = {'id': 'tag', 'continuation': 'c', 'items': items}
+        pages.append(json.dumps(page).encode('utf-8'))
+
+    return pages
+
+
+def timed(loads, pages):
+
+    best = None
+    for r in range(REPEATS):
+        start = time.perf_counter()
+        for page in pages:
+            loads(page)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run():
+
+    pages = get_recorded_pages()
+    source = 'recorded'
+
+    if len(pages) == 0:
+        pages = get_synthetic_pages()
+        source = 'synthetic'
+
+    size = sum(len(page) for page in pages)
+    print('{0} {1} pages, {2:.1f}MB'.format(
+        len(pages), source, size / 1024 / 1024))
+    print('{0:>12} {1:>10} {2:>10}'.format('backend', 'time', 'MB/s'))
+
+    decoders = [('json (str)', lambda page: json.loads(page.decode('utf-8')))]
+    for name in fetch.JSON_BACKENDS:
+        module = fetch._get_json_module(name)
+        if module is not None:
+            decoders.append((name, module.loads))
+
+    for name, loads in decoders:
+        elapsed = timed(loads, pages)
+        print('{0:>12} {1:>9.3f}s {2:>10.1f}'.format(
+            name, elapsed, size / 1024 / 1024 / elapsed))
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
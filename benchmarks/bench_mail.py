@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark selecting and rendering the emails for a mailshot, against the
+previous approach of selecting each user's articles with isin and rendering
+each email with iterrows. Emails are not written to the production mail
+directory. Run from the repository root with:
+
+    python -m benchmarks.bench_mail
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import random
+import time
+import feedstream.download as download
+import feedstream.mail as mail
+from unittest.mock import patch
+
+# Constants -------------------------------------------------------------------
+
+NUM_ARTICLES = 10000
+NUM_TAGS = 100
+NUM_USERS = 1000
+MAX_USER_TAGS = 5
+SHARED_ARTICLES = 0.2
+
+# Benchmark -------------------------------------------------------------------
+
+def get_articles():
+
+    random.seed(0)
+    columns = download.EntryColumns()
+
+    for i in range(NUM_ARTICLES):
+
+        # Some articles are saved to more than one tag
+        if i > 0 and random.random() < SHARED_ARTICLES:
+            article_id = 'article_{0}'.format(random.randrange(i))
+        else:
+            article_id = 'article_{0}'.format(i)
+
+        tag = i * NUM_TAGS // NUM_ARTICLES
+        columns.append({
+            'tag_id': 'tag_{0}'.format(tag),
+            'tag_label': 'Tag {0}'.format(tag),
+            'add_timestamp': NUM_ARTICLES - i,
+            'add_date': None,
+            'add_time': None,
+            'pub_date': None,
+            'publisher': 'Publisher',
+            'url': 'http://domain.com/{0}'.format(article_id),
+            'title': 'Title of {0}'.format(article_id),
+            'author': None,
+            'summary': None,
+            'full_content': None,
+            'short_content': 'Some sample text ' * 15,
+            'keywords': None,
+            'comments': None,
+            'highlights': None,
+            'article_id': article_id})
+
+    return columns.to_dataframe()
+
+
+def get_users():
+
+    tag_ids = ['tag_{0}'.format(t) for t in range(NUM_TAGS)]
+    return [{
+        'email_address': 'user_{0}@domain.com'.format(u),
+        'tag_ids': random.sample(tag_ids, random.randint(1, MAX_USER_TAGS))}
+        for u in range(NUM_USERS)]
+
+
+def render_iterrows(users, articles):
+
+    template_mail = mail.get_template(mail.TEMPLATE_FILE_MAIL)
+    template_tag = mail.get_template(mail.TEMPLATE_FILE_TAG)
+    template_item = mail.get_template(mail.TEMPLATE_FILE_ITEM)
+    users_emails = {}
+
+    for user in users:
+
+        user_articles = articles.loc[articles['tag_id'].isin(
+            user['tag_ids'])].drop_duplicates(['article_id'])
+
+        tags = []
+        items = []
+        tag_id = user_articles.iloc[0]['tag_id']
+        tag_label = user_articles.iloc[0]['tag_label']
+
+        for index, row in user_articles.iterrows():
+            if tag_id != row['tag_id']:
+                tags.append(template_tag.format(
+                    tag_label=tag_label, items=''.join(items)))
+                items = []
+            items.append(template_item.format(url=row['url'],
+                title=row['title'], short_content=row['short_content']))
+            tag_id = row['tag_id']
+            tag_label = row['tag_label']
+
+        tags.append(template_tag.format(
+            tag_label=tag_label, items=''.join(items)))
+        users_emails[user['email_address']] = template_mail.format(
+            date='date', tags=''.join(tags))
+
+    return users_emails
+
+
+def render_cached(users, articles):
+
+    users_articles = mail.get_articles_by_user(users, articles)
+    return mail.get_emails_by_user(users_articles)
+
+
+def run():
+
+    articles = get_articles()
+    users = get_users()
+
+    print('{0} articles in {1} tags, {2} recipients'.format(
+        NUM_ARTICLES, NUM_TAGS, NUM_USERS))
+    print('{0:>10} {1:>10}'.format('renderer', 'time'))
+
+    with patch('feedstream.mail._write_email'):
+        for name, render in [
+            ('iterrows', render_iterrows),
+            ('cached', render_cached)]:
+
+            start = time.perf_counter()
+            render(users, articles)
+            elapsed = time.perf_counter() - start
+            print('{0:>10} {1:>9.3f}s'.format(name, elapsed))
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
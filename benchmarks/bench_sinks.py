@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark writing and reading back entries as a csv and as a Parquet file.
+Reading the csv includes parsing its dates and splitting its list fields, so
+that both files are loaded into the same form. Run from the repository root
+with:
+
+    python -m benchmarks.bench_sinks
+
+"""
+
+# Imports ---------------------------------------------------------------------
+
+import csv
+import os
+import tempfile
+import time
+import pandas
+import feedstream.data as data
+import feedstream.download as download
+from tests.test_data import get_mock_entry
+
+# Constants -------------------------------------------------------------------
+
+NUM_ITEMS = 20000
+
+# Benchmark -------------------------------------------------------------------
+
+def write_csv(filepath, items):
+
+    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=data.FIELDNAMES,
+            quoting=csv.QUOTE_NONNUMERIC)
+        writer.writeheader()
+        for item in items:
+            writer.writerow(item)
+
+
+def read_csv(filepath):
+
+    df = pandas.read_csv(filepath, parse_dates=['add_date', 'pub_date'])
+    for field in download.LIST_FIELDS:
+        df[field] = df[field].str.split(data.SEPARATOR)
+    return df
+
+
+def write_parquet(filepath, items):
+
+    schema = download.get_arrow_schema()
+    with download.pyarrow.parquet.ParquetWriter(filepath, schema,
+        compression='zstd') as writer:
+        for i in range(0, len(items), download.ROW_GROUP_SIZE):
+            writer.write_table(download.get_arrow_table(
+                items[i:i + download.ROW_GROUP_SIZE], schema))
+
+
+def read_parquet(filepath):
+
+    return pandas.read_parquet(filepath)
+
+
+def timed(func, *args):
+
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run():
+
+    if download.pyarrow is None:
+        print('pyarrow is not installed')
+        return
+
+    entries = []
+    for i in range(NUM_ITEMS):
+        entry = get_mock_entry()
+        entry['id'] = 'entry_{0}'.format(i)
+        entries.append(entry)
+
+    flat_items = data.parse_items('tag', 'Tag', entries, flatten=True)
+    items = data.parse_items('tag', 'Tag', entries, flatten=False)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+
+        csv_path = os.path.join(tempdir, 'entries.csv')
+        parquet_path = os.path.join(tempdir, 'entries.parquet')
+
+        print('{0} items'.format(NUM_ITEMS))
+        print('{0:>8} {1:>10} {2:>10} {3:>10}'.format(
+            'format', 'write', 'read', 'size'))
+
+        for name, path, write, read, rows in [
+            ('csv', csv_path, write_csv, read_csv, flat_items),
+            ('parquet', parquet_path, write_parquet, read_parquet, items)]:
+
+            write_time = timed(write, path, rows)
+            read_time = timed(read, path)
+
+            print('{0:>8} {1:>9.3f}s {2:>9.3f}s {3:>8.1f}MB'.format(
+                name, write_time, read_time,
+                os.path.getsize(path) / 1024 / 1024))
+
+# Main ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    run()
@@ -4,15 +4,118 @@
 
 The feedstrem package provides tools for downloading and processing data from
 a feedly account.
+
+Submodules and the names they export are imported the first time they are
+used, so importing the package does not import pandas or read the config
+file until they are needed.
 """
 
-from . import config
-from .config import *
-from . import data
-from .data import *
-from . import fetch
-from .fetch import *
-from . import download
-from .download import *
-from . import mail
-from .mail import *
+import importlib
+
+# Exports ---------------------------------------------------------------------
+
+_SUBMODULES = (
+    'config', 'data', 'exceptions', 'cache', 'fetch', 'download', 'store',
+    'mail')
+
+_EXPORTS = {
+    'config': (
+        'DIR_APP', 'DIR_DATA', 'DIR_TEMPLATE', 'DIR_CONFIG', 'DIR_TIMESTAMP',
+        'DIR_RECIPIENT', 'DIR_STATE', 'DIR_CACHE', 'FILE_CONFIG',
+        'FILE_TIMESTAMP', 'FILE_TAG_TIMESTAMPS', 'FILE_RECIPIENT',
+        'FILE_SEEN_IDS', 'KEY_TIMEZONE', 'KEY_ENTERPRISE', 'KEY_DOWNLOAD_NEW',
+        'KEY_DOWNLOAD_PREFIX', 'KEY_ACCESS_TOKEN', 'KEY_REFRESH_TOKEN',
+        'KEY_MAILER_ENDPOINT', 'KEY_DOWNLOAD_WORKERS', 'KEY_POOL_SIZE',
+        'KEY_PARSE_WORKERS', 'KEY_DOWNLOAD_INCREMENTAL', 'KEY_CSV_COMPRESSION',
+        'KEY_CSV_ROTATE_ROWS', 'KEY_CSV_ROTATE_BYTES', 'KEY_CACHE_ENABLED',
+        'KEY_CACHE_TTL', 'KEY_CACHE_SIZE', 'KEY_CACHE_OFFLINE',
+        'KEY_MAIL_BATCH_SIZE', 'KEY_MAIL_WORKERS',
+        'DEFAULT_DOWNLOAD_WORKERS', 'DEFAULT_POOL_SIZE',
+        'DEFAULT_PARSE_WORKERS', 'DEFAULT_DOWNLOAD_INCREMENTAL',
+        'DEFAULT_CSV_COMPRESSION', 'DEFAULT_CSV_ROTATE_ROWS',
+        'DEFAULT_CSV_ROTATE_BYTES', 'DEFAULT_CACHE_ENABLED',
+        'DEFAULT_CACHE_TTL', 'DEFAULT_CACHE_SIZE', 'DEFAULT_CACHE_OFFLINE',
+        'DEFAULT_MAIL_BATCH_SIZE', 'DEFAULT_MAIL_WORKERS',
+        'CSV_COMPRESSIONS', 'Error', 'ConfigurationError', 'Settings',
+        'LazySettings', 'settings'),
+    'data': (
+        'RE_DIV_TAG', 'RE_HEADER_TAG', 'RE_PARA_TAG', 'RE_ARTICLE_TAG',
+        'RE_BLOCKQUOTE_TAG', 'RE_FIGCAPTION_TAG', 'RE_LI_TAG', 'RE_HR_TAG',
+        'RE_OTHER_TAG', 'RE_TAG', 'RE_SPACE_PUNCTUATION',
+        'RE_SPACE_EXCLAMATION', 'RE_END_CONTINUE', 'RE_END_DOTS',
+        'CLEAN_CACHE_SIZE', 'CLEAN_CACHE_MAX_LENGTH', 'TRUNCATE_LENGTH',
+        'TRUNCATE_MARKER', 'SEPARATOR', 'FIELDNAMES', 'CleanCounter',
+        'clean_counter', 'get_timezone', 'get_datetime_from_timestamp',
+        'get_date_from_timestamp', 'get_time_from_timestamp',
+        'get_iso_from_timestamp', 'get_timestamp_from_datetime', 'key_exists',
+        'get_opt_key', 'clean_text', 'get_clean_cache_stats',
+        'clear_clean_cache', 'remove_tags', 'remove_tags_sequential',
+        'truncate', 'parse_title', 'parse_author', 'parse_publisher',
+        'parse_url', 'parse_pub_date', 'parse_add_timestamp',
+        'parse_content_fields', 'parse_keywords', 'parse_annotations',
+        'parse_item', 'parse_items', 'TIMEZONE'),
+    'cache': (
+        'CACHE_EXTENSION', 'IGNORED_PARAMS', 'ResponseCache'),
+    'fetch': (
+        'API_URL', 'ENTRIES_BATCH_SIZE', 'MAX_COUNT_CONTENTS', 'MAX_COUNT_IDS',
+        'MIN_COUNT', 'PAGE_TARGET_SECONDS', 'PAGE_MAX_BYTES',
+        'REQUEST_TIMEOUT', 'RETRY_LIMIT', 'RETRY_BACKOFF', 'RETRY_BACKOFF_MAX',
+        'RETRY_STATUS_CODES', 'RATE_LIMIT_MAX_WAIT', 'TOKEN_REFRESH_MARGIN',
+        'TOKEN_EXPIRED_MESSAGE', 'HEADER_RATE_LIMIT_COUNT',
+        'HEADER_RATE_LIMIT_LIMIT', 'HEADER_RATE_LIMIT_RESET',
+        'HEADER_RETRY_AFTER', 'JSON_BACKENDS', 'RateLimiter', 'TimeoutAdapter',
+        'Client', 'Paginator', 'contents_paginator', 'ids_paginator',
+        'get_client', 'get_session', 'get_backoff', 'get_retry_after',
+        'is_token_expired', 'get_last_response_size', 'get_json_backend',
+        'set_json_backend', 'fetch_tag_ids', 'fetch_tag_entry_ids',
+        'fetch_entry', 'fetch_entries', 'fetch_tag_entries',
+        'fetch_access_token'),
+    'download': (
+        'CHECKPOINT_FILE', 'PAGE_BUFFER', 'PARSE_CHUNK_SIZE',
+        'PARSE_START_METHOD', 'ROW_GROUP_SIZE', 'LIST_FIELDS', 'GZIP_LEVEL',
+        'ZSTD_LEVEL', 'CSV_EXTENSIONS',
+        'download_entries', 'iter_entries', 'download_entries_df',
+        'download_entries_csv', 'download_entries_parquet',
+        'download_entries_arrow', 'get_arrow_schema', 'get_arrow_table',
+        'Checkpoint', 'EntryColumns', 'get_last_downloaded',
+        'set_last_downloaded', 'get_tag_timestamps', 'set_tag_timestamps',
+        'get_seen_ids', 'set_seen_ids', 'TIMESTAMP_FILE'),
+    'store': (
+        'DB_FILE', 'STORE_BATCH_SIZE', 'ARTICLE_FIELDS', 'TAG_ARTICLE_FIELDS',
+        'SCHEMA', 'UPSERT_ARTICLE', 'UPSERT_TAG', 'UPSERT_TAG_ARTICLE',
+        'ArticleStore', 'download_entries_store'),
+    'mail': (
+        'TEMPLATE_FILE_MAIL', 'TEMPLATE_FILE_TAG', 'TEMPLATE_FILE_ITEM',
+        'MAIL_BUFFER', 'EmailRenderer', 'get_template', 'get_users',
+        'get_articles', 'get_articles_by_user', 'get_emails_by_user',
+        'create_email_body', 'get_mailshot_data', 'get_mailshot_batches',
+        'send_mailshot', 'send_mailshot_batches', 'run_mailshot',
+        'TEMPLATE_PATH_MAIL',
+        'TEMPLATE_PATH_TAG', 'TEMPLATE_PATH_ITEM', 'TEMPLATE_MAIL',
+        'TEMPLATE_TAG', 'TEMPLATE_ITEM')}
+
+_EXPORT_MODULES = {name: module
+    for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_SUBMODULES) + list(_EXPORT_MODULES)
+
+# Lazy imports ----------------------------------------------------------------
+
+def __getattr__(name):
+
+    """Import a submodule, or the submodule which exports a name, on use."""
+
+    if name in _SUBMODULES:
+        return importlib.import_module('.{0}'.format(name), __name__)
+
+    if name in _EXPORT_MODULES:
+        module = importlib.import_module(
+            '.{0}'.format(_EXPORT_MODULES[name]), __name__)
+        return getattr(module, name)
+
+    raise AttributeError(
+        'module {0} has no attribute {1}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+import urllib
+import requests
+
+# Constants -------------------------------------------------------------------
+
+CACHE_EXTENSION = '.json'
+IGNORED_PARAMS = ('count',)
+
+# Response cache class --------------------------------------------------------
+
+class ResponseCache:
+
+    """
+    An on-disk cache of API responses. Each response is stored in its own
+    file in the cache directory, keyed by a hash of the request, along with
+    the time it was stored and any ETag and Last-Modified headers so that
+    stale responses can be revalidated with a conditional request.
+
+    Responses younger than ttl seconds are fresh. When the files in the
+    cache take up more than max_size bytes, the least recently used are
+    deleted. Use is recorded in each file's modification time, so the order
+    survives between runs. If offline is True, cached responses are replayed
+    however old they are and nothing is fetched from the API.
+
+    """
+
+    def __init__(self, directory, ttl, max_size, offline=False):
+
+        """
+        Initialise the cache in the given directory, creating it if it does
+        not exist, and index the responses already stored there.
+
+        """
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
+        # The index maps each file to its size and time of last use
+        self.index = {}
+        for entry in os.scandir(directory):
+            if entry.name.endswith(CACHE_EXTENSION):
+                stat = entry.stat()
+                self.index[entry.name] = (stat.st_size, stat.st_mtime)
+
+        self.size = sum(size for size, used in self.index.values())
+
+    def get_key(self, method, url, json_body=None):
+
+        """
+        Get the cache key for a request. The count parameter is left out of
+        the url, so pages fetched with a different page size share a key: a
+        cached page and its continuation are still a valid sequence of pages.
+        The json body of a POST request is part of the key.
+
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        params = [(name, value) for name, value in
+            urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+            if name not in IGNORED_PARAMS]
+
+        key = '{0} {1}'.format(method.upper(), urllib.parse.urlunsplit(
+            parts._replace(query=urllib.parse.urlencode(params))))
+
+        if json_body is not None:
+            key = '{0} {1}'.format(key, json.dumps(json_body, sort_keys=True))
+
+        return key
+
+    def get(self, key):
+
+        """
+        Get the cached entry for a key as a dict, or None if there is none.
+        The entry is marked as used.
+
+        """
+
+        filename = self._get_filename(key)
+        filepath = os.path.join(self.directory, filename)
+
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                entry = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if entry['key'] != key:
+            return None
+
+        self._touch(filename)
+        return entry
+
+    def is_fresh(self, entry):
+
+        """Check whether a cached entry is younger than the ttl."""
+
+        return time.time() - entry['stored'] < self.ttl
+
+    def put(self, key, response):
+
+        """
+        Store a response under the given key, evicting the least recently
+        used responses if the cache is over its maximum size.
+
+        """
+
+        entry = {
+            'key': key,
+            'stored': time.time(),
+            'status_code': response.status_code,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'text': response.content.decode('utf-8', errors='replace')}
+
+        self._write(key, entry)
+
+    def refresh(self, key, entry):
+
+        """
+        Mark a cached entry as fresh again after the API has confirmed it is
+        not modified.
+
+        """
+
+        entry['stored'] = time.time()
+        self._write(key, entry)
+
+        with self.lock:
+            self.revalidated += 1
+
+    def get_conditional_headers(self, entry):
+
+        """
+        Get the headers for a conditional request which revalidates a cached
+        entry, from its ETag and Last-Modified headers.
+
+        """
+
+        headers = {}
+
+        if entry.get('etag') is not None:
+            headers['If-None-Match'] = entry['etag']
+
+        if entry.get('last_modified') is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def get_response(self, entry):
+
+        """Get a requests.Response which replays a cached entry."""
+
+        response = requests.models.Response()
+        response.status_code = entry['status_code']
+        response.encoding = 'utf-8'
+        response._content = entry['text'].encode('utf-8')
+        response.headers['Content-Type'] = 'application/json'
+
+        if entry.get('etag') is not None:
+            response.headers['ETag'] = entry['etag']
+
+        if entry.get('last_modified') is not None:
+            response.headers['Last-Modified'] = entry['last_modified']
+
+        return response
+
+    def count(self, hit):
+
+        """Count a request served from the cache, or one which was not."""
+
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self):
+
+        """
+        Get a dict of cache statistics: the number of responses and bytes
+        stored, the requests served from the cache and not, and the number
+        of stale responses revalidated with the API.
+
+        """
+
+        with self.lock:
+            return {
+                'responses': len(self.index),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated}
+
+    def clear(self):
+
+        """Delete every cached response."""
+
+        with self.lock:
+            for filename in list(self.index):
+                self._remove(filename)
+
+    def _get_filename(self, key):
+
+        """Get the name of the file which stores the entry for a key."""
+
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return '{0}{1}'.format(digest, CACHE_EXTENSION)
+
+    def _write(self, key, entry):
+
+        """
+        Write an entry to its file, replacing any previous entry in one step,
+        then evict responses until the cache fits its maximum size.
+
+        """
+
+        filename = self._get_filename(key)
+        filepath = os.path.join(self.directory, filename)
+        content = json.dumps(entry).encode('utf-8')
+        temp_path = '{0}.{1}.tmp'.format(filepath, threading.get_ident())
+
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+
+        os.replace(temp_path, filepath)
+
+        with self.lock:
+
+            if filename in self.index:
+                self.size -= self.index[filename][0]
+
+            self.index[filename] = (len(content), time.time())
+            self.size += len(content)
+
+            if self.size > self.max_size:
+                used = sorted(self.index, key=lambda f: self.index[f][1])
+                for old_filename in used:
+                    if self.size <= self.max_size:
+                        break
+                    self._remove(old_filename)
+
+    def _touch(self, filename):
+
+        """Record that the file for an entry has just been used."""
+
+        now = time.time()
+
+        try:
+            os.utime(os.path.join(self.directory, filename), (now, now))
+        except FileNotFoundError:
+            return
+
+        with self.lock:
+            if filename in self.index:
+                self.index[filename] = (self.index[filename][0], now)
+
+    def _remove(self, filename):
+
+        """Delete the file for an entry. The lock must be held."""
+
+        size, used = self.index.pop(filename)
+        self.size -= size
+
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
@@ -5,6 +5,7 @@
 import json
 import os
 import sys
+import threading
 
 # Constants -------------------------------------------------------------------
 
@@ -14,10 +15,14 @@ DIR_TEMPLATE = 'templates'
 DIR_CONFIG = 'config'
 DIR_TIMESTAMP = 'timestamp'
 DIR_RECIPIENT = 'recipients'
+DIR_STATE = 'state'
+DIR_CACHE = 'cache'
 
 FILE_CONFIG = 'config.json'
 FILE_TIMESTAMP = 'timestamp.txt'
+FILE_TAG_TIMESTAMPS = 'tags.json'
 FILE_RECIPIENT = 'recipients.json'
+FILE_SEEN_IDS = 'seen_ids.json'
 
 KEY_TIMEZONE = 'timezone'
 KEY_ENTERPRISE = 'enterprise'
@@ -26,6 +31,35 @@ KEY_DOWNLOAD_PREFIX = 'download_prefix'
 KEY_ACCESS_TOKEN = 'access_token'
 KEY_REFRESH_TOKEN = 'refresh_token'
 KEY_MAILER_ENDPOINT = 'mailer_endpoint'
+KEY_DOWNLOAD_WORKERS = 'download_workers'
+KEY_POOL_SIZE = 'pool_size'
+KEY_PARSE_WORKERS = 'parse_workers'
+KEY_DOWNLOAD_INCREMENTAL = 'download_incremental'
+KEY_CSV_COMPRESSION = 'csv_compression'
+KEY_CSV_ROTATE_ROWS = 'csv_rotate_rows'
+KEY_CSV_ROTATE_BYTES = 'csv_rotate_bytes'
+KEY_CACHE_ENABLED = 'cache_enabled'
+KEY_CACHE_TTL = 'cache_ttl'
+KEY_CACHE_SIZE = 'cache_size'
+KEY_CACHE_OFFLINE = 'cache_offline'
+KEY_MAIL_BATCH_SIZE = 'mail_batch_size'
+KEY_MAIL_WORKERS = 'mail_workers'
+
+DEFAULT_DOWNLOAD_WORKERS = 1
+DEFAULT_POOL_SIZE = 10
+DEFAULT_PARSE_WORKERS = 1
+DEFAULT_DOWNLOAD_INCREMENTAL = False
+DEFAULT_CSV_COMPRESSION = 'none'
+DEFAULT_CSV_ROTATE_ROWS = 0
+DEFAULT_CSV_ROTATE_BYTES = 0
+DEFAULT_CACHE_ENABLED = False
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+DEFAULT_CACHE_OFFLINE = False
+DEFAULT_MAIL_BATCH_SIZE = 100
+DEFAULT_MAIL_WORKERS = 4
+
+CSV_COMPRESSIONS = ('none', 'gzip', 'zstd')
 
 # Exceptions ------------------------------------------------------------------
 
@@ -56,9 +90,14 @@ class Settings:
         self.config_dir = os.path.join(self.app_dir, DIR_CONFIG)
         self.timestamp_dir = os.path.join(self.app_dir, DIR_TIMESTAMP)
         self.recipient_dir = os.path.join(self.app_dir, DIR_RECIPIENT)
+        self.state_dir = os.path.join(self.app_dir, DIR_STATE)
+        self.cache_dir = os.path.join(self.app_dir, DIR_CACHE)
         self.config_file = os.path.join(self.config_dir, FILE_CONFIG)
         self.timestamp_file = os.path.join(self.timestamp_dir, FILE_TIMESTAMP)
+        self.tag_timestamps_file = os.path.join(
+            self.timestamp_dir, FILE_TAG_TIMESTAMPS)
         self.recipient_file = os.path.join(self.recipient_dir, FILE_RECIPIENT)
+        self.seen_ids_file = os.path.join(self.state_dir, FILE_SEEN_IDS)
 
         try:
             conf = json.loads(open(self.config_file).read())
@@ -113,6 +152,47 @@ class Settings:
                     'No mailer_endpoint key defined in {0}'.format(
                         self.config_file))
 
+            # Optional settings fall back to their defaults if missing
+            self.download_workers = self._get_positive_int(
+                conf, KEY_DOWNLOAD_WORKERS, DEFAULT_DOWNLOAD_WORKERS)
+
+            self.pool_size = self._get_positive_int(
+                conf, KEY_POOL_SIZE, DEFAULT_POOL_SIZE)
+
+            self.parse_workers = self._get_positive_int(
+                conf, KEY_PARSE_WORKERS, DEFAULT_PARSE_WORKERS)
+
+            self.download_incremental = self._get_bool(
+                conf, KEY_DOWNLOAD_INCREMENTAL, DEFAULT_DOWNLOAD_INCREMENTAL)
+
+            self.csv_compression = self._get_choice(
+                conf, KEY_CSV_COMPRESSION, DEFAULT_CSV_COMPRESSION,
+                CSV_COMPRESSIONS)
+
+            self.csv_rotate_rows = self._get_non_negative_int(
+                conf, KEY_CSV_ROTATE_ROWS, DEFAULT_CSV_ROTATE_ROWS)
+
+            self.csv_rotate_bytes = self._get_non_negative_int(
+                conf, KEY_CSV_ROTATE_BYTES, DEFAULT_CSV_ROTATE_BYTES)
+
+            self.cache_enabled = self._get_bool(
+                conf, KEY_CACHE_ENABLED, DEFAULT_CACHE_ENABLED)
+
+            self.cache_ttl = self._get_positive_int(
+                conf, KEY_CACHE_TTL, DEFAULT_CACHE_TTL)
+
+            self.cache_size = self._get_positive_int(
+                conf, KEY_CACHE_SIZE, DEFAULT_CACHE_SIZE)
+
+            self.cache_offline = self._get_bool(
+                conf, KEY_CACHE_OFFLINE, DEFAULT_CACHE_OFFLINE)
+
+            self.mail_batch_size = self._get_positive_int(
+                conf, KEY_MAIL_BATCH_SIZE, DEFAULT_MAIL_BATCH_SIZE)
+
+            self.mail_workers = self._get_positive_int(
+                conf, KEY_MAIL_WORKERS, DEFAULT_MAIL_WORKERS)
+
         except FileNotFoundError as e:
             raise ConfigurationError(
                 'Could not find the configuration file: {0}'.format(
@@ -123,6 +203,74 @@ class Settings:
                 'Could not parse the configuration file: {0} \n{1}'.format(
                     self.config_file, e.msg))
 
+    def _get_positive_int(self, conf, key, default):
+
+        """
+        Get an optional positive integer setting from the config, or the
+        default if the key is missing.
+
+        """
+
+        value = conf.get(key, default)
+
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ConfigurationError(
+                '{0} must be a positive integer in {1}'.format(
+                    key, self.config_file))
+
+        return value
+
+    def _get_non_negative_int(self, conf, key, default):
+
+        """
+        Get an optional integer setting which may be zero from the config, or
+        the default if the key is missing.
+
+        """
+
+        value = conf.get(key, default)
+
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ConfigurationError(
+                '{0} must be zero or a positive integer in {1}'.format(
+                    key, self.config_file))
+
+        return value
+
+    def _get_choice(self, conf, key, default, choices):
+
+        """
+        Get an optional setting which must be one of the given choices from
+        the config, or the default if the key is missing.
+
+        """
+
+        value = conf.get(key, default)
+
+        if value not in choices:
+            raise ConfigurationError(
+                '{0} must be one of {1} in {2}'.format(
+                    key, ', '.join(choices), self.config_file))
+
+        return value
+
+    def _get_bool(self, conf, key, default):
+
+        """
+        Get an optional boolean setting from the config, or the default if
+        the key is missing.
+
+        """
+
+        value = conf.get(key, default)
+
+        if not isinstance(value, bool):
+            raise ConfigurationError(
+                '{0} must be true or false in {1}'.format(
+                    key, self.config_file))
+
+        return value
+
     def save(self):
 
         """Save the settings to the config file."""
@@ -135,14 +283,80 @@ class Settings:
         conf[KEY_ACCESS_TOKEN] = self.access_token
         conf[KEY_REFRESH_TOKEN] = self.refresh_token
         conf[KEY_MAILER_ENDPOINT] = self.mailer_endpoint
+        conf[KEY_DOWNLOAD_WORKERS] = self.download_workers
+        conf[KEY_POOL_SIZE] = self.pool_size
+        conf[KEY_PARSE_WORKERS] = self.parse_workers
+        conf[KEY_DOWNLOAD_INCREMENTAL] = self.download_incremental
+        conf[KEY_CSV_COMPRESSION] = self.csv_compression
+        conf[KEY_CSV_ROTATE_ROWS] = self.csv_rotate_rows
+        conf[KEY_CSV_ROTATE_BYTES] = self.csv_rotate_bytes
+        conf[KEY_CACHE_ENABLED] = self.cache_enabled
+        conf[KEY_CACHE_TTL] = self.cache_ttl
+        conf[KEY_CACHE_SIZE] = self.cache_size
+        conf[KEY_CACHE_OFFLINE] = self.cache_offline
+        conf[KEY_MAIL_BATCH_SIZE] = self.mail_batch_size
+        conf[KEY_MAIL_WORKERS] = self.mail_workers
 
         with open(self.config_file, 'w') as f:
             f.write(json.dumps(conf, indent=0, sort_keys=False))
 
 
+# Lazy settings class ---------------------------------------------------------
+
+class LazySettings:
+
+    """
+    A proxy for the settings which reads the config file the first time a
+    setting is used rather than when the package is imported, so importing
+    feedstream is cheap and does not fail without a config file. Setting or
+    deleting an attribute on the proxy sets or deletes it on the settings.
+
+    """
+
+    def __init__(self, app_dir):
+
+        """Initialise the proxy for the settings in the given directory."""
+
+        object.__setattr__(self, '_app_dir', app_dir)
+        object.__setattr__(self, '_settings', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def __getattr__(self, name):
+        return getattr(self._get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_settings(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._get_settings(), name)
+
+    def is_loaded(self):
+
+        """Check whether the config file has been read."""
+
+        return self._settings is not None
+
+    def _get_settings(self):
+
+        """
+        Get the settings, reading the config file if it has not been read.
+        A configuration error exits with its message, as it did when the
+        settings were read on import.
+
+        """
+
+        if self._settings is not None:
+            return self._settings
+
+        with self._lock:
+            if self._settings is None:
+                try:
+                    object.__setattr__(
+                        self, '_settings', Settings(self._app_dir))
+                except ConfigurationError as e:
+                    sys.exit('Configuration error: {0}'.format(e.msg))
+            return self._settings
+
 # Inititalise settings --------------------------------------------------------
 
-try:
-    settings = Settings(DIR_APP)
-except ConfigurationError as e:
-    sys.exit('Configuration error: {0}'.format(e.msg))
+settings = LazySettings(DIR_APP)
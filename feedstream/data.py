@@ -3,6 +3,7 @@
 # Imports ---------------------------------------------------------------------
 
 import datetime
+import functools
 import html
 import pytz
 import re
@@ -19,14 +20,17 @@ RE_FIGCAPTION_TAG = re.compile(r'<figcaption\s*[^>]*?>')
 RE_LI_TAG = re.compile(r'<li\s*[^>]*?>')
 RE_HR_TAG = re.compile(r'<hr\s*[^>]*?>')
 RE_OTHER_TAG = re.compile(r'<[^>]+?>')
-RE_WHITESPACE = re.compile(r'\s+')
-RE_WHITESPACE_PUNCTUATION = re.compile(r'\s([?,;:.)}\]"](?:\s|$))')
-RE_WHITESPACE_EXCLAMATION = re.compile(r'\s(!+(?:\s|$))')
+RE_TAG = re.compile(
+    r'<(?:(div|h\d|p|article|blockquote|figcaption|li|hr)[^<>]*>'
+    r'|[^<>]+>|)')
+RE_SPACE_PUNCTUATION = re.compile(r' ([?,;:.)}\]"](?: |$))')
+RE_SPACE_EXCLAMATION = re.compile(r' (!+(?: |$))')
 RE_END_CONTINUE = re.compile(' Continue reading\.\.\.\s*$')
 RE_END_DOTS = re.compile('\.\.\.\s*$')
+CLEAN_CACHE_SIZE = 8192
+CLEAN_CACHE_MAX_LENGTH = 256
 TRUNCATE_LENGTH = 300
 TRUNCATE_MARKER = '...'
-TIMEZONE = pytz.timezone(settings.timezone)
 SEPARATOR = '<sep>'
 FIELDNAMES = [
     'tag_id',
@@ -47,36 +51,126 @@ FIELDNAMES = [
     'highlights',
     'article_id']
 
+# Lazy attributes -------------------------------------------------------------
+
+def __getattr__(name):
+
+    """
+    Get the TIMEZONE constant from the settings, which are not read until it
+    is first used.
+
+    """
+
+    if name == 'TIMEZONE':
+        return get_timezone()
+
+    raise AttributeError(
+        'module {0} has no attribute {1}'.format(__name__, name))
+
+# Profiling -------------------------------------------------------------------
+
+class CleanCounter:
+
+    """
+    Counts the items parsed, and the texts and characters of text actually
+    cleaned rather than served from the cache, so that the cost of cleaning
+    per item can be monitored for regressions. Counts are kept per process
+    and are not locked, so they are approximate if items are parsed in
+    several threads at once.
+
+    """
+
+    def __init__(self):
+
+        """Initialise the counts to zero."""
+
+        self.reset()
+
+    def reset(self):
+
+        """Reset the counts to zero."""
+
+        self.items = 0
+        self.calls = 0
+        self.chars = 0
+
+    def get_stats(self):
+
+        """
+        Get a dict of the counts, and the calls and characters cleaned per
+        item parsed.
+
+        """
+
+        items = max(self.items, 1)
+
+        return {
+            'items': self.items,
+            'calls': self.calls,
+            'chars': self.chars,
+            'calls_per_item': self.calls / items,
+            'chars_per_item': self.chars / items}
+
+
+clean_counter = CleanCounter()
+
 # Timestamp functions ---------------------------------------------------------
 
-def get_datetime_from_timestamp(ts_ms, tz=TIMEZONE):
+def get_timezone():
+
+    """Get the timezone in the settings, which timestamps are converted to."""
+
+    return _get_timezone(settings.timezone)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_timezone(name):
+
+    """Get the pytz timezone with the given name."""
+
+    return pytz.timezone(name)
+
+
+def get_datetime_from_timestamp(ts_ms, tz=None):
 
     """Get Feedly timestamp as a datetime.datetime."""
 
+    if tz is None:
+        tz = get_timezone()
+
     ts_secs = int(ts_ms / 1000)
     return datetime.datetime.fromtimestamp(ts_secs, tz=tz)
 
 
-def get_date_from_timestamp(ts_ms, tz=TIMEZONE):
+def get_date_from_timestamp(ts_ms, tz=None):
 
     """Get Feedly timestamp as a date."""
 
+    if tz is None:
+        tz = get_timezone()
+
     ts_secs = ts_ms / 1000
     return datetime.datetime.fromtimestamp(ts_secs, tz=tz).date()
 
 
-def get_time_from_timestamp(ts_ms, tz=TIMEZONE):
+def get_time_from_timestamp(ts_ms, tz=None):
 
     """Get Feedly timestamp as a time."""
 
+    if tz is None:
+        tz = get_timezone()
+
     ts_secs = ts_ms / 1000
     return datetime.datetime.fromtimestamp(ts_secs, tz=tz).time()
 
 
-def get_iso_from_timestamp(ts_ms, tz=TIMEZONE):
+def get_iso_from_timestamp(ts_ms, tz=None):
 
     """Get Feedly timestamp as an ISO format string."""
 
+    if tz is None:
+        tz = get_timezone()
+
     ts_secs = ts_ms / 1000
     return datetime.datetime.fromtimestamp(ts_secs, tz=tz).isoformat()
 
@@ -130,12 +224,130 @@ def clean_text(text):
     spaces and then multiple whitespace characters are replaced by a single
     space. Whitespace before puncuation is then removed, followed by any
     continue reading markers. Any leading or trailing whitespace is stripped.
+    Short texts such as titles, tag labels and publisher names recur often,
+    so texts up to CLEAN_CACHE_MAX_LENGTH characters long are cleaned through
+    a least recently used cache of CLEAN_CACHE_SIZE entries.
 
     """
 
+    if len(text) <= CLEAN_CACHE_MAX_LENGTH:
+        return _clean_text_cached(text)
+
+    return _clean_text(text)
+
+
+def _clean_text(text):
+
+    """Clean html text without caching the result."""
+
+    clean_counter.calls += 1
+    clean_counter.chars += len(text)
+
     # Unescape html entities
     text = html.unescape(text)
 
+    # Replace block level elements with a space and remove all other tags
+    if '<' in text:
+        text = remove_tags(text)
+
+    # Replace multiple whitespace characters with a single space, keeping
+    # any leading space as the punctuation rules below depend on it
+    words = ' '.join(text.split())
+    if text[:1].isspace():
+        words = ' ' + words
+    text = words
+
+    # Remove whitespace before punctuation: the only whitespace left is a
+    # single space, which the regex engine can scan for much faster than \s
+    text = re.sub(RE_SPACE_PUNCTUATION, r'\1', text)
+    text = re.sub(RE_SPACE_EXCLAMATION, r'\1', text)
+
+    # Strip any leading or trailing whitespace and return
+    return text.strip()
+
+
+_clean_text_cached = functools.lru_cache(maxsize=CLEAN_CACHE_SIZE)(_clean_text)
+
+
+def get_clean_cache_stats():
+
+    """
+    Get a dict of statistics for the cache of cleaned short texts: the number
+    of hits and misses, and the current and maximum number of entries.
+
+    """
+
+    info = _clean_text_cached.cache_info()
+
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize}
+
+
+def clear_clean_cache():
+
+    """Clear the cache of cleaned short texts and its statistics."""
+
+    _clean_text_cached.cache_clear()
+
+
+def remove_tags(text):
+
+    """
+    Replace opening block level elements with a single space and remove all
+    other tags completely in a single scan of the text. If the text contains
+    a '<' which would make the tag patterns overlap, the result is instead
+    computed with remove_tags_sequential, which defines the expected output.
+
+    """
+
+    try:
+        return re.sub(RE_TAG, _replace_tag, text)
+    except _OverlappingTag:
+        return remove_tags_sequential(text)
+
+
+def _replace_tag(match):
+
+    """
+    Get the replacement for a match of RE_TAG. Every match starts at a '<':
+    group 1 is set for block level elements, and an empty match means the
+    '<' does not open a tag. Such a '<' is kept if it is followed directly by
+    '>', or by no '>' at all, as no tag pattern can match it. Any other '<'
+    raises an _OverlappingTag exception.
+
+    """
+
+    if match.group(1) is not None:
+        return ' '
+
+    end = match.end()
+    if end - match.start() > 1:
+        return ''
+
+    text = match.string
+    if text.startswith('>', end) or text.find('>', end) == -1:
+        return '<'
+
+    raise _OverlappingTag()
+
+
+class _OverlappingTag(Exception):
+
+    """Raised when text cannot be cleaned in a single scan."""
+    pass
+
+
+def remove_tags_sequential(text):
+
+    """
+    Replace opening block level elements with a single space and remove all
+    other tags completely, using a separate pass for each kind of tag.
+
+    """
+
     # Replace opening block level elements with a single space
     text = re.sub(RE_DIV_TAG, ' ', text)
     text = re.sub(RE_HEADER_TAG, ' ', text)
@@ -147,17 +359,7 @@ def clean_text(text):
     text = re.sub(RE_HR_TAG, ' ', text)
 
     # Remove all other tags completely
-    text = re.sub(RE_OTHER_TAG, '', text)
-
-    # Replace multiple whitespace characters with a single space
-    text = re.sub(RE_WHITESPACE, ' ', text)
-
-    # Remove whitespace before punctuation
-    text = re.sub(RE_WHITESPACE_PUNCTUATION, r'\1', text)
-    text = re.sub(RE_WHITESPACE_EXCLAMATION, r'\1', text)
-
-    # Strip any leading or trailing whitespace and return
-    return text.strip()
+    return re.sub(RE_OTHER_TAG, '', text)
 
 
 def truncate(text, length, marker=None):
@@ -271,27 +473,20 @@ def parse_content_fields(item):
     full_content = get_opt_key(item, 'fullContent')
     summary = get_opt_key(item, 'summary', 'content')
 
-    if full_content is not None and len(clean_text(full_content)) != 0:
+    # Clean each field once, treating fields which clean to nothing as missing
+    if full_content is not None:
+        full_content = clean_text(full_content) or None
+
+    if summary is not None:
+        summary = clean_text(summary) or None
 
-        full_content = clean_text(full_content)
+    if full_content is not None:
         short_content = truncate(full_content,
             TRUNCATE_LENGTH, marker=TRUNCATE_MARKER)
 
-        if summary is not None and len(clean_text(summary)) != 0:
-            summary = clean_text(summary)
-        else:
-            summary = None
-
-    else:
-
-        full_content = None
-        if summary is not None and len(clean_text(summary)) != 0:
-            summary = clean_text(summary)
-            short_content = truncate(summary,
-                TRUNCATE_LENGTH, marker=TRUNCATE_MARKER)
-        else:
-            summary = None
-            short_content = None
+    elif summary is not None:
+        short_content = truncate(summary,
+            TRUNCATE_LENGTH, marker=TRUNCATE_MARKER)
 
     return (short_content, full_content, summary)
 
@@ -354,6 +549,8 @@ def parse_item(tag_id, tag_label, item, flatten=False):
 
     """
 
+    clean_counter.items += 1
+
     entry = {}
     entry['tag_id'] = tag_id
     entry['tag_label'] = clean_text(tag_label)
@@ -393,3 +590,15 @@ def parse_item(tag_id, tag_label, item, flatten=False):
         entry['highlights'] = SEPARATOR.join(entry['highlights'])
 
     return entry
+
+
+def parse_items(tag_id, tag_label, items, flatten=False):
+
+    """
+    Parse a list of entry items returned from the API for the given tag and
+    return a list of the parsed items. This is a top level function so that
+    chunks of items can be sent to other processes to be parsed.
+
+    """
+
+    return [parse_item(tag_id, tag_label, item, flatten) for item in items]
@@ -2,85 +2,101 @@
 
 # Imports ---------------------------------------------------------------------
 
+import array
+import collections
+import concurrent.futures
 import csv
 import datetime
+import functools
+import gzip
+import io
+import json
+import multiprocessing
 import os
-import pandas
 import pathlib
+import queue
+import threading
 import feedstream.data as data
 import feedstream.exceptions as exceptions
 import feedstream.fetch as fetch
 from feedstream.config import settings
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Constants -------------------------------------------------------------------
 
-TIMESTAMP_FILE = os.path.join(settings.timestamp_file)
+CHECKPOINT_FILE = 'checkpoint.json'
+PAGE_BUFFER = 2
+PARSE_CHUNK_SIZE = 50
+PARSE_START_METHOD = 'spawn'
+ROW_GROUP_SIZE = 10000
+LIST_FIELDS = ('keywords', 'comments', 'highlights')
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
 
-# Download functions ----------------------------------------------------------
+CSV_EXTENSIONS = {
+    'none': 'csv',
+    'gzip': 'csv.gz',
+    'zstd': 'csv.zst'}
 
-def download_entries(flatten=False):
+_END_OF_TAG = object()
 
-    """
-    Download entries for each tag and return a dict of the parsed items. If the
-    API token is expired at any point, refresh the token and retry.
+# Lazy attributes -------------------------------------------------------------
+
+def __getattr__(name):
 
     """
+    Get the attributes which are loaded on first use: TIMESTAMP_FILE, which
+    is read from the settings, and the pyarrow module, which is None if
+    pyarrow is not installed.
 
-    try:
-        return _download_entries(flatten)
-    except exceptions.ApiError as e:
-        if e.status_code == 401 and e.api_msg.startswith("token expired") :
-            if settings.enterprise:
-                fetch.fetch_access_token()
-                return _download_entries(flatten)
-            else:
-                raise
-        else:
-            raise
+    """
 
+    if name == 'TIMESTAMP_FILE':
+        return settings.timestamp_file
 
-def _download_entries(flatten):
+    if name == 'pyarrow':
+        return _import_pyarrow()
 
-    """Download entries for each tag and return a dict of the parsed items."""
+    raise AttributeError(
+        'module {0} has no attribute {1}'.format(__name__, name))
 
-    items = []
-    since = get_last_downloaded() if settings.download_new else None
-    downloaded = data.get_timestamp_from_datetime(datetime.datetime.now())
-    tag_ids = fetch.fetch_tag_ids()
 
-    # Fetch the articles for each tag, including any continuations
-    for tag in tag_ids:
+@functools.lru_cache(maxsize=None)
+def _import_pyarrow():
 
-        continuation = None
+    """
+    Import pyarrow with its ipc and parquet modules the first time a Parquet
+    or Arrow file is written, as it is slow to import. Returns None if
+    pyarrow is not installed.
 
-        while True:
+    """
 
-            contents = fetch.fetch_tag_entries(tag['id'],
-                since=since, continuation=continuation)
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
 
-            for item in contents['items']:
+    return pyarrow
 
-                # Check the tag data looks sane: accessing an enterprise
-                # account with settings.enterprise set to false causes problems
-                if not data.key_exists(tag, 'id') or \
-                    not data.key_exists(tag, 'label'):
+# Download functions ----------------------------------------------------------
 
-                    raise exceptions.UnexpectedDataError(
-                        'missing fields in tag data: are you accessing an '
-                        'enterprise account without declaring it in your '
-                        'config file?')
+def download_entries(flatten=False):
 
-                item = data.parse_item(
-                    tag['id'],
-                    tag['label'],
-                    item,
-                    flatten)
+    """
+    Download entries for each tag and return a dict of the parsed items. If the
+    API token expires during the download, the fetch client refreshes it and
+    retries the failed request, so the download carries on where it was.
 
-                items.append(item)
+    """
 
-            continuation = data.get_opt_key(contents, 'continuation')
-            if continuation is None:
-                break
+    downloaded = data.get_timestamp_from_datetime(datetime.datetime.now())
+    items = list(iter_entries(flatten, _load_seen_ids()))
 
     entries = {
         'timestamp': downloaded,
@@ -90,54 +106,984 @@ def _download_entries(flatten):
     return entries
 
 
+def iter_entries(flatten=False, seen=None, since=None):
+
+    """
+    Download entries for each tag and yield the parsed items one page at a
+    time as the pages arrive, so that only the pages currently being
+    downloaded are held in memory. Items are yielded in tag order whether the
+    tags are downloaded sequentially or concurrently, and whether the items
+    are parsed in this process or in a pool of parse workers.
+
+    If seen is given, it should be a dict of the sets of entry ids already
+    downloaded for each tag id, as returned by get_seen_ids. The entries are
+    then downloaded incrementally: only entries with new ids are downloaded
+    in full, and seen is updated in place with the ids found for each tag.
+
+    If since is given, it should be a dict of the timestamp to download
+    entries from for each tag id, and tags which are not in it are
+    downloaded in full. Otherwise the timestamps are those recorded by the
+    file downloads, as returned by _get_since.
+
+    """
+
+    tag_ids = fetch.fetch_tag_ids()
+
+    if since is None:
+        since = _get_since(tag_ids)
+
+    pages = _iter_entry_pages(flatten, tag_ids, since, seen)
+
+    for tag, contents, items in pages:
+        yield from items
+
+
+def _iter_entry_pages(flatten, tag_ids, since, seen=None, resume=None):
+
+    """
+    Download entries for the given tags and yield a tuple of the tag, the
+    contents and the parsed items of each page. The since argument is a dict
+    of the timestamp to download entries from for each tag id, as returned
+    by _get_since. If resume is given, it should be a dict of the download
+    state of each tag id from a Checkpoint: tags which are done are skipped,
+    and tags which are part downloaded start from their last continuation.
+
+    """
+
+    # Forget the ids of tags which no longer exist
+    if seen is not None:
+        current = set(data.get_opt_key(tag, 'id') for tag in tag_ids)
+        for tag_id in set(seen) - current:
+            del seen[tag_id]
+
+    if resume is not None:
+        tag_ids = [tag for tag in tag_ids if not resume.get(
+            data.get_opt_key(tag, 'id'), {}).get('done', False)]
+
+    pages = _iter_pages(tag_ids, since, seen, resume)
+    yield from _iter_parsed(pages, flatten)
+
+
 def download_entries_df():
 
     """
     Download entries for each tag and return a dataframe of the items. Nested
     fields are flattened into a single field with items separated using the
     separator string defined in the data module. The function returns a tuple
-    containing the timestamp of the download and the dataframe itself.
+    containing the timestamp of the download and the dataframe itself. The
+    items are accumulated in an EntryColumns as they arrive, so the dataframe
+    is built from typed columns rather than a list of dicts.
 
     """
 
-    entries = download_entries(flatten=True)
-    timestamp = entries['timestamp']
-    df = pandas.DataFrame(entries['items'])
-    return (timestamp, df)
+    downloaded = data.get_timestamp_from_datetime(datetime.datetime.now())
+    columns = _download_columns()
+    return (downloaded, columns.to_dataframe())
+
+
+def _download_columns():
+
+    """Download entries and return them as an EntryColumns."""
+
+    columns = EntryColumns()
+    for item in iter_entries(flatten=True, seen=_load_seen_ids()):
+        columns.append(item)
+    return columns
 
 
 def download_entries_csv():
 
-    """Download entries to a csv"""
+    """
+    Download entries to a csv. Rows are written as each page of entries
+    arrives rather than after the download has finished. The timestamp of
+    the newest entry in each tag is recorded as soon as the tag is done, so
+    a download which fails is not repeated for the tags it finished. Once
+    the csv is written the download timestamp is recorded, along with the
+    entry ids for each tag if downloads are incremental.
+
+    The csv is compressed with gzip or zstd if the csv_compression setting
+    says so. Each page is compressed as a separate gzip member or zstd frame
+    appended to the file, which standard tools read as one stream. If the
+    csv_rotate_rows or csv_rotate_bytes settings are not zero, a new file is
+    started, with its own header, once the current file has that many rows
+    or bytes. The first file has the returned filename and later files are
+    numbered from 2, as in feedly-2019-01-01-10-00-00-2.csv.
+
+    After each page is written a checkpoint is saved in the data directory.
+    If a download fails, the next call resumes it: the csv is truncated to
+    the last page recorded in the checkpoint and the download continues from
+    that page. The checkpoint is removed once the download is complete.
+
+    """
+
+    pathlib.Path(settings.data_dir).mkdir(exist_ok=True)
+    checkpoint_path = os.path.join(settings.data_dir, CHECKPOINT_FILE)
+    checkpoint = Checkpoint.load(checkpoint_path)
+
+    if checkpoint is None or not os.path.exists(
+        os.path.join(settings.data_dir, checkpoint.get_part_filename())):
+
+        downloaded = data.get_timestamp_from_datetime(datetime.datetime.now())
+        compression = settings.csv_compression
+
+        filename = _get_download_filename(downloaded,
+            CSV_EXTENSIONS[compression])
+        checkpoint = Checkpoint(checkpoint_path, filename, downloaded)
+        checkpoint.compression = compression
+
+    seen = _write_entries_csv(checkpoint)
+    set_last_downloaded(checkpoint.downloaded)
+    set_tag_timestamps(checkpoint.get_tag_timestamps())
+
+    if seen is not None:
+        set_seen_ids(seen)
+
+    checkpoint.delete()
+    return checkpoint.filename
+
+
+def _write_entries_csv(checkpoint):
+
+    """
+    Download entries and write them to the csv files of the checkpoint in the
+    data directory, saving the checkpoint after each page. If the checkpoint
+    has a file offset the current file is truncated to it and the download
+    resumes from the checkpoint. If downloads are incremental, the ids of
+    each tag are saved with the seen ids once the tag is done and dropped
+    from the checkpoint, so the checkpoint only holds the ids of the tags
+    in progress. Returns the updated seen ids if downloads are incremental,
+    or None otherwise.
+
+    """
+
+    seen = _load_seen_ids()
+    tag_ids = fetch.fetch_tag_ids()
+    compress = _get_compressor(checkpoint.compression)
+
+    # The timestamps of tags which are done are recorded before the download
+    # is complete, so a resumed download keeps the timestamps it started with
+    since = _get_since(tag_ids)
+    since.update(checkpoint.since)
+    checkpoint.since = since
+
+    if seen is not None:
+        checkpoint.restore_seen_ids(seen)
+        saved_seen = dict(seen)
+
+    if checkpoint.offset is None:
+        csvfile = _start_csv_part(checkpoint, compress)
+    else:
+        filepath = os.path.join(settings.data_dir,
+            checkpoint.get_part_filename())
+        os.truncate(filepath, checkpoint.offset)
+        csvfile = open(filepath, 'ab')
+
+    try:
+
+        pages = _iter_entry_pages(True, tag_ids, checkpoint.since, seen,
+            checkpoint.tags)
+
+        for tag, contents, items in pages:
+
+            if _is_part_full(checkpoint):
+                csvfile.close()
+                checkpoint.part += 1
+                csvfile = _start_csv_part(checkpoint, compress)
+
+            csvfile.write(compress(_get_csv_bytes(items)))
+            csvfile.flush()
+            checkpoint.part_items += len(items)
+            checkpoint.record_page(tag['id'], contents, items,
+                csvfile.tell())
+            checkpoint.save()
+
+            if not checkpoint.tags[tag['id']]['done']:
+                continue
+
+            # The seen ids being downloaded can include tags whose pages are
+            # not written yet, so only the ids of finished tags are saved
+            if seen is not None:
+                checkpoint.restore_seen_ids(saved_seen)
+                set_seen_ids(saved_seen)
+                checkpoint.drop_seen_ids()
+                checkpoint.save()
+
+            set_tag_timestamps(checkpoint.get_tag_timestamps())
+
+    finally:
+        csvfile.close()
+
+    return seen
+
+
+def _start_csv_part(checkpoint, compress):
+
+    """
+    Create the current csv file of the checkpoint and write its header, then
+    save the checkpoint. Returns the open file.
+
+    """
+
+    filepath = os.path.join(settings.data_dir, checkpoint.get_part_filename())
+    csvfile = open(filepath, 'wb')
+    csvfile.write(compress(_get_csv_bytes([], header=True)))
+    csvfile.flush()
+
+    checkpoint.offset = csvfile.tell()
+    checkpoint.part_items = 0
+    checkpoint.save()
+    return csvfile
+
+
+def _is_part_full(checkpoint):
+
+    """
+    Check whether the current csv file of the checkpoint has reached the
+    size set by the csv_rotate_rows or csv_rotate_bytes settings.
+
+    """
+
+    if checkpoint.part_items == 0:
+        return False
+
+    rows = settings.csv_rotate_rows
+    size = settings.csv_rotate_bytes
+
+    return (rows > 0 and checkpoint.part_items >= rows) or \
+        (size > 0 and checkpoint.offset >= size)
+
+
+def _get_csv_bytes(items, header=False):
+
+    """
+    Get the csv rows for a list of flattened items, optionally preceded by
+    the header, encoded as utf-8.
+
+    """
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=data.FIELDNAMES,
+        quoting=csv.QUOTE_NONNUMERIC)
+
+    if header:
+        writer.writeheader()
+
+    writer.writerows(items)
+    return output.getvalue().encode('utf-8')
+
+
+def _get_compressor(compression):
+
+    """
+    Get a function which compresses bytes into a complete gzip member or
+    zstd frame for the given csv_compression setting, or returns them
+    unchanged if compression is 'none'. Compressing with zstd requires the
+    zstandard package.
+
+    """
+
+    if compression == 'gzip':
+        return lambda b: gzip.compress(b, compresslevel=GZIP_LEVEL)
+
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError(
+                'writing zstd compressed csvs requires zstandard')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+
+    return lambda b: b
+
+
+def download_entries_parquet(compression='zstd'):
+
+    """
+    Download entries to a Parquet file. Unlike the csv, the keywords,
+    comments and highlights fields are stored as lists of strings, the date
+    fields as dates and the add_time field as a time, and the file is
+    compressed with the given codec. Rows are written in row groups of up to
+    ROW_GROUP_SIZE items as the pages arrive. Once the file is written the
+    timestamps are recorded as they are for download_entries_csv. Requires
+    pyarrow.
+
+    """
+
+    return _download_entries_arrow('parquet', compression)
+
+
+def download_entries_arrow(compression='zstd'):
+
+    """
+    Download entries to an Arrow IPC file, with the same columns as
+    download_entries_parquet. The record batches are compressed with the
+    given codec, which may be 'zstd', 'lz4' or None. Requires pyarrow.
+
+    """
+
+    return _download_entries_arrow('arrow', compression)
+
+
+def _download_entries_arrow(extension, compression):
+
+    """
+    Download entries to a Parquet or Arrow IPC file with the given extension
+    and compression, and return the filename. The tag timestamps are only
+    recorded once the file is closed, as a file which is not closed has no
+    footer and cannot be read.
+
+    """
+
+    pyarrow = _import_pyarrow()
+    if pyarrow is None:
+        raise ImportError(
+            'writing Parquet and Arrow files requires pyarrow')
+
+    downloaded = data.get_timestamp_from_datetime(datetime.datetime.now())
+    pathlib.Path(settings.data_dir).mkdir(exist_ok=True)
+    filename = _get_download_filename(downloaded, extension)
+    filepath = os.path.join(settings.data_dir, filename)
+
+    seen = _load_seen_ids()
+    tag_ids = fetch.fetch_tag_ids()
+
+    # The progress is tracked with a checkpoint which is never saved, as the
+    # file cannot be resumed, so that the tag timestamps can be recorded
+    progress = Checkpoint(None, filename, downloaded, _get_since(tag_ids))
+    schema = get_arrow_schema()
+
+    if extension == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(filepath, schema,
+            compression=compression)
+    else:
+        writer = pyarrow.ipc.new_file(filepath, schema,
+            options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+
+    with writer:
+
+        buffer = []
+        pages = _iter_entry_pages(False, tag_ids, progress.since, seen)
+
+        for tag, contents, items in pages:
+            progress.record_page(tag['id'], contents, items, None)
+            buffer.extend(items)
+            if len(buffer) >= ROW_GROUP_SIZE:
+                writer.write_table(get_arrow_table(buffer, schema))
+                buffer = []
+
+        if len(buffer) > 0:
+            writer.write_table(get_arrow_table(buffer, schema))
+
+    set_last_downloaded(downloaded)
+    set_tag_timestamps(progress.get_tag_timestamps())
+
+    if seen is not None:
+        set_seen_ids(seen)
+
+    return filename
+
+
+def get_arrow_schema():
+
+    """
+    Get the pyarrow schema for items written by download_entries_parquet
+    and download_entries_arrow, with a field for each fieldname.
+
+    """
+
+    pyarrow = _import_pyarrow()
+    types = {
+        'add_timestamp': pyarrow.int64(),
+        'add_date': pyarrow.date32(),
+        'add_time': pyarrow.time32('s'),
+        'pub_date': pyarrow.date32()}
+
+    for field in LIST_FIELDS:
+        types[field] = pyarrow.list_(pyarrow.string())
+
+    return pyarrow.schema([(field, types.get(field, pyarrow.string()))
+        for field in data.FIELDNAMES])
+
+
+def get_arrow_table(items, schema):
+
+    """
+    Get a pyarrow table of a list of items parsed without flattening, with
+    the given schema.
+
+    """
+
+    pyarrow = _import_pyarrow()
+    columns = {field: [item[field] for item in items]
+        for field in data.FIELDNAMES}
+
+    columns['add_time'] = [datetime.time.fromisoformat(value) \
+        if value is not None else None for value in columns['add_time']]
+
+    return pyarrow.Table.from_pydict(columns, schema=schema)
+
+
+def _get_download_filename(downloaded, extension):
+
+    """
+    Get the filename for a download with the given timestamp and file
+    extension.
+
+    """
+
+    return '{0}-{1}-{2}.{3}'.format(
+        settings.download_prefix,
+        data.get_date_from_timestamp(downloaded),
+        data.get_time_from_timestamp(downloaded).strftime('%H-%M-%S'),
+        extension)
+
+# Page functions --------------------------------------------------------------
+
+def _iter_pages(tags, since, seen=None, resume=None):
+
+    """
+    Download the entries for each tag, including any continuations, and
+    yield a tuple of the tag and the contents of each page in tag order. The
+    entries for each tag are downloaded from its timestamp in since. If
+    the download_workers setting is greater than one, that many tags are
+    downloaded concurrently. Each worker buffers at most PAGE_BUFFER pages
+    ahead of the consumer, so memory stays bounded however far ahead the
+    workers get. If seen is given the tags are downloaded incrementally. If
+    resume is given, tags start from the state recorded for them there.
+
+    """
+
+    workers = settings.download_workers
+    resume = resume or {}
+
+    if workers <= 1:
+        for tag in tags:
+            yield from _iter_tag_pages(tag, since.get(tag['id']), seen,
+                resume.get(tag['id']))
+        return
+
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=PAGE_BUFFER) for tag in tags]
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    try:
+
+        # Tags are submitted in order, so a tag always starts before the
+        # tags after it and the consumer can never wait on a tag that is
+        # queued behind workers blocked on full buffers
+        for tag, page_queue in zip(tags, queues):
+            executor.submit(_queue_tag_pages, tag, since.get(tag['id']),
+                seen, resume.get(tag['id']), page_queue, stop)
+
+        for page_queue in queues:
+            while True:
+                page = page_queue.get()
+                if page is _END_OF_TAG:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_tag_pages(tag, since, seen=None, state=None):
+
+    """
+    Download the entries for a single tag, including any continuations, and
+    yield a tuple of the tag and the contents of each page. If seen is given
+    the tag is downloaded incrementally with _iter_new_tag_pages. If state is
+    given, it is the tag's state from a Checkpoint, and the download starts
+    from its continuation.
+
+    """
+
+    if seen is not None:
+        yield from _iter_new_tag_pages(tag, since, seen, state)
+        return
+
+    continuation = state['continuation'] if state is not None else None
 
-    entries = download_entries(flatten=True)
-    downloaded = entries['timestamp']
-    fieldnames = entries['fieldnames']
-    items = entries['items']
+    while True:
+
+        contents = fetch.contents_paginator.fetch_page(fetch.fetch_tag_entries,
+            tag['id'], since=since, continuation=continuation)
+
+        yield (tag, contents)
+
+        continuation = data.get_opt_key(contents, 'continuation')
+        if continuation is None:
+            break
+
+
+def _iter_new_tag_pages(tag, since, seen, state=None):
+
+    """
+    Download the new entries for a single tag. Pages of entry ids are
+    downloaded from the cheap ids endpoint, and only the entries whose ids
+    are not in the seen set for the tag are fetched in full, in batches.
+    Yields a tuple of the tag and the contents of the new entries for each
+    page of ids, with the page's ids under the ids key. Once the last page
+    is downloaded the ids are added to the seen set for the tag. If since is
+    None the ids cover the whole tag, so they replace the seen set, dropping
+    any entries which have been removed from the tag. If state is given the
+    download resumes from its continuation and the ids it has recorded.
+
+    """
+
+    tag_seen = seen.get(tag['id'], set())
+    tag_ids = set()
+    continuation = None
+
+    if state is not None:
+        tag_ids.update(state.get('ids', []))
+        continuation = state['continuation']
+
+    while True:
+
+        ids = fetch.ids_paginator.fetch_page(fetch.fetch_tag_entry_ids,
+            tag['id'], since=since, continuation=continuation)
+
+        entry_ids = data.get_opt_key(ids, 'ids') or []
+        new_ids = [i for i in entry_ids if i not in tag_seen]
+        tag_ids.update(entry_ids)
+
+        contents = {'items': fetch.fetch_entries(new_ids), 'ids': entry_ids}
+        continuation = data.get_opt_key(ids, 'continuation')
+        if continuation is not None:
+            contents['continuation'] = continuation
+
+        yield (tag, contents)
+
+        if continuation is None:
+            break
+
+    if since is not None:
+        tag_ids.update(tag_seen)
+
+    seen[tag['id']] = tag_ids
+
+
+def _queue_tag_pages(tag, since, seen, state, page_queue, stop):
+
+    """
+    Download the pages for a tag onto the given queue, followed by an end of
+    tag marker. If the download fails the exception is put on the queue to
+    be raised by the consumer. Stops early if the stop event is set.
+
+    """
 
     try:
+        for page in _iter_tag_pages(tag, since, seen, state):
+            if not _put_page(page_queue, page, stop):
+                return
+        _put_page(page_queue, _END_OF_TAG, stop)
+    except Exception as e:
+        _put_page(page_queue, e, stop)
+
+
+def _put_page(page_queue, page, stop):
+
+    """
+    Put a page on the queue, waiting while the queue is full. Returns False
+    without putting the page if the stop event is set while waiting.
+
+    """
+
+    while not stop.is_set():
+        try:
+            page_queue.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+# Parse functions -------------------------------------------------------------
+
+def _iter_parsed(pages, flatten):
+
+    """
+    Parse the items in each page and yield a tuple of the tag, the contents
+    and the list of parsed items for each page in page order. If the
+    parse_workers setting is greater than one, the items are split into
+    chunks of at most PARSE_CHUNK_SIZE items and parsed in a pool of that
+    many processes while the next pages are downloaded. A page is yielded
+    once its chunks are parsed, or once a later page is in flight and there
+    are at least two chunks per worker in flight. The clean text cache and
+    counters of the data module are then kept in the worker processes rather
+    than this one. Workers are started with PARSE_START_METHOD rather than
+    forked, as the download threads may be holding locks when they start,
+    and are given the timezone of this process so that they parse dates
+    and times as it would.
+
+    """
+
+    workers = settings.parse_workers
+
+    if workers <= 1:
+        for tag, contents in pages:
+            _check_tag(tag, contents)
+            yield (tag, contents, data.parse_items(
+                tag['id'], tag['label'], contents['items'], flatten))
+        return
+
+    pending = collections.deque()
+    in_flight = 0
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+        mp_context=multiprocessing.get_context(PARSE_START_METHOD),
+        initializer=_init_parse_worker, initargs=(settings.timezone,))
+
+    def pop_page():
+        nonlocal in_flight
+        tag, contents, futures = pending.popleft()
+        in_flight -= len(futures)
+        items = []
+        for future in futures:
+            items.extend(future.result())
+        return (tag, contents, items)
+
+    try:
+
+        for tag, contents in pages:
+
+            _check_tag(tag, contents)
+            items = contents['items']
+            futures = [executor.submit(data.parse_items, tag['id'],
+                tag['label'], items[i:i + PARSE_CHUNK_SIZE], flatten)
+                for i in range(0, len(items), PARSE_CHUNK_SIZE)]
+
+            pending.append((tag, contents, futures))
+            in_flight += len(futures)
+
+            while pending and (all(f.done() for f in pending[0][2]) or \
+                (len(pending) > 1 and in_flight >= workers * 2)):
+                yield pop_page()
+
+        while pending:
+            yield pop_page()
+
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _init_parse_worker(timezone):
+
+    """
+    Set the timezone in the settings of a parse worker process, which reads
+    its settings from the config file rather than sharing them with the
+    process which started it.
+
+    """
+
+    settings.timezone = timezone
+
+
+def _check_tag(tag, contents):
+
+    """
+    Check the tag data looks sane: accessing an enterprise account with
+    settings.enterprise set to false causes problems. Raises an
+    UnexpectedDataError if the page has items but the tag is missing fields.
+
+    """
+
+    if len(contents['items']) > 0 and (not data.key_exists(tag, 'id') or \
+        not data.key_exists(tag, 'label')):
+
+        raise exceptions.UnexpectedDataError(
+            'missing fields in tag data: are you accessing an '
+            'enterprise account without declaring it in your '
+            'config file?')
+
+# Checkpoint class ------------------------------------------------------------
+
+class Checkpoint:
+
+    """
+    Records the progress of a csv download so that it can be resumed if it
+    fails. The checkpoint holds the filename of the csv, the timestamp of
+    the download, the timestamps each tag was downloaded from, the offset in
+    the csv after the last page written, and a dict of the state of each
+    tag id: the continuation for its next page, whether it is done, the
+    number of items written, the timestamp of the newest item written, and
+    for incremental downloads the entry ids found so far, until they are
+    saved with the seen ids once the tag is done. If the csv is
+    rotated the offset is in the current file, whose part number and number
+    of items are also recorded.
+
+    """
+
+    def __init__(self, path, filename, downloaded, since=None):
+
+        """Initialise a checkpoint for a new download."""
+
+        self.path = path
+        self.filename = filename
+        self.downloaded = downloaded
+        self.since = since or {}
+        self.compression = 'none'
+        self.part = 1
+        self.part_items = 0
+        self.offset = None
+        self.tags = {}
+
+    @classmethod
+    def load(cls, path):
+
+        """
+        Load the checkpoint saved at the given path, or return None if there
+        is no checkpoint. Checkpoints saved before csv downloads could be
+        compressed or rotated are loaded as an uncompressed download in a
+        single file, which holds every item written.
+
+        """
+
+        try:
+            with open(path) as f:
+                saved = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+        checkpoint = cls(path, saved['filename'], saved['downloaded'],
+            saved['since'])
+        checkpoint.offset = saved['offset']
+        checkpoint.tags = saved['tags']
+        checkpoint.compression = saved.get('compression', 'none')
+        checkpoint.part = saved.get('part', 1)
+        checkpoint.part_items = saved.get('part_items', sum(
+            state['items'] for state in checkpoint.tags.values()))
+        return checkpoint
+
+    def get_part_filename(self):
+
+        """
+        Get the filename of the current csv file, which is the filename for
+        the first part and is numbered for later parts.
+
+        """
+
+        if self.part == 1:
+            return self.filename
+
+        index = self.filename.rindex('.csv')
+        return '{0}-{1}{2}'.format(
+            self.filename[:index], self.part, self.filename[index:])
+
+    def record_page(self, tag_id, contents, items, offset):
+
+        """
+        Record that a page of contents for the given tag id has been written
+        as the given parsed items, and that the csv now ends at the given
+        offset.
+
+        """
+
+        state = self.tags.setdefault(tag_id,
+            {'continuation': None, 'done': False, 'items': 0, 'newest': None})
+
+        continuation = data.get_opt_key(contents, 'continuation')
+        state['continuation'] = continuation
+        state['done'] = continuation is None
+        state['items'] += len(items)
+
+        for item in items:
+            timestamp = item['add_timestamp']
+            if timestamp is not None and (state['newest'] is None or \
+                timestamp > state['newest']):
+                state['newest'] = timestamp
+
+        if 'ids' in contents:
+            state.setdefault('ids', []).extend(contents['ids'])
+
+        self.offset = offset
+
+    def restore_seen_ids(self, seen):
+
+        """
+        Update the seen ids in place with the ids of the tags which are done,
+        as _iter_new_tag_pages would have done when they finished. The ids
+        are kept in the checkpoint until drop_seen_ids is called.
+
+        """
+
+        for tag_id, state in self.tags.items():
+            if state['done'] and 'ids' in state:
+                tag_ids = set(state['ids'])
+                if self.since.get(tag_id) is not None:
+                    tag_ids.update(seen.get(tag_id, set()))
+                seen[tag_id] = tag_ids
+
+    def drop_seen_ids(self):
+
+        """
+        Drop the ids of the tags which are done, once they have been saved
+        with the seen ids.
+
+        """
 
-        pathlib.Path(settings.data_dir).mkdir(exist_ok=True)
+        for state in self.tags.values():
+            if state['done']:
+                state.pop('ids', None)
 
-        filename = '{0}-{1}-{2}.csv'.format(
-            settings.download_prefix,
-            data.get_date_from_timestamp(downloaded),
-            data.get_time_from_timestamp(downloaded).strftime('%H-%M-%S'))
+    def get_tag_timestamps(self):
 
-        filepath = os.path.join(settings.data_dir, filename)
+        """
+        Get a dict of the timestamp to download each tag id from next time.
+        Tags which are done get the timestamp of the newest item written for
+        the tag, or the timestamp the tag was downloaded from if that is
+        newer. Tags which are not done keep the timestamp they were
+        downloaded from. Tags with no timestamp are left out.
 
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames,
-                quoting=csv.QUOTE_NONNUMERIC)
-            writer.writeheader()
-            for item in items:
-                writer.writerow(item)
+        """
 
-        set_last_downloaded(downloaded)
-        return filename
+        timestamps = {}
 
-    except:
-        raise
+        for tag_id in dict.fromkeys(list(self.since) + list(self.tags)):
+            state = self.tags.get(tag_id, {})
+            candidates = [self.since.get(tag_id)]
+            if state.get('done', False):
+                candidates.append(state.get('newest'))
+            candidates = [t for t in candidates if t is not None]
+            if len(candidates) > 0:
+                timestamps[tag_id] = max(candidates)
+
+        return timestamps
+
+    def save(self):
+
+        """
+        Save the checkpoint, replacing the saved checkpoint in one step so a
+        failure while saving never leaves a partial file.
+
+        """
+
+        saved = {
+            'filename': self.filename,
+            'downloaded': self.downloaded,
+            'since': self.since,
+            'compression': self.compression,
+            'part': self.part,
+            'part_items': self.part_items,
+            'offset': self.offset,
+            'tags': self.tags}
+
+        _replace_file(self.path, json.dumps(saved))
+
+    def delete(self):
+
+        """Delete the saved checkpoint if there is one."""
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Columnar builder ------------------------------------------------------------
+
+class EntryColumns:
+
+    """
+    Accumulates flattened items into a column per field, so that a dataframe
+    can be built directly from typed arrays. The add_timestamp field is stored
+    as int64, the date fields as datetime64, and the tag_id, tag_label and
+    publisher fields as categoricals whose codes are appended as the items
+    arrive. All other fields are stored as lists of objects.
+
+    """
+
+    CATEGORICAL_FIELDS = ('tag_id', 'tag_label', 'publisher')
+    DATE_FIELDS = ('add_date', 'pub_date')
+    TIMESTAMP_FIELDS = ('add_timestamp',)
+
+    # Missing dates are stored as the smallest int64, which numpy reads as NaT
+    MISSING_DATE = -2 ** 63
+    EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self):
+
+        """Initialise an empty column for each field."""
+
+        self.length = 0
+        self.codes = {f: array.array('l') for f in self.CATEGORICAL_FIELDS}
+        self.categories = {f: {} for f in self.CATEGORICAL_FIELDS}
+        self.dates = {f: array.array('q') for f in self.DATE_FIELDS}
+        self.timestamps = {f: array.array('q') for f in self.TIMESTAMP_FIELDS}
+        self.timestamps_missing = {f: [] for f in self.TIMESTAMP_FIELDS}
+        self.objects = {f: [] for f in data.FIELDNAMES if f not in \
+            self.CATEGORICAL_FIELDS + self.DATE_FIELDS + self.TIMESTAMP_FIELDS}
+
+    def __len__(self):
+        return self.length
+
+    def append(self, item):
+
+        """Append the values of a flattened item to the columns."""
+
+        for field, codes in self.codes.items():
+            value = item[field]
+            if value is None:
+                codes.append(-1)
+            else:
+                categories = self.categories[field]
+                codes.append(categories.setdefault(value, len(categories)))
+
+        for field, dates in self.dates.items():
+            value = item[field]
+            if value is None:
+                dates.append(self.MISSING_DATE)
+            else:
+                dates.append(value.toordinal() - self.EPOCH_ORDINAL)
+
+        for field, timestamps in self.timestamps.items():
+            value = item[field]
+            if value is None:
+                timestamps.append(0)
+                self.timestamps_missing[field].append(self.length)
+            else:
+                timestamps.append(value)
+
+        for field, objects in self.objects.items():
+            objects.append(item[field])
+
+        self.length += 1
+
+    def to_dataframe(self):
+
+        """
+        Build a dataframe from the columns, with the columns in the order of
+        the fieldnames in the data module.
+
+        """
+
+        # pandas is slow to import so it is only imported when it is needed
+        import numpy
+        import pandas
+
+        columns = {}
+
+        for field, codes in self.codes.items():
+            columns[field] = pandas.Categorical.from_codes(
+                numpy.frombuffer(codes, dtype=numpy.dtype('l')).copy(),
+                categories=list(self.categories[field]))
+
+        for field, dates in self.dates.items():
+            columns[field] = numpy.frombuffer(
+                dates, dtype=numpy.int64).astype('datetime64[D]')
+
+        for field, timestamps in self.timestamps.items():
+            values = numpy.frombuffer(timestamps, dtype=numpy.int64).copy()
+            missing = self.timestamps_missing[field]
+            if len(missing) > 0:
+                mask = numpy.zeros(self.length, dtype=bool)
+                mask[missing] = True
+                values = pandas.arrays.IntegerArray(values, mask)
+            columns[field] = values
+
+        columns.update(self.objects)
+        return pandas.DataFrame(
+            {field: columns[field] for field in data.FIELDNAMES},
+            copy=False)
 
 # Timestamp functions ---------------------------------------------------------
 
@@ -146,7 +1092,7 @@ def get_last_downloaded():
     """Get the timestamp for the last time data was downloaded."""
 
     try:
-        with open(TIMESTAMP_FILE) as f:
+        with open(settings.timestamp_file) as f:
             timestamp_str = f.read()
             return int(timestamp_str)
     except FileNotFoundError:
@@ -159,5 +1105,117 @@ def set_last_downloaded(timestamp):
 
     pathlib.Path(settings.data_dir).mkdir(exist_ok=True)
 
-    with open(TIMESTAMP_FILE, 'w') as f:
+    with open(settings.timestamp_file, 'w') as f:
         f.write('{0}'.format(timestamp))
+
+
+def get_tag_timestamps():
+
+    """
+    Get a dict of the timestamp of the newest entry downloaded for each tag
+    id, or None if the timestamps have not been recorded.
+
+    """
+
+    try:
+        with open(settings.tag_timestamps_file) as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def set_tag_timestamps(timestamps):
+
+    """
+    Set the timestamp of the newest entry downloaded for each tag id. The
+    file is replaced in one step, as it is written while downloads are in
+    progress.
+
+    """
+
+    pathlib.Path(settings.timestamp_dir).mkdir(exist_ok=True)
+    _replace_file(settings.tag_timestamps_file, json.dumps(timestamps))
+
+
+def _get_since(tag_ids):
+
+    """
+    Get a dict of the timestamp to download entries from for each tag id in
+    the given tag data. If the download_new setting is False every tag is
+    downloaded in full. Otherwise each tag is downloaded from the timestamp
+    of the newest entry recorded for it, and tags with no timestamp, such as
+    new tags, are downloaded in full. If no tag timestamps have been
+    recorded, every tag is downloaded from the last download timestamp.
+
+    """
+
+    tag_ids = [data.get_opt_key(tag, 'id') for tag in tag_ids]
+
+    if not settings.download_new:
+        return {tag_id: None for tag_id in tag_ids}
+
+    timestamps = get_tag_timestamps()
+
+    if timestamps is None:
+        last_downloaded = get_last_downloaded()
+        return {tag_id: last_downloaded for tag_id in tag_ids}
+
+    return {tag_id: timestamps.get(tag_id) for tag_id in tag_ids}
+
+# Seen id functions -----------------------------------------------------------
+
+def get_seen_ids():
+
+    """
+    Get a dict of the sets of entry ids already downloaded for each tag id,
+    for use in incremental downloads.
+
+    """
+
+    try:
+        with open(settings.seen_ids_file) as f:
+            seen = json.loads(f.read())
+            return {tag_id: set(ids) for tag_id, ids in seen.items()}
+    except FileNotFoundError:
+        return {}
+
+
+def set_seen_ids(seen):
+
+    """
+    Set the entry ids already downloaded for each tag id. The file is
+    replaced in one step, as it is written while downloads are in progress.
+
+    """
+
+    pathlib.Path(settings.state_dir).mkdir(exist_ok=True)
+    seen = {tag_id: sorted(ids) for tag_id, ids in seen.items()}
+    _replace_file(settings.seen_ids_file, json.dumps(seen))
+
+
+def _load_seen_ids():
+
+    """
+    Get the seen ids if downloads are incremental, or None if they are not.
+
+    """
+
+    return get_seen_ids() if settings.download_incremental else None
+
+# File functions --------------------------------------------------------------
+
+def _replace_file(path, text):
+
+    """
+    Write text to the file at the given path by writing a temporary file and
+    replacing the file with it in one step, so a failure while writing never
+    leaves a partial file.
+
+    """
+
+    temp_path = '{0}.tmp'.format(path)
+
+    with open(temp_path, 'w') as f:
+        f.write(text)
+
+    os.replace(temp_path, path)
@@ -2,26 +2,722 @@
 
 # Imports ---------------------------------------------------------------------
 
+import concurrent.futures
 import json
+import random
 import requests
+import threading
+import time
 import urllib
+import feedstream.cache as cache
 import feedstream.exceptions as exceptions
 from feedstream.config import settings
 
-# Functions -------------------------------------------------------------------
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Constants -------------------------------------------------------------------
+
+API_URL = 'https://cloud.feedly.com/v3'
+ENTRIES_BATCH_SIZE = 1000
+MAX_COUNT_CONTENTS = 1000
+MAX_COUNT_IDS = 10000
+MIN_COUNT = 20
+PAGE_TARGET_SECONDS = 5.0
+PAGE_MAX_BYTES = 8 * 1024 * 1024
+REQUEST_TIMEOUT = (10.0, 60.0)
+RETRY_LIMIT = 5
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 60.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_MAX_WAIT = 900.0
+TOKEN_REFRESH_MARGIN = 300.0
+TOKEN_EXPIRED_MESSAGE = 'token expired'
+
+HEADER_RATE_LIMIT_COUNT = 'X-RateLimit-Count'
+HEADER_RATE_LIMIT_LIMIT = 'X-RateLimit-Limit'
+HEADER_RATE_LIMIT_RESET = 'X-RateLimit-Reset'
+HEADER_RETRY_AFTER = 'Retry-After'
+
+JSON_BACKENDS = ('orjson', 'ujson', 'json')
+
+# RateLimiter class -----------------------------------------------------------
+
+class RateLimiter:
 
-def fetch_tag_ids():
+    """
+    A token bucket holding the requests left in the account's rate limit
+    window. The bucket is filled from the rate limit headers the API sends
+    with each response: the limit less the requests already counted, less
+    any requests still in flight. Every request takes a token before it is
+    sent. When the bucket is empty, requests wait until the window resets,
+    after which the bucket is treated as full until the next response says
+    otherwise. Until the API has sent any rate limit headers requests are
+    not limited.
 
-    """Fetch a list of all tag ids."""
+    """
 
-    if settings.enterprise:
-        tag_url = 'https://cloud.feedly.com/v3/enterprise/tags'
-    else:
-        tag_url = 'https://cloud.feedly.com/v3/tags'
+    def __init__(self):
+
+        """Initialise an unlimited bucket."""
+
+        self.tokens = None
+        self.reset_at = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+
+        """
+        Take a token, waiting for the window to reset if there are none
+        left. Raises an ApiError if the wait would be longer than
+        RATE_LIMIT_MAX_WAIT seconds.
+
+        """
+
+        while True:
+
+            with self.lock:
+
+                now = time.monotonic()
+
+                if self.reset_at is not None and now >= self.reset_at:
+                    self.tokens = None
+                    self.reset_at = None
+
+                if self.tokens is None or self.tokens > 0:
+                    if self.tokens is not None:
+                        self.tokens -= 1
+                    self.pending += 1
+                    return
+
+                wait = self.reset_at - now
+
+            if wait > RATE_LIMIT_MAX_WAIT:
+                raise exceptions.ApiError(429, None,
+                    'Rate limit exhausted for {0:.0f} seconds'.format(wait))
+
+            time.sleep(wait)
+
+    def release(self, headers=None):
+
+        """
+        Return from a request, updating the bucket from the rate limit
+        headers of its response if it has them.
+
+        """
+
+        with self.lock:
+
+            self.pending = max(self.pending - 1, 0)
+
+            if headers is None or not all(key in headers for key in (
+                HEADER_RATE_LIMIT_COUNT,
+                HEADER_RATE_LIMIT_LIMIT,
+                HEADER_RATE_LIMIT_RESET)):
+                return
+
+            try:
+                count = int(headers[HEADER_RATE_LIMIT_COUNT])
+                limit = int(headers[HEADER_RATE_LIMIT_LIMIT])
+                reset = float(headers[HEADER_RATE_LIMIT_RESET])
+            except (TypeError, ValueError):
+                return
+
+            self.tokens = max(limit - count - self.pending, 0)
+            self.reset_at = time.monotonic() + reset
+
+    def block(self, seconds):
+
+        """Empty the bucket until the given number of seconds has passed."""
+
+        with self.lock:
+            self.tokens = 0
+            self.reset_at = max(self.reset_at or 0,
+                time.monotonic() + seconds)
+
+# TimeoutAdapter class --------------------------------------------------------
+
+class TimeoutAdapter(requests.adapters.HTTPAdapter):
+
+    """
+    An HTTPAdapter which sends every request with a default timeout, given
+    as a (connect, read) tuple in seconds, unless the request sets its own.
+    Without a timeout a request to a server which stops responding waits
+    forever, and is never retried.
+
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT, **kwargs):
+
+        """Initialise the adapter with the default timeout."""
+
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+
+        """Send the request with the default timeout if it has none."""
+
+        if timeout is None:
+            timeout = self.timeout
+
+        return super().send(request, timeout=timeout, **kwargs)
+
+# Client class ----------------------------------------------------------------
+
+class Client:
+
+    """
+    An HTTP client which sends all requests to the API through a single
+    pooled requests.Session. Connections are kept alive and reused between
+    requests rather than opened afresh for every page, and responses are
+    requested with gzip compression. The authorization headers are built
+    once and only rebuilt when the access token changes. The client counts
+    the requests it sends and the connections it opens, so that the number
+    of connections reused can be reported with get_stats.
+
+    Every request is scheduled through a RateLimiter, so concurrent downloads
+    run as fast as the account's rate limit allows without exceeding it.
+    Responses with a status in RETRY_STATUS_CODES, and requests which fail to
+    connect or time out after REQUEST_TIMEOUT, are retried up to RETRY_LIMIT
+    times with jittered exponential backoff, or after the delay given by a
+    Retry-After header.
+
+    For enterprise accounts the client refreshes the access token itself.
+    The token is refreshed shortly before it is due to expire, and if a
+    request fails because the token has expired the token is refreshed and
+    only that request is sent again. Only one thread refreshes the token at
+    a time, and threads waiting on the refresh use the new token.
+
+    """
+
+    def __init__(self, pool_size, cache=None, timeout=REQUEST_TIMEOUT):
+
+        """
+        Initialise the session with a connection pool of the given size, and
+        optionally a cache.ResponseCache for the responses. Requests time out
+        after the given timeout in seconds.
+
+        """
+
+        self.pool_size = pool_size
+        self.cache = cache
+        self.session = get_session(pool_size,
+            {'Accept-Encoding': 'gzip, deflate'}, timeout)
+        self.adapter = self.session.get_adapter('https://')
+
+        self.requests_sent = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+        self.limiter = RateLimiter()
+        self.auth = (None, None)
+        self.refresh_lock = threading.Lock()
+        self.token_expires_at = None
+
+    def get_auth_headers(self):
+
+        """Get the authorization headers for the current access token."""
+
+        token, headers = self.auth
+
+        if token != settings.access_token:
+            token = settings.access_token
+            headers = {'Authorization': 'OAuth {0}'.format(token)}
+            self.auth = (token, headers)
+
+        return headers
+
+    def set_token_expiry(self, expires_in):
+
+        """
+        Set the number of seconds until the current access token expires, or
+        None if it is not known.
+
+        """
+
+        if expires_in is None:
+            self.token_expires_at = None
+        else:
+            self.token_expires_at = time.monotonic() + expires_in
+
+    def is_token_expiring(self):
+
+        """
+        Check whether the access token expires within TOKEN_REFRESH_MARGIN
+        seconds, if its expiry is known.
+
+        """
+
+        return self.token_expires_at is not None and \
+            time.monotonic() >= self.token_expires_at - TOKEN_REFRESH_MARGIN
+
+    def refresh_access_token(self, token):
+
+        """
+        Refresh the given access token with fetch_access_token, unless
+        another thread has already replaced it with a token which is not
+        about to expire. Threads calling this at the same time wait for the
+        first refresh to finish.
+
+        """
+
+        with self.refresh_lock:
+            if settings.access_token == token or self.is_token_expiring():
+                fetch_access_token()
+
+    def get(self, url):
+
+        """Send an authorized GET request for the given url."""
+
+        return self.send('get', url, auth=True)
+
+    def post(self, url, data=None, json=None, auth=True):
+
+        """
+        Send a POST request for the given url with either form data or a json
+        body. The request is authorized unless auth is False.
+
+        """
+
+        return self.send('post', url, auth=auth, data=data, json=json)
+
+    def send(self, method, url, auth=True, **kwargs):
+
+        """
+        Send a request with the named session method and return the response.
+        If the client has a cache, authorized requests are served from it
+        while the cached response is fresh. Stale responses are revalidated
+        with a conditional request, and a 304 response is answered from the
+        cache. Successful responses are stored in the cache. If the cache is
+        offline, requests are only ever served from the cache, and a request
+        which is not cached raises an ApiError.
+
+        """
+
+        if self.cache is None or not auth:
+            return self._send(method, url, auth, None, **kwargs)
+
+        key = self.cache.get_key(method, url, kwargs.get('json'))
+        entry = self.cache.get(key)
+
+        if entry is not None and (self.cache.offline or \
+            self.cache.is_fresh(entry)):
+            self.cache.count(hit=True)
+            return self.cache.get_response(entry)
+
+        self.cache.count(hit=False)
+
+        if self.cache.offline:
+            raise exceptions.ApiError(504, None,
+                'No cached response for {0} in offline mode'.format(url))
+
+        conditional_headers = None
+        if entry is not None:
+            conditional_headers = self.cache.get_conditional_headers(entry)
+
+        response = self._send(method, url, auth, conditional_headers,
+            **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            self.cache.refresh(key, entry)
+            return self.cache.get_response(entry)
+
+        if response.status_code == 200:
+            self.cache.put(key, response)
+
+        return response
+
+    def _send(self, method, url, auth, extra_headers=None, **kwargs):
+
+        """
+        Send a request with the named session method, retrying it if the
+        response status is in RETRY_STATUS_CODES or the connection fails, or
+        once after refreshing the access token if it has expired. Sending the
+        request again with a refreshed token does not count as a retry. Any
+        extra headers are sent along with the authorization headers. Returns
+        the last response, or raises the last connection error, once the
+        retries are used up.
+
+        """
+
+        send_request = getattr(self.session, method)
+        attempt = 0
+        refreshed = False
+
+        while True:
+
+            if auth and settings.enterprise and self.is_token_expiring():
+                self.refresh_access_token(settings.access_token)
+
+            token = settings.access_token
+            headers = self.get_auth_headers() if auth else None
+
+            if extra_headers:
+                headers = dict(headers or {}, **extra_headers)
+
+            self.limiter.acquire()
+
+            try:
+                response = send_request(url, headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+                self.limiter.release()
+                if attempt == RETRY_LIMIT:
+                    raise
+                time.sleep(get_backoff(attempt))
+                attempt += 1
+                self.count_request(retry=True)
+                continue
+
+            self.count_request()
+            self.limiter.release(response.headers)
+
+            if auth and not refreshed and settings.enterprise and \
+                is_token_expired(response):
+                self.refresh_access_token(token)
+                refreshed = True
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or \
+                attempt == RETRY_LIMIT:
+                return response
+
+            delay = get_retry_after(response.headers)
+
+            if delay is None:
+                delay = get_backoff(attempt)
+            elif response.status_code == 429:
+                self.limiter.block(delay)
+
+            time.sleep(delay)
+            attempt += 1
+            self.count_request(retry=True)
+
+    def count_request(self, retry=False):
+
+        """Increment the count of requests sent, or of retries."""
+
+        with self.lock:
+            if retry:
+                self.retries += 1
+            else:
+                self.requests_sent += 1
+
+    def get_stats(self):
+
+        """
+        Get a dict of connection statistics for the client: the number of
+        requests sent, the number of connections opened to send them, the
+        number of requests which reused an open connection, and the number of
+        requests which were retried.
+
+        """
+
+        pools = self.adapter.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in pools.keys())
+
+        return {
+            'requests': self.requests_sent,
+            'connections': connections,
+            'reused': max(self.requests_sent - connections, 0),
+            'retries': self.retries}
+
+    def close(self):
+
+        """Close the session and any open connections."""
+
+        self.session.close()
+
+# Paginator class -------------------------------------------------------------
+
+class Paginator:
+
+    """
+    Chooses the page size for a paginated endpoint and records the pages
+    fetched for each tag. Pages start at the largest count the endpoint
+    allows, so large tags need as few continuation requests as possible. If a
+    page takes longer than PAGE_TARGET_SECONDS, or its response is larger than
+    PAGE_MAX_BYTES, the count is halved for the following pages, down to
+    MIN_COUNT. Once pages take less than half the target time and size again
+    the count is doubled back towards the maximum.
+
+    """
+
+    def __init__(self, max_count):
+
+        """Initialise the paginator with the largest count allowed."""
+
+        self.max_count = max_count
+        self.count = max_count
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def fetch_page(self, func, tag_id, since=None, continuation=None):
+
+        """
+        Fetch a page for the given tag with the paginated fetch function func,
+        using the current count, and record the page.
+
+        """
+
+        start = time.monotonic()
+        page = func(tag_id,
+            since=since, continuation=continuation, count=self.count)
+        self.record(tag_id, time.monotonic() - start, get_last_response_size())
+        return page
+
+    def record(self, tag_id, seconds, size):
+
+        """
+        Record a page for the given tag which took the given number of seconds
+        and whose response was the given size, and adjust the count.
+
+        """
+
+        with self.lock:
+
+            stats = self.stats.setdefault(tag_id,
+                {'pages': 0, 'seconds': 0.0, 'bytes': 0})
+            stats['pages'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += size
+
+            if seconds > PAGE_TARGET_SECONDS or size > PAGE_MAX_BYTES:
+                self.count = max(self.count // 2, MIN_COUNT)
+            elif seconds < PAGE_TARGET_SECONDS / 2 and \
+                size < PAGE_MAX_BYTES / 2:
+                self.count = min(self.count * 2, self.max_count)
+
+    def get_stats(self):
+
+        """
+        Get a dict of the pages fetched for each tag id, with the number of
+        pages, and the total seconds and bytes taken to fetch them.
+
+        """
 
-    headers = {'Authorization': 'OAuth {0}'.format(settings.access_token)}
-    response = requests.get(tag_url, headers=headers)
-    rjson = json.loads(response.text)
+        with self.lock:
+            return {tag_id: dict(stats)
+                for tag_id, stats in self.stats.items()}
+
+    def reset(self):
+
+        """Reset the count to the maximum and clear the recorded pages."""
+
+        with self.lock:
+            self.count = self.max_count
+            self.stats = {}
+
+
+contents_paginator = Paginator(MAX_COUNT_CONTENTS)
+ids_paginator = Paginator(MAX_COUNT_IDS)
+
+# Client functions ------------------------------------------------------------
+
+_client = None
+_client_lock = threading.Lock()
+_local = threading.local()
+_json_backend = None
+_json_loads = None
+
+def get_client():
+
+    """
+    Get the client shared by all fetch functions, creating it on first use.
+    The connection pool is made large enough for every download worker to
+    hold its own connection. If the cache_enabled or cache_offline settings
+    are true the client caches responses in the cache directory.
+
+    """
+
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            pool_size = max(settings.pool_size, settings.download_workers)
+            response_cache = None
+
+            if settings.cache_enabled or settings.cache_offline:
+                response_cache = cache.ResponseCache(settings.cache_dir,
+                    settings.cache_ttl, settings.cache_size,
+                    offline=settings.cache_offline)
+
+            _client = Client(pool_size, response_cache)
+        return _client
+
+
+def get_session(pool_size, headers=None, timeout=REQUEST_TIMEOUT):
+
+    """
+    Get a requests.Session which keeps its connections alive in a pool of
+    the given size, and sends requests with the given timeout unless they
+    set their own. Any headers given are sent with every request.
+
+    """
+
+    adapter = TimeoutAdapter(
+        timeout=timeout,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+def get_backoff(attempt):
+
+    """
+    Get a random delay in seconds before retrying a request for the given
+    attempt, up to RETRY_BACKOFF doubled for every attempt so far, and no
+    more than RETRY_BACKOFF_MAX.
+
+    """
+
+    return random.uniform(0, min(RETRY_BACKOFF * 2 ** attempt,
+        RETRY_BACKOFF_MAX))
+
+
+def get_retry_after(headers):
+
+    """
+    Get the delay in seconds from a Retry-After header, or None if there is
+    no header or it does not give a number of seconds.
+
+    """
+
+    if headers is None or HEADER_RETRY_AFTER not in headers:
+        return None
+
+    try:
+        return max(float(headers[HEADER_RETRY_AFTER]), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_token_expired(response):
+
+    """Check whether a response is an error for an expired access token."""
+
+    if response.status_code != 401:
+        return False
+
+    try:
+        message = _json_loads(response.content)['errorMessage']
+    except (ValueError, KeyError, TypeError):
+        return False
+
+    return isinstance(message, str) and \
+        message.startswith(TOKEN_EXPIRED_MESSAGE)
+
+
+def get_last_response_size():
+
+    """
+    Get the size of the last response decoded in the current thread, or zero
+    if there has not been one.
+
+    """
+
+    return getattr(_local, 'response_size', 0)
+
+
+def get_json_backend():
+
+    """Get the name of the json backend used to decode responses."""
+
+    return _json_backend
+
+
+def set_json_backend(name=None):
+
+    """
+    Set the json backend used to decode responses: one of orjson, ujson or
+    json, the standard library module. If name is None the first of these
+    which is installed is used. Raises an ImportError if the named backend
+    is not installed.
+
+    """
+
+    global _json_backend, _json_loads
+
+    if name is None:
+        name = next(n for n in JSON_BACKENDS if _get_json_module(n))
+
+    if name not in JSON_BACKENDS:
+        raise ValueError('json backend must be one of {0}'.format(
+            ', '.join(JSON_BACKENDS)))
+
+    module = _get_json_module(name)
+    if module is None:
+        raise ImportError('{0} is not installed'.format(name))
+
+    _json_backend = name
+    _json_loads = module.loads
+
+
+def _get_json_module(name):
+
+    """Get the module for a json backend, or None if it is not installed."""
+
+    return {'orjson': orjson, 'ujson': ujson, 'json': json}.get(name)
+
+
+def _get_json(url):
+
+    """
+    Send a GET request for the given url through the shared client and return
+    the decoded json. Raises an ApiError if the response status is not ok.
+
+    """
+
+    return _decode_response(get_client().get(url))
+
+
+def _post_json(url, payload):
+
+    """
+    Send a POST request for the given url with the payload as a json body
+    through the shared client and return the decoded json. Raises an ApiError
+    if the response status is not ok.
+
+    """
+
+    return _decode_response(get_client().post(url, json=payload))
+
+
+def _decode_response(response):
+
+    """
+    Decode the json in a response straight from its bytes with the json
+    backend. Raises an ApiError if the response status is not ok.
+
+    """
+
+    content = response.content
+    _local.response_size = len(content)
+
+    try:
+        rjson = _json_loads(content)
+    except ValueError:
+        if response.ok is not True:
+            raise exceptions.ApiError(response.status_code, None,
+                content.decode('utf-8', errors='replace'))
+        raise
 
     if response.ok is not True:
         raise exceptions.ApiError(
@@ -31,6 +727,19 @@ def fetch_tag_ids():
 
     return rjson
 
+# Functions -------------------------------------------------------------------
+
+def fetch_tag_ids():
+
+    """Fetch a list of all tag ids."""
+
+    if settings.enterprise:
+        tag_url = '{0}/enterprise/tags'.format(API_URL)
+    else:
+        tag_url = '{0}/tags'.format(API_URL)
+
+    return _get_json(tag_url)
+
 
 def fetch_tag_entry_ids(tag_id, since=None, continuation=None, count=None):
 
@@ -41,7 +750,7 @@ def fetch_tag_entry_ids(tag_id, since=None, continuation=None, count=None):
 
     """
 
-    id_url = 'https://cloud.feedly.com/v3/streams/ids?streamId='
+    id_url = '{0}/streams/ids?streamId='.format(API_URL)
     tag_id = urllib.parse.quote_plus(tag_id)
     params = ''
 
@@ -55,37 +764,55 @@ def fetch_tag_entry_ids(tag_id, since=None, continuation=None, count=None):
         params = '{0}&count={1}'.format(params, count)
 
     url = '{0}{1}{2}'.format(id_url, tag_id, params)
-    headers = {'Authorization': 'OAuth {0}'.format(settings.access_token)}
-    response = requests.get(url, headers=headers)
-    rjson = json.loads(response.text)
-
-    if response.ok is not True:
-        raise exceptions.ApiError(
-            response.status_code,
-            rjson['errorId'],
-            rjson['errorMessage'])
-
-    return rjson
+    return _get_json(url)
 
 
 def fetch_entry(entry_id):
 
     """Fetch an entry for the given entry id."""
 
-    entry_url = 'https://cloud.feedly.com/v3/entries/'
+    entry_url = '{0}/entries/'.format(API_URL)
     entry_id = urllib.parse.quote_plus(entry_id)
     url = '{0}{1}'.format(entry_url, entry_id)
-    headers = {'Authorization': 'OAuth {0}'.format(settings.access_token)}
-    response = requests.get(url, headers=headers)
-    rjson = json.loads(response.text)
+    return _get_json(url)[0]
 
-    if response.ok is not True:
-        raise exceptions.ApiError(
-            response.status_code,
-            rjson['errorId'],
-            rjson['errorMessage'])
 
-    return rjson[0]
+def fetch_entries(entry_ids, workers=1):
+
+    """
+    Fetch the entries for a list of entry ids using the bulk entries endpoint.
+    The ids are sent in chunks of at most ENTRIES_BATCH_SIZE ids, one request
+    per chunk, and if workers is greater than one that many chunks are fetched
+    concurrently. Returns a list of the entries in the order of the given ids.
+    Ids for which the API returns no entry are left out.
+
+    """
+
+    entry_ids = list(entry_ids)
+    chunks = [entry_ids[i:i + ENTRIES_BATCH_SIZE]
+        for i in range(0, len(entry_ids), ENTRIES_BATCH_SIZE)]
+
+    if workers <= 1 or len(chunks) <= 1:
+        results = [_fetch_entries_chunk(chunk) for chunk in chunks]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers) as executor:
+            results = list(executor.map(_fetch_entries_chunk, chunks))
+
+    entries = {}
+    for result in results:
+        for entry in result:
+            entries[entry['id']] = entry
+
+    return [entries[i] for i in entry_ids if i in entries]
+
+
+def _fetch_entries_chunk(entry_ids):
+
+    """Fetch a list of entries for a chunk of entry ids in one request."""
+
+    entries_url = '{0}/entries/.mget'.format(API_URL)
+    return _post_json(entries_url, entry_ids)
 
 
 def fetch_tag_entries(tag_id, since=None, continuation=None, count=None):
@@ -97,7 +824,7 @@ def fetch_tag_entries(tag_id, since=None, continuation=None, count=None):
 
     """
 
-    contents_url = 'https://cloud.feedly.com/v3/streams/contents?streamId='
+    contents_url = '{0}/streams/contents?streamId='.format(API_URL)
     tag_id = urllib.parse.quote_plus(tag_id)
     params = ''
 
@@ -111,26 +838,17 @@ def fetch_tag_entries(tag_id, since=None, continuation=None, count=None):
         params = '{0}&count={1}'.format(params, count)
 
     url = '{0}{1}{2}'.format(contents_url, tag_id, params)
-    headers = {'Authorization': 'OAuth {0}'.format(settings.access_token)}
-    response = requests.get(url, headers=headers)
-    rjson = json.loads(response.text)
-
-    if response.ok is not True:
-        raise exceptions.ApiError(
-            response.status_code,
-            rjson['errorId'],
-            rjson['errorMessage'])
-
-    return rjson
+    return _get_json(url)
 
 
 def fetch_access_token():
 
     """
     Fetches a new access token from the API and saves it to the config file.
-    Note that refreshing access tokens through the API only works with
-    enterprise accounts. Calling this function when settings.enterprise is
-    set to false will raise a FetchError.
+    The token's expiry is passed to the client, so that it can refresh the
+    token before it expires. Note that refreshing access tokens through the
+    API only works with enterprise accounts. Calling this function when
+    settings.enterprise is set to false will raise a FetchError.
 
     """
 
@@ -138,7 +856,7 @@ def fetch_access_token():
         raise exceptions.AccountTypeError(
             'fetch_access_token requires an enterprise account')
 
-    token_url = 'https://cloud.feedly.com/v3/auth/token'
+    token_url = '{0}/auth/token'.format(API_URL)
 
     data = {
         'refresh_token': settings.refresh_token,
@@ -147,7 +865,13 @@ def fetch_access_token():
         'grant_type': 'refresh_token'
     }
 
-    response = requests.post(token_url, data=data)
-    response_data = json.loads(response.text)
+    client = get_client()
+    response_data = _decode_response(
+        client.post(token_url, data=data, auth=False))
     settings.access_token = response_data['access_token']
     settings.save()
+    client.set_token_expiry(response_data.get('expires_in'))
+
+# Initialise json backend -----------------------------------------------------
+
+set_json_backend()
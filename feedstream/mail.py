@@ -2,23 +2,173 @@
 
 # Imports ---------------------------------------------------------------------
 
+import concurrent.futures
 import datetime
+import functools
 import json
 import os
 import requests
 import feedstream.data as data
 import feedstream.download as download
+import feedstream.fetch as fetch
 from feedstream.config import settings
 
 # Constants -------------------------------------------------------------------
 
-TEMPLATE_PATH_MAIL = os.path.join(settings.template_dir, 'mail.html')
-TEMPLATE_PATH_TAG = os.path.join(settings.template_dir, 'tag.html')
-TEMPLATE_PATH_ITEM = os.path.join(settings.template_dir, 'item.html')
+TEMPLATE_FILE_MAIL = 'mail.html'
+TEMPLATE_FILE_TAG = 'tag.html'
+TEMPLATE_FILE_ITEM = 'item.html'
+MAIL_BUFFER = 2
 
-TEMPLATE_MAIL = open(TEMPLATE_PATH_MAIL).read()
-TEMPLATE_TAG = open(TEMPLATE_PATH_TAG).read()
-TEMPLATE_ITEM = open(TEMPLATE_PATH_ITEM).read()
+_TEMPLATE_FILES = {
+    'MAIL': TEMPLATE_FILE_MAIL,
+    'TAG': TEMPLATE_FILE_TAG,
+    'ITEM': TEMPLATE_FILE_ITEM}
+
+# Template functions ----------------------------------------------------------
+
+def __getattr__(name):
+
+    """
+    Get the TEMPLATE_PATH and TEMPLATE constants for the mail, tag and item
+    templates, which are not read until they are first used.
+
+    """
+
+    if name.startswith('TEMPLATE_PATH_'):
+        filename = _TEMPLATE_FILES.get(name[len('TEMPLATE_PATH_'):])
+        if filename is not None:
+            return os.path.join(settings.template_dir, filename)
+
+    elif name.startswith('TEMPLATE_'):
+        filename = _TEMPLATE_FILES.get(name[len('TEMPLATE_'):])
+        if filename is not None:
+            return get_template(filename)
+
+    raise AttributeError(
+        'module {0} has no attribute {1}'.format(__name__, name))
+
+
+def get_template(filename):
+
+    """
+    Get the template with the given filename in the template directory. Each
+    template is read once, the first time it is used.
+
+    """
+
+    return _read_template(os.path.join(settings.template_dir, filename))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_template(path):
+
+    """Read the template at the given path."""
+
+    with open(path) as f:
+        return f.read()
+
+# Email renderer class -------------------------------------------------------
+
+class EmailRenderer:
+
+    """
+    Renders the bodies of the emails in a mailshot from the mail, tag and
+    item templates. Each rendered fragment is cached, so an article is
+    rendered once however many emails it appears in, and a tag with the same
+    articles is rendered once however many users follow it. Users who share
+    a dataframe of articles share one rendered body. The date shown in the
+    emails is the date the renderer was created.
+
+    """
+
+    def __init__(self):
+
+        """Initialise the renderer with empty caches."""
+
+        self.template_mail = get_template(TEMPLATE_FILE_MAIL)
+        self.template_tag = get_template(TEMPLATE_FILE_TAG)
+        self.template_item = get_template(TEMPLATE_FILE_ITEM)
+        self.date = datetime.date.today().strftime('%A %d %B %Y')
+        self.items = {}
+        self.tags = {}
+        self.bodies = {}
+
+    def render(self, articles):
+
+        """
+        Render the body of an email which shows the given dataframe of
+        articles by tag. Tags are shown in the order they first appear in
+        the dataframe, each with its articles in the order they appear.
+
+        """
+
+        # Bodies are keyed by dataframe and hold a reference to it, so the
+        # id is not reused while the body is cached
+        key = id(articles)
+        if key in self.bodies:
+            return self.bodies[key][1]
+
+        columns = {field: articles[field].tolist() for field in
+            ('tag_id', 'tag_label', 'article_id')}
+        article_ids = columns['article_id']
+
+        if any(article_id not in self.items for article_id in article_ids):
+            self.render_items(articles)
+
+        tag_rows = {}
+        for row, tag_id in enumerate(columns['tag_id']):
+            tag_rows.setdefault(tag_id, []).append(row)
+
+        tags = [self.render_tag(
+            tag_id,
+            columns['tag_label'][rows[0]],
+            [article_ids[row] for row in rows])
+            for tag_id, rows in tag_rows.items()]
+
+        body = self.template_mail.format(
+            date=self.date,
+            tags=''.join(tags))
+
+        self.bodies[key] = (articles, body)
+        return body
+
+    def render_items(self, articles):
+
+        """
+        Render the items for the articles in a dataframe which are not
+        already rendered.
+
+        """
+
+        for article_id, url, title, short_content in zip(
+            articles['article_id'].tolist(),
+            articles['url'].tolist(),
+            articles['title'].tolist(),
+            articles['short_content'].tolist()):
+
+            if article_id not in self.items:
+                self.items[article_id] = self.template_item.format(
+                    url=url,
+                    title=title,
+                    short_content=short_content)
+
+    def render_tag(self, tag_id, tag_label, article_ids):
+
+        """
+        Render a tag with the items for the given article ids, which must
+        already be rendered, unless the tag is already rendered with them.
+
+        """
+
+        key = (tag_id, tuple(article_ids))
+
+        if key not in self.tags:
+            self.tags[key] = self.template_tag.format(
+                tag_label=tag_label,
+                items=''.join(self.items[a] for a in article_ids))
+
+        return self.tags[key]
 
 # Functions -------------------------------------------------------------------
 
@@ -35,16 +185,40 @@ def get_articles_by_user(users, articles):
 
     """
     Create a dictionary containing a dataframe of unique articles for each user
-    indexed by their email address.
+    indexed by their email address. The rows for each tag are found in one
+    grouped pass over the articles, and the articles for each distinct set of
+    tags are selected once, so users who follow the same tags share the same
+    dataframe.
 
     """
 
+    import numpy
+
+    tag_rows = articles.groupby(
+        'tag_id', sort=False, observed=True).indices
+    article_codes = articles['article_id'].factorize()[0]
+    no_rows = numpy.array([], dtype=numpy.intp)
+
+    tag_sets_articles = {}
     users_articles = {}
 
     for user in users:
-        user_articles = articles.loc[articles['tag_id'].isin(user['tag_ids'])]
-        unique_articles = user_articles.drop_duplicates(['article_id'])
-        users_articles[user['email_address']] = unique_articles
+
+        tag_set = frozenset(user['tag_ids'])
+
+        if tag_set not in tag_sets_articles:
+
+            # Take the rows for the tags in their original order, keeping
+            # the first row for each article
+            rows = numpy.sort(numpy.concatenate([no_rows] + [
+                tag_rows[tag_id] for tag_id in tag_set
+                if tag_id in tag_rows]))
+            codes, first = numpy.unique(
+                article_codes[rows], return_index=True)
+            tag_sets_articles[tag_set] = articles.iloc[
+                rows[numpy.sort(first)]]
+
+        users_articles[user['email_address']] = tag_sets_articles[tag_set]
 
     return users_articles
 
@@ -53,67 +227,48 @@ def get_emails_by_user(users_articles):
 
     """
     Create a dictionary containing the content of the email for each user
-    indexed by their email address.
+    indexed by their email address. One renderer is shared by every email,
+    so each article and tag is rendered once for the whole mailshot.
 
     """
 
+    renderer = EmailRenderer()
     users_emails = {}
     for email_address, articles in users_articles.items():
-        users_emails[email_address] = create_email_body(email_address, articles)
+        users_emails[email_address] = create_email_body(
+            email_address, articles, renderer)
     return users_emails
 
 
-def create_email_body(email_address, articles):
+def create_email_body(email_address, articles, renderer=None):
 
     """
     Create the body of an email which shows all articles by tag based on the
-    given dataframe of articles.
+    given dataframe of articles. Pass the same renderer for every email in a
+    mailshot to reuse the fragments it has already rendered.
 
     """
 
     if (len(articles) == 0):
         return None
 
-    # Create containers for the data
-    tags = []
-    items = []
-
-    # Set current tag values to data in first row
-    tag_id = articles.iloc[1]['tag_id']
-    tag_label = articles.iloc[1]['tag_label']
-
-    for index, row in articles.iterrows():
+    if renderer is None:
+        renderer = EmailRenderer()
 
-        if tag_id != row['tag_id']:
-            tags.append(TEMPLATE_TAG.format(
-                tag_label=tag_label,
-                items=''.join(items)))
-            items = []
-
-        items.append(TEMPLATE_ITEM.format(
-            url=row['url'],
-            title=row['title'],
-            short_content=row['short_content']))
+    mail = renderer.render(articles)
+    _write_email(email_address, mail)
+    return mail
 
-        tag_id = row['tag_id']
-        tag_label = row['tag_label']
 
-    tags.append(TEMPLATE_TAG.format(
-        tag_label=tag_label,
-        items=''.join(items)))
+def _write_email(email_address, mail):
 
-    date = datetime.date.today().strftime('%A %d %B %Y')
-    mail = TEMPLATE_MAIL.format(
-        date=date,
-        tags=''.join(tags))
+    """Write a copy of an email to the production mail directory."""
 
     with open(os.path.join('_production', 'mail',
         '{}.html'.format(email_address)), 'w') as test_mail:
 
         test_mail.write(mail)
 
-    return mail
-
 
 def get_mailshot_data(subject, users_emails):
 
@@ -123,11 +278,49 @@ def get_mailshot_data(subject, users_emails):
 
     """
 
-    recipients = []
+    return _get_payload(subject, users_emails.items())
+
+
+def get_mailshot_batches(subject, users_emails, batch_size=None):
+
+    """
+    Yield the mailshot as a series of batches, each a tuple of a list of up
+    to batch_size recipient addresses and the json payload for them, in the
+    form returned by get_mailshot_data. The batch size defaults to the
+    mail_batch_size setting, and a ValueError is raised if it is less than
+    one. Each payload is created when its batch is taken, so only the
+    batches being sent are held in memory.
+
+    """
+
+    if batch_size is None:
+        batch_size = settings.mail_batch_size
+
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+
+    batch = []
     for email_address, body in users_emails.items():
-        recipients.append({'email': email_address, 'body': body})
+        batch.append((email_address, body))
+        if len(batch) >= batch_size:
+            yield ([e for e, b in batch], _get_payload(subject, batch))
+            batch = []
+
+    if len(batch) > 0:
+        yield ([e for e, b in batch], _get_payload(subject, batch))
+
+
+def _get_payload(subject, recipients):
 
-    mailshot_data = {'subject': subject, 'recipients': recipients}
+    """
+    Create the json payload for a mailshot to a sequence of tuples of
+    recipient address and email body.
+
+    """
+
+    mailshot_data = {'subject': subject, 'recipients': [
+        {'email': email_address, 'body': body}
+        for email_address, body in recipients]}
     return json.dumps(mailshot_data)
 
 
@@ -140,13 +333,97 @@ def send_mailshot(mailshot_data):
     response = requests.post(url, headers=headers, data=mailshot_data)
 
 
+def send_mailshot_batches(subject, users_emails, batch_size=None,
+    workers=None):
+
+    """
+    Send a mailshot to the mailer endpoint in batches of up to batch_size
+    recipients, with up to the given number of batches sent at once over a
+    pooled session. These default to the mail_batch_size and mail_workers
+    settings. No more than MAIL_BUFFER batches per worker are waiting to be
+    sent at any time, so memory stays bounded however many recipients there
+    are. A batch which fails does not stop the others.
+
+    Returns a list of the result of each batch in order: a dict of the
+    batch number, the recipient addresses, the status code of the response
+    or None if there was no response, whether the batch was accepted, and
+    the error if it was not.
+
+    """
+
+    if workers is None:
+        workers = settings.mail_workers
+
+    session = fetch.get_session(workers,
+        {'Content-Type': 'application/json'})
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    batches = get_mailshot_batches(subject, users_emails, batch_size)
+    pending = set()
+    results = []
+
+    try:
+
+        for number, (email_addresses, payload) in enumerate(batches):
+
+            pending.add(executor.submit(_send_batch, session, number,
+                email_addresses, payload))
+
+            if len(pending) >= workers * MAIL_BUFFER:
+                done, pending = concurrent.futures.wait(pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+
+        done, pending = concurrent.futures.wait(pending)
+        results.extend(future.result() for future in done)
+
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+    return sorted(results, key=lambda result: result['batch'])
+
+
+def _send_batch(session, number, email_addresses, payload):
+
+    """
+    Send one batch of a mailshot with the given session and return its
+    result. Connection errors and error responses are recorded in the
+    result rather than raised.
+
+    """
+
+    result = {
+        'batch': number,
+        'recipients': email_addresses,
+        'status_code': None,
+        'ok': False,
+        'error': None}
+
+    try:
+        response = session.post(settings.mailer_endpoint, data=payload)
+    except requests.RequestException as e:
+        result['error'] = str(e)
+        return result
+
+    result['status_code'] = response.status_code
+    result['ok'] = response.ok is True
+
+    if not result['ok']:
+        result['error'] = response.text
+
+    return result
+
+
 def run_mailshot(subject):
 
-    """Downloads article data from feedly and mails it to all users."""
+    """
+    Downloads article data from feedly and mails it to all users in batches.
+    Returns the result of each batch, as returned by send_mailshot_batches.
+
+    """
 
     users = get_users()
     articles = get_articles()
     users_articles = get_articles_by_user(users, articles)
     users_emails = get_emails_by_user(users_articles)
-    mailshot_data = get_mailshot_data(subject, users_emails)
-    send_mailshot(mailshot_data)
+    return send_mailshot_batches(subject, users_emails)
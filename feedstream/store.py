@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import datetime
+import os
+import pathlib
+import sqlite3
+import feedstream.data as data
+import feedstream.download as download
+from feedstream.config import settings
+
+# Constants -------------------------------------------------------------------
+
+DB_FILE = 'articles.db'
+STORE_BATCH_SIZE = 500
+
+ARTICLE_FIELDS = [
+    'article_id',
+    'pub_date',
+    'publisher',
+    'url',
+    'title',
+    'author',
+    'summary',
+    'full_content',
+    'short_content',
+    'keywords',
+    'comments',
+    'highlights']
+
+TAG_ARTICLE_FIELDS = [
+    'tag_id',
+    'article_id',
+    'add_timestamp',
+    'add_date',
+    'add_time']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    article_id TEXT PRIMARY KEY,
+    pub_date TEXT,
+    publisher TEXT,
+    url TEXT,
+    title TEXT,
+    author TEXT,
+    summary TEXT,
+    full_content TEXT,
+    short_content TEXT,
+    keywords TEXT,
+    comments TEXT,
+    highlights TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    tag_id TEXT PRIMARY KEY,
+    tag_label TEXT,
+    position INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tag_articles (
+    tag_id TEXT NOT NULL REFERENCES tags (tag_id),
+    article_id TEXT NOT NULL REFERENCES articles (article_id),
+    add_timestamp INTEGER,
+    add_date TEXT,
+    add_time TEXT,
+    PRIMARY KEY (tag_id, article_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS tag_articles_article_id
+    ON tag_articles (article_id);
+
+CREATE INDEX IF NOT EXISTS tag_articles_add_timestamp
+    ON tag_articles (add_timestamp);
+"""
+
+UPSERT_ARTICLE = """
+INSERT INTO articles ({0}) VALUES ({1})
+ON CONFLICT (article_id) DO UPDATE SET {2}
+""".format(
+    ', '.join(ARTICLE_FIELDS),
+    ', '.join('?' for f in ARTICLE_FIELDS),
+    ', '.join('{0} = excluded.{0}'.format(f) for f in ARTICLE_FIELDS[1:]))
+
+UPSERT_TAG = """
+INSERT INTO tags (tag_id, tag_label, position)
+VALUES (?, ?, (SELECT COALESCE(MAX(position) + 1, 0) FROM tags))
+ON CONFLICT (tag_id) DO UPDATE SET tag_label = excluded.tag_label
+"""
+
+UPSERT_TAG_ARTICLE = """
+INSERT INTO tag_articles ({0}) VALUES ({1})
+ON CONFLICT (tag_id, article_id) DO UPDATE SET {2}
+""".format(
+    ', '.join(TAG_ARTICLE_FIELDS),
+    ', '.join('?' for f in TAG_ARTICLE_FIELDS),
+    ', '.join('{0} = excluded.{0}'.format(f) for f in TAG_ARTICLE_FIELDS[2:]))
+
+# Article store class ---------------------------------------------------------
+
+class ArticleStore:
+
+    """
+    A local SQLite store of downloaded articles. Each article is stored once
+    in the articles table, keyed by its article id, however many tags it
+    appears in. The tags table holds the label of each tag and the order in
+    which tags were first stored, and the tag_articles table joins each tag
+    to its articles with the time each article was added to the tag. Items
+    are written with upserts, so storing the same article again updates it
+    rather than duplicating it. Items are read and written in the flattened
+    form returned by data.parse_item with flatten set to True.
+
+    """
+
+    def __init__(self, path=None):
+
+        """
+        Open the store at the given path, creating it if it does not exist.
+        The default path is articles.db in the data directory.
+
+        """
+
+        if path is None:
+            pathlib.Path(settings.data_dir).mkdir(exist_ok=True)
+            path = os.path.join(settings.data_dir, DB_FILE)
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_items(self, items):
+
+        """
+        Add a list of flattened items to the store in one transaction.
+        Articles, tags and the links between them which are already stored
+        are updated.
+
+        """
+
+        articles = []
+        tags = {}
+        tag_articles = []
+
+        for item in items:
+
+            article = [item[f] for f in ARTICLE_FIELDS]
+            if article[1] is not None:
+                article[1] = article[1].isoformat()
+            articles.append(article)
+
+            tags.setdefault(item['tag_id'], item['tag_label'])
+
+            tag_article = [item[f] for f in TAG_ARTICLE_FIELDS]
+            if tag_article[3] is not None:
+                tag_article[3] = tag_article[3].isoformat()
+            tag_articles.append(tag_article)
+
+        with self.connection:
+            self.connection.executemany(UPSERT_ARTICLE, articles)
+            self.connection.executemany(UPSERT_TAG, tags.items())
+            self.connection.executemany(UPSERT_TAG_ARTICLE, tag_articles)
+
+    def get_article(self, article_id):
+
+        """
+        Get the article with the given id as a dict of the article fields, or
+        None if it is not stored.
+
+        """
+
+        row = self.connection.execute(
+            'SELECT {0} FROM articles WHERE article_id = ?'.format(
+                ', '.join(ARTICLE_FIELDS)),
+            (article_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        article = dict(zip(ARTICLE_FIELDS, row))
+        article['pub_date'] = _get_date(article['pub_date'])
+        return article
+
+    def get_article_tags(self, article_id):
+
+        """Get a list of the tag ids for the article with the given id."""
+
+        rows = self.connection.execute(
+            'SELECT tag_articles.tag_id FROM tag_articles '
+            'JOIN tags ON tags.tag_id = tag_articles.tag_id '
+            'WHERE article_id = ? ORDER BY tags.position',
+            (article_id,))
+
+        return [row[0] for row in rows]
+
+    def get_tags(self):
+
+        """
+        Get a list of tuples of the id and label of each tag, in the order
+        the tags were first stored.
+
+        """
+
+        return self.connection.execute(
+            'SELECT tag_id, tag_label FROM tags ORDER BY position').fetchall()
+
+    def get_seen_ids(self):
+
+        """
+        Get a dict of the sets of article ids stored for each tag id, in the
+        form used by download.iter_entries for incremental downloads.
+
+        """
+
+        seen = {}
+        rows = self.connection.execute(
+            'SELECT tag_id, article_id FROM tag_articles')
+
+        for tag_id, article_id in rows:
+            seen.setdefault(tag_id, set()).add(article_id)
+
+        return seen
+
+    def get_tag_timestamps(self):
+
+        """
+        Get a dict of the timestamp of the newest article stored for each tag
+        id, in the form used by download.iter_entries to download only the
+        entries added since then. Tags with no timestamps are left out.
+
+        """
+
+        rows = self.connection.execute(
+            'SELECT tag_id, MAX(add_timestamp) FROM tag_articles '
+            'GROUP BY tag_id')
+
+        return {tag_id: timestamp for tag_id, timestamp in rows
+            if timestamp is not None}
+
+    def count_articles(self):
+
+        """Get the number of unique articles in the store."""
+
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM articles').fetchone()[0]
+
+    def get_items(self, tag_ids=None, since=None, unique=False):
+
+        """
+        Get a list of flattened items for the stored articles, ordered by tag
+        and then from the most recently added article. If tag_ids is given
+        only the items for those tags are returned, and if since is given
+        only the items added to their tag after that timestamp. If unique is
+        True each article is returned once, for the first of its tags.
+
+        """
+
+        conditions = []
+        params = []
+
+        if tag_ids is not None:
+            tag_ids = list(tag_ids)
+            conditions.append('tag_articles.tag_id IN ({0})'.format(
+                ', '.join('?' for tag_id in tag_ids)))
+            params.extend(tag_ids)
+
+        if since is not None:
+            conditions.append('tag_articles.add_timestamp > ?')
+            params.append(since)
+
+        where = ''
+        if len(conditions) > 0:
+            where = 'WHERE {0}'.format(' AND '.join(conditions))
+
+        fields = ['tags.tag_label'] + \
+            ['tag_articles.{0}'.format(f) for f in TAG_ARTICLE_FIELDS] + \
+            ['articles.{0}'.format(f) for f in ARTICLE_FIELDS[1:]]
+
+        names = ['tag_label'] + TAG_ARTICLE_FIELDS + ARTICLE_FIELDS[1:]
+
+        query = (
+            'SELECT {0} FROM ('
+            'SELECT {1}, tags.position AS position, ROW_NUMBER() OVER ('
+            'PARTITION BY tag_articles.article_id '
+            'ORDER BY tags.position) AS tag_number '
+            'FROM tag_articles '
+            'JOIN tags ON tags.tag_id = tag_articles.tag_id '
+            'JOIN articles ON articles.article_id = tag_articles.article_id '
+            '{2}) {3} ORDER BY position, add_timestamp DESC'
+            ).format(
+                ', '.join(names),
+                ', '.join(fields),
+                where,
+                'WHERE tag_number = 1' if unique else '')
+
+        items = []
+
+        for row in self.connection.execute(query, params):
+            item = dict(zip(names, row))
+            item['add_date'] = _get_date(item['add_date'])
+            item['pub_date'] = _get_date(item['pub_date'])
+            items.append({f: item[f] for f in data.FIELDNAMES})
+
+        return items
+
+    def get_items_df(self, tag_ids=None, since=None, unique=False):
+
+        """
+        Get a dataframe of the items returned by get_items, with the same
+        columns and types as download.download_entries_df.
+
+        """
+
+        columns = download.EntryColumns()
+        for item in self.get_items(tag_ids, since, unique):
+            columns.append(item)
+        return columns.to_dataframe()
+
+    def close(self):
+
+        """Close the connection to the store."""
+
+        self.connection.close()
+
+# Functions -------------------------------------------------------------------
+
+def _get_date(value):
+
+    """Get a date from an ISO format string, or None if value is None."""
+
+    return datetime.date.fromisoformat(value) if value is not None else None
+
+
+def download_entries_store(store=None):
+
+    """
+    Download entries for each tag into an ArticleStore, which is the store
+    in the data directory if store is None. Items are added in batches of
+    STORE_BATCH_SIZE, one transaction per batch. If the download_new
+    setting is True each tag is downloaded from the newest article stored
+    for it, independently of the timestamps recorded by the file downloads,
+    and tags with no stored articles are downloaded in full. If downloads
+    are incremental the articles already in the store are used as the seen
+    ids, so only new articles are downloaded in full. Returns the number of
+    items stored.
+
+    """
+
+    close = store is None
+    if store is None:
+        store = ArticleStore()
+
+    try:
+
+        seen = store.get_seen_ids() if settings.download_incremental else None
+        since = store.get_tag_timestamps() if settings.download_new else {}
+        batch = []
+        count = 0
+
+        for item in download.iter_entries(flatten=True, seen=seen,
+            since=since):
+            batch.append(item)
+            if len(batch) >= STORE_BATCH_SIZE:
+                store.add_items(batch)
+                count += len(batch)
+                batch = []
+
+        if len(batch) > 0:
+            store.add_items(batch)
+            count += len(batch)
+
+        return count
+
+    finally:
+        if close:
+            store.close()
@@ -10,5 +10,7 @@ setup(
     download_url = 'https://github.com/olihawkins/feedstream/tarball/0.1.0',
     keywords = ['Feedly'],
     install_requires = ['pandas, requests'],
+    extras_require = {'parquet': ['pyarrow'], 'zstd': ['zstandard'],
+        'json': ['orjson']},
     classifiers = [],
 )
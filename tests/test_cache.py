@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import json
+import tempfile
+import unittest
+import feedstream.cache as cache
+import feedstream.exceptions as exceptions
+import feedstream.fetch as fetch
+from unittest.mock import MagicMock, patch
+
+# Mocks -----------------------------------------------------------------------
+
+def get_mock_response(status_code=200, content=None, headers=None):
+
+    response = MagicMock()
+    response.status_code = status_code
+    response.ok = status_code == 200
+    response.headers = headers or {}
+    response.text = json.dumps(content) if content is not None else ''
+    response.content = response.text.encode('utf-8')
+    return response
+
+# Tests -----------------------------------------------------------------------
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time_patch = patch('feedstream.cache.time.time',
+            lambda: self.now)
+        self.time_patch.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = cache.ResponseCache(self.directory.name, 60, 10000)
+
+    def test_get_key(self):
+
+        """
+        Test that cache keys leave out the count parameter and include the
+        json body of a request.
+
+        """
+
+        url = 'https://cloud.feedly.com/v3/streams/ids?streamId=a'
+        self.assertEqual(
+            self.cache.get_key('get', url + '&continuation=1&count=20'),
+            self.cache.get_key('get', url + '&continuation=1&count=1000'))
+        self.assertNotEqual(
+            self.cache.get_key('get', url + '&continuation=1'),
+            self.cache.get_key('get', url + '&continuation=2'))
+        self.assertNotEqual(
+            self.cache.get_key('post', url, ['a']),
+            self.cache.get_key('post', url, ['b']))
+
+    def test_put_and_get(self):
+
+        """
+        Test that a stored response is replayed as a response with the same
+        status and content, and that it is fresh until the ttl passes.
+
+        """
+
+        key = self.cache.get_key('get', 'url')
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.put(key, get_mock_response(200, {'items': []},
+            {'ETag': 'etag'}))
+
+        entry = self.cache.get(key)
+        response = self.cache.get_response(entry)
+        self.assertTrue(response.ok)
+        self.assertEqual(json.loads(response.text), {'items': []})
+        self.assertEqual(self.cache.get_conditional_headers(entry),
+            {'If-None-Match': 'etag'})
+
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.now += 60
+        self.assertFalse(self.cache.is_fresh(entry))
+
+        reopened = cache.ResponseCache(self.directory.name, 60, 10000)
+        self.assertEqual(reopened.get_stats()['responses'], 1)
+
+    def test_evict_least_recently_used(self):
+
+        """
+        Test that the least recently used responses are evicted when the
+        cache is over its maximum size.
+
+        """
+
+        keys = [self.cache.get_key('get', 'url_{0}'.format(i))
+            for i in range(3)]
+        response = get_mock_response(200, {'text': 'x' * 100})
+
+        self.cache.put(keys[0], response)
+        size = self.cache.get_stats()['bytes']
+        self.cache.max_size = size * 2
+
+        self.now += 1
+        self.cache.put(keys[1], response)
+        self.now += 1
+        self.cache.get(keys[0])
+        self.now += 1
+        self.cache.put(keys[2], response)
+
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.assertEqual(self.cache.get_stats()['bytes'], size * 2)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    def test_client_cache(self, mock_get):
+
+        """
+        Test that the client serves fresh responses from the cache and
+        revalidates stale responses with a conditional request.
+
+        """
+
+        mock_get.return_value = get_mock_response(200, ['tag'],
+            {'ETag': 'etag'})
+        client = fetch.Client(1, self.cache)
+
+        self.assertEqual(client.get('url').text, '["tag"]')
+        self.assertEqual(client.get('url').text, '["tag"]')
+        self.assertEqual(mock_get.call_count, 1)
+
+        self.now += 60
+        mock_get.return_value = get_mock_response(304)
+
+        self.assertEqual(client.get('url').text, '["tag"]')
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_called_with('url', headers={
+            'Authorization': 'OAuth access token',
+            'If-None-Match': 'etag'})
+
+        self.assertEqual(client.get('url').text, '["tag"]')
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(self.cache.get_stats()['revalidated'], 1)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    def test_client_cache_offline(self, mock_get):
+
+        """
+        Test that an offline cache replays stale responses and raises an
+        ApiError for requests it has not cached, without using the network.
+
+        """
+
+        key = self.cache.get_key('get', 'url')
+        self.cache.put(key, get_mock_response(200, ['tag']))
+        self.now += 3600
+        self.cache.offline = True
+        client = fetch.Client(1, self.cache)
+
+        self.assertEqual(client.get('url').text, '["tag"]')
+
+        with self.assertRaises(exceptions.ApiError):
+            client.get('other url')
+
+        mock_get.assert_not_called()
+
+    def tearDown(self):
+        self.time_patch.stop()
+        self.directory.cleanup()
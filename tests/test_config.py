@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import inspect
+import subprocess
+import sys
+import unittest
+import feedstream
+import feedstream.config as config
+from unittest.mock import patch
+
+# Tests -----------------------------------------------------------------------
+
+class TestLazySettings(unittest.TestCase):
+
+    def test_lazy_settings(self):
+
+        """
+        Test that the settings proxy reads the config file on first use, and
+        that attributes set on the proxy are set on the settings.
+
+        """
+
+        lazy_settings = config.LazySettings(config.DIR_APP)
+        self.assertFalse(lazy_settings.is_loaded())
+
+        self.assertEqual(lazy_settings.data_dir, 'app/data')
+        self.assertTrue(lazy_settings.is_loaded())
+
+        with patch.object(lazy_settings, 'download_workers', 8):
+            self.assertEqual(lazy_settings.download_workers, 8)
+            self.assertEqual(lazy_settings._settings.download_workers, 8)
+
+        self.assertEqual(lazy_settings.download_workers,
+            config.DEFAULT_DOWNLOAD_WORKERS)
+
+    def test_lazy_settings_error(self):
+
+        """
+        Test that the settings proxy exits with a configuration error when
+        it is first used if the config file is missing.
+
+        """
+
+        lazy_settings = config.LazySettings('missing')
+
+        with self.assertRaises(SystemExit) as cm:
+            lazy_settings.timezone
+
+        self.assertIn('Could not find the configuration file',
+            str(cm.exception))
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def test_lazy_import(self):
+
+        """
+        Test that importing the package and its submodules does not import
+        pandas or read the config file, and that names exported by the
+        submodules are imported from the package on use.
+
+        """
+
+        code = (
+            'import sys\n'
+            'import feedstream, feedstream.download, feedstream.mail\n'
+            'assert "pandas" not in sys.modules\n'
+            'assert not feedstream.settings.is_loaded()\n'
+            'assert feedstream.ArticleStore.__module__ == "feedstream.store"\n'
+            'assert feedstream.download_entries_csv is '
+            'feedstream.download.download_entries_csv\n')
+
+        result = subprocess.run([sys.executable, '-c', code],
+            capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_exports(self):
+
+        """
+        Test that the package exports every public name defined in its
+        submodules, constants included, from the submodule which defines
+        it, and that every name in the export map can be imported.
+
+        """
+
+        for module_name in feedstream._EXPORTS:
+            module = getattr(feedstream, module_name)
+            for name, value in vars(module).items():
+
+                # Skip imported modules, optional modules which are not
+                # installed, and functions and classes imported from
+                # other modules
+                if name.startswith('_') or inspect.ismodule(value) or \
+                    value is None:
+                    continue
+                if (inspect.isfunction(value) or inspect.isclass(value)) \
+                    and value.__module__ != module.__name__:
+                    continue
+
+                self.assertIn(name, feedstream._EXPORT_MODULES, name)
+                self.assertIs(getattr(feedstream, name), value, name)
+
+        for name in feedstream._EXPORT_MODULES:
+            getattr(feedstream, name)
@@ -90,6 +90,19 @@ class TestGetDatetimeFromTimestampEastern(unittest.TestCase):
             self.assertEqual(dt.minute, minutes[i])
             self.assertEqual(dt.second, seconds[i])
 
+    @patch('feedstream.data.settings.timezone', 'US/Eastern')
+    def test_datetimes_settings_timezone(self):
+
+        """
+        Test that the timezone is read from the settings when the timestamps
+        are converted rather than when the module is imported.
+
+        """
+
+        self.assertEqual(data.TIMEZONE, eastern)
+        dt = data.get_datetime_from_timestamp(timestamps[0])
+        self.assertEqual(dt.hour, hours[0] - 5)
+
 
 class TestGetDateFromTimestamp(unittest.TestCase):
 
@@ -260,6 +273,57 @@ class TestCleanText(unittest.TestCase):
         expected = 'A, A; A: A. A! A!! A? A) A] A}'
         self.assertEqual(data.clean_text(input), expected)
 
+    def test_remove_tags_with_stray_brackets(self):
+
+        """
+        Test that clean_text gives the same result as the sequential tag
+        passes when the text contains a '<' which does not open a tag.
+
+        """
+
+        inputs = [
+            'x &lt; 5 and <p>y</p> &gt; 2',
+            'a <> b <p>c',
+            '<p>a</p> &lt; b']
+
+        expected = ['x > 2', 'a <> b c', 'a < b']
+
+        for i, e in zip(inputs, expected):
+            self.assertEqual(data.clean_text(i), e)
+            self.assertEqual(
+                data.remove_tags(i),
+                data.remove_tags_sequential(i))
+
+
+class TestCleanTextCache(unittest.TestCase):
+
+    def setUp(self):
+        data.clear_clean_cache()
+
+    def test_cache_short_text(self):
+
+        """Test that clean_text caches the results for short texts."""
+
+        self.assertEqual(data.clean_text('<b>Publisher</b>'), 'Publisher')
+        self.assertEqual(data.clean_text('<b>Publisher</b>'), 'Publisher')
+
+        stats = data.get_clean_cache_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    @patch('feedstream.data.CLEAN_CACHE_MAX_LENGTH', 10)
+    def test_bypass_cache_long_text(self):
+
+        """Test that clean_text does not cache the results for long texts."""
+
+        for i in range(2):
+            self.assertEqual(data.clean_text('<p>Long text</p>'), 'Long text')
+        self.assertEqual(data.get_clean_cache_stats()['size'], 0)
+
+    def tearDown(self):
+        data.clear_clean_cache()
+
 
 class TestTruncate(unittest.TestCase):
 
@@ -531,6 +595,33 @@ class TestParseContentFields(unittest.TestCase):
         self.assertEqual(full_content, expected_full_content)
         self.assertEqual(summary, expected_summary)
 
+    @patch('feedstream.data.clean_counter', data.CleanCounter())
+    def test_parse_content_fields_cleans_once(self):
+
+        """Test that each content field is cleaned exactly once."""
+
+        data.clear_clean_cache()
+        mock_entry = get_mock_entry()
+        data.parse_content_fields(mock_entry)
+
+        stats = data.clean_counter.get_stats()
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['chars'], len(mock_entry['fullContent']) +
+            len(mock_entry['summary']['content']))
+
+    @patch('feedstream.data.TRUNCATE_LENGTH', 15)
+    def test_parse_empty_full_content_field(self):
+
+        expected_short_content = 'Some sample {0}'.format(data.TRUNCATE_MARKER)
+
+        mock_entry = get_mock_entry()
+        mock_entry['fullContent'] = '<p> </p>'
+        content_fields = data.parse_content_fields(mock_entry)
+
+        self.assertEqual(content_fields[0], expected_short_content)
+        self.assertIsNone(content_fields[1])
+        self.assertEqual(content_fields[2], 'Some sample text')
+
 
 class TestParseKeywords(unittest.TestCase):
 
@@ -718,3 +809,25 @@ class TestParseItem(unittest.TestCase):
         self.assertEqual(test_entry['pub_date'], datetime.date(2018, 7, 3))
         self.assertEqual(test_entry['add_date'], datetime.date(2018, 7, 3))
         self.assertEqual(test_entry['add_time'], '16:19:09')
+
+    @patch('feedstream.data.clean_counter', data.CleanCounter())
+    def test_parse_item_clean_stats(self):
+
+        """
+        Test that parse_item counts the item and the texts it cleans, and
+        that repeated texts are served from the cache.
+
+        """
+
+        data.clear_clean_cache()
+        data.parse_item('id', 'lab', get_mock_entry())
+        data.parse_item('id', 'lab', get_mock_entry())
+
+        stats = data.clean_counter.get_stats()
+        self.assertEqual(stats['items'], 2)
+        self.assertEqual(stats['calls'], 12)
+        self.assertEqual(stats['calls_per_item'], 6)
+
+        cache_stats = data.get_clean_cache_stats()
+        self.assertEqual(cache_stats['misses'], 12)
+        self.assertEqual(cache_stats['hits'], 12)
@@ -2,12 +2,18 @@
 
 # Imports ---------------------------------------------------------------------
 
+import csv
 import datetime
+import gzip
+import io
 import json
 import os
+import pandas
+import tempfile
 import unittest
 import feedstream.data as data
 import feedstream.download as download
+import feedstream.exceptions as exceptions
 from unittest.mock import patch, call
 from tests.test_data import get_mock_entry
 
@@ -22,23 +28,27 @@ def mock_requests_get(*args, **kwargs):
             self.status_code = status_code
             self.json_data = json_data
             self.text = json.dumps(self.json_data)
+            self.content = self.text.encode('utf-8')
+            self.headers = {}
 
     mock_entry = get_mock_entry()
 
     tag_url = 'https://cloud.feedly.com/v3/tags'
     contents_url = 'https://cloud.feedly.com/v3/streams/contents?streamId='
 
-    contents_url_id_a = '{0}{1}'.format(contents_url, 'id_a')
-    contents_url_id_b = '{0}{1}'.format(contents_url, 'id_b')
+    contents_url_id_a = '{0}{1}{2}'.format(contents_url, 'id_a',
+        '&count=1000')
+    contents_url_id_b = '{0}{1}{2}'.format(contents_url, 'id_b',
+        '&count=1000')
     contents_url_id_b_con = '{0}{1}{2}'.format(contents_url, 'id_b',
-        '&continuation=1')
+        '&continuation=1&count=1000')
 
     contents_url_id_a_nt = '{0}{1}{2}'.format(contents_url, 'id_a',
-        '&newerThan=100')
+        '&newerThan=100&count=1000')
     contents_url_id_b_nt = '{0}{1}{2}'.format(contents_url, 'id_b',
-        '&newerThan=100')
+        '&newerThan=100&count=1000')
     contents_url_id_b_con_nt = '{0}{1}{2}'.format(contents_url, 'id_b',
-        '&newerThan=100&continuation=1')
+        '&newerThan=100&continuation=1&count=1000')
 
     if args[0] == tag_url:
         return MockResponse(200, [
@@ -60,6 +70,60 @@ def mock_requests_get(*args, **kwargs):
         'errorId': 'ap3int-sv2.2018070302.2773846',
         'errorMessage': 'API handler not found'})
 
+def mock_requests_get_ids(*args, **kwargs):
+
+    class MockResponse:
+
+        def __init__(self, status_code, json_data):
+            self.ok = True if status_code == 200 else False
+            self.status_code = status_code
+            self.json_data = json_data
+            self.text = json.dumps(self.json_data)
+            self.content = self.text.encode('utf-8')
+            self.headers = {}
+
+    tag_url = 'https://cloud.feedly.com/v3/tags'
+    ids_url = 'https://cloud.feedly.com/v3/streams/ids?streamId='
+
+    if args[0] == tag_url:
+        return MockResponse(200, [
+            {'id': 'id_a', 'label': 'lab_a'},
+            {'id': 'id_b', 'label': 'lab_b'}])
+
+    if args[0] == '{0}{1}{2}'.format(ids_url, 'id_a', '&count=10000'):
+        return MockResponse(200, {'ids': ['e1', 'e2']})
+
+    if args[0] == '{0}{1}{2}'.format(ids_url, 'id_b', '&count=10000'):
+        return MockResponse(200, {'ids': ['e2', 'e3'], 'continuation': '1'})
+
+    if args[0] == '{0}{1}{2}'.format(ids_url, 'id_b',
+        '&continuation=1&count=10000'):
+        return MockResponse(200, {'ids': ['e4']})
+
+    return MockResponse(404, {'errorCode': 404,
+        'errorId': 'ap3int-sv2.2018070302.2773846',
+        'errorMessage': 'API handler not found'})
+
+def mock_requests_post_mget(*args, **kwargs):
+
+    class MockResponse:
+
+        def __init__(self, status_code, json_data):
+            self.ok = True if status_code == 200 else False
+            self.status_code = status_code
+            self.json_data = json_data
+            self.text = json.dumps(self.json_data)
+            self.content = self.text.encode('utf-8')
+            self.headers = {}
+
+    entries = []
+    for entry_id in reversed(kwargs['json']):
+        mock_entry = get_mock_entry()
+        mock_entry['id'] = entry_id
+        entries.append(mock_entry)
+
+    return MockResponse(200, entries)
+
 def mock_get_last_downloaded():
     return 100
 
@@ -67,7 +131,8 @@ def mock_get_last_downloaded():
 
 class TestDownloadEntries(unittest.TestCase):
 
-    @patch('feedstream.fetch.requests.get', side_effect=mock_requests_get)
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
     @patch('feedstream.fetch.settings.access_token', 'access token')
     @patch('feedstream.fetch.settings.enterprise', False)
     @patch('feedstream.fetch.settings.download_new', False)
@@ -105,7 +170,8 @@ class TestDownloadEntries(unittest.TestCase):
                 sorted(list(test_entry.keys())),
                 sorted(data.FIELDNAMES))
 
-    @patch('feedstream.fetch.requests.get', side_effect=mock_requests_get)
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
     @patch('feedstream.fetch.settings.access_token', 'access token')
     @patch('feedstream.fetch.settings.enterprise', False)
     @patch('feedstream.fetch.settings.download_new', False)
@@ -123,23 +189,25 @@ class TestDownloadEntries(unittest.TestCase):
         calls = [
             call('https://cloud.feedly.com/v3/tags', headers=headers),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_a'), headers={'Authorization':
+                '?streamId=id_a&count=1000'), headers={'Authorization':
                 'OAuth access token'}),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_b'), headers={'Authorization':
+                '?streamId=id_b&count=1000'), headers={'Authorization':
                 'OAuth access token'}),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_b&continuation=1'), headers={'Authorization':
-                'OAuth access token'})]
+                '?streamId=id_b&continuation=1&count=1000'),
+                headers={'Authorization': 'OAuth access token'})]
 
         mock_get.assert_has_calls(calls)
 
-    @patch('feedstream.fetch.requests.get', side_effect=mock_requests_get)
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
     @patch('feedstream.fetch.settings.access_token', 'access token')
     @patch('feedstream.fetch.settings.enterprise', False)
     @patch('feedstream.fetch.settings.download_new', True)
     @patch('feedstream.data.settings.timezone', 'Europe/London')
     @patch('feedstream.download.get_last_downloaded', mock_get_last_downloaded)
+    @patch('feedstream.download.get_tag_timestamps', lambda: None)
     def test_download_entries_new(self, mock_get):
 
         """
@@ -153,17 +221,711 @@ class TestDownloadEntries(unittest.TestCase):
         calls = [
             call('https://cloud.feedly.com/v3/tags', headers=headers),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_a&newerThan=100'), headers={'Authorization':
-                'OAuth access token'}),
+                '?streamId=id_a&newerThan=100&count=1000'),
+                headers={'Authorization': 'OAuth access token'}),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_b&newerThan=100'), headers={'Authorization':
-                'OAuth access token'}),
+                '?streamId=id_b&newerThan=100&count=1000'),
+                headers={'Authorization': 'OAuth access token'}),
             call('{0}{1}'.format('https://cloud.feedly.com/v3/streams/contents',
-                '?streamId=id_b&newerThan=100&continuation=1'),
+                '?streamId=id_b&newerThan=100&continuation=1&count=1000'),
                 headers={'Authorization': 'OAuth access token'})]
 
         mock_get.assert_has_calls(calls)
 
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.download.settings.download_workers', 4)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_download_entries_concurrent(self, mock_get):
+
+        """
+        Test that download_entries returns the items in tag order when the
+        tags are downloaded concurrently.
+
+        """
+
+        entries = download.download_entries()
+        tag_ids = [item['tag_id'] for item in entries['items']]
+        self.assertEqual(tag_ids, ['id_a', 'id_b', 'id_b', 'id_b', 'id_b'])
+        self.assertEqual(mock_get.call_count, 4)
+
+class TestIterEntries(unittest.TestCase):
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_iter_entries(self, mock_get):
+
+        """
+        Test that iter_entries yields the items from the first page before
+        requesting the next page.
+
+        """
+
+        entries = download.iter_entries()
+        item = next(entries)
+        self.assertEqual(item['tag_id'], 'id_a')
+        self.assertEqual(mock_get.call_count, 2)
+
+        items = [item] + list(entries)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(mock_get.call_count, 4)
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.download.settings.download_workers', 2)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_iter_entries_concurrent_close(self, mock_get):
+
+        """
+        Test that closing iter_entries part way through a concurrent download
+        stops the workers.
+
+        """
+
+        entries = download.iter_entries()
+        next(entries)
+        entries.close()
+        self.assertLessEqual(mock_get.call_count, 4)
+
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Asia/Tokyo')
+    @patch('feedstream.download.PARSE_CHUNK_SIZE', 1)
+    def test_iter_entries_parse_workers(self, mock_get):
+
+        """
+        Test that iter_entries yields the same items in the same order when
+        the items are parsed in a pool of worker processes, with dates and
+        times in the timezone of this process rather than the config file.
+
+        """
+
+        expected = list(download.iter_entries())
+        self.assertEqual((expected[0]['add_date'], expected[0]['add_time']),
+            (datetime.date(2018, 7, 4), '00:19:09'))
+
+        with patch('feedstream.download.settings.parse_workers', 2):
+            items = list(download.iter_entries())
+
+        self.assertEqual(items, expected)
+
+
+class TestIncrementalDownload(unittest.TestCase):
+
+    @patch('feedstream.fetch.requests.Session.post',
+        side_effect=mock_requests_post_mget)
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get_ids)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_iter_entries_seen(self, mock_get, mock_post):
+
+        """
+        Test that iter_entries only fetches the entries whose ids have not been
+        seen for their tag, in one batch request per page of ids, and updates
+        the seen ids for each tag, forgetting tags which no longer exist.
+
+        """
+
+        seen = {'id_a': {'e1'}, 'id_b': {'e3', 'old'}, 'id_c': {'e5'}}
+        items = list(download.iter_entries(seen=seen))
+
+        self.assertEqual(
+            [(item['tag_id'], item['article_id']) for item in items],
+            [('id_a', 'e2'), ('id_b', 'e2'), ('id_b', 'e4')])
+
+        self.assertEqual(seen, {
+            'id_a': {'e1', 'e2'},
+            'id_b': {'e2', 'e3', 'e4'}})
+
+        self.assertEqual(mock_post.call_count, 3)
+
+    def test_set_seen_ids_replaces_file(self):
+
+        """
+        Test that a failure while writing the seen ids leaves the previous
+        seen ids readable.
+
+        """
+
+        with tempfile.TemporaryDirectory() as state_dir:
+
+            seen_ids_file = os.path.join(state_dir, 'seen_ids.json')
+
+            with patch('feedstream.download.settings.state_dir', state_dir), \
+                patch('feedstream.download.settings.seen_ids_file',
+                    seen_ids_file):
+
+                download.set_seen_ids({'id_a': {'e1'}})
+
+                def open_failing(*args, **kwargs):
+                    f = open(*args, **kwargs)
+                    def write(text):
+                        f.buffer.write(text[:5].encode('utf-8'))
+                        raise OSError('No space left on device')
+                    f.write = write
+                    return f
+
+                with patch('feedstream.download.open', open_failing,
+                    create=True), self.assertRaises(OSError):
+                    download.set_seen_ids({'id_a': {'e1', 'e2'}})
+
+                self.assertEqual(download.get_seen_ids(), {'id_a': {'e1'}})
+
+    def test_get_and_set_seen_ids(self):
+
+        """Test that seen ids are written to and read from the state file."""
+
+        with tempfile.TemporaryDirectory() as state_dir:
+
+            seen_ids_file = os.path.join(state_dir, 'seen_ids.json')
+
+            with patch('feedstream.download.settings.state_dir', state_dir), \
+                patch('feedstream.download.settings.seen_ids_file',
+                    seen_ids_file):
+
+                self.assertEqual(download.get_seen_ids(), {})
+                download.set_seen_ids({'id_a': {'e1', 'e2'}})
+                self.assertEqual(download.get_seen_ids(),
+                    {'id_a': {'e1', 'e2'}})
+
+
+class TestDownloadEntriesCsv(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv(self, mock_set, mock_set_tags, mock_get):
+
+        """
+        Test that download_entries_csv writes a header and a row for each
+        item, records the timestamp of the newest item in each tag when the
+        tag is done, and records the download timestamp afterwards.
+
+        """
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name):
+            filename = download.download_entries_csv()
+
+        filepath = os.path.join(self.data_dir.name, filename)
+
+        with open(filepath, newline='', encoding='utf-8') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(list(rows[0].keys()), data.FIELDNAMES)
+        mock_set.assert_called_once()
+        self.assertEqual(mock_set_tags.call_args_list, [
+            call({'id_a': 1530631149285}),
+            call({'id_a': 1530631149285, 'id_b': 1530631149285}),
+            call({'id_a': 1530631149285, 'id_b': 1530631149285})])
+
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv_resume(self, mock_set, mock_set_tags,
+        mock_get):
+
+        """
+        Test that a failed download_entries_csv leaves a checkpoint and the
+        timestamps of the tags it finished, and that the next call resumes
+        from the page where it failed and writes each item once.
+
+        """
+
+        failing_url = ('https://cloud.feedly.com/v3/streams/contents'
+            '?streamId=id_b&continuation=1&count=1000')
+
+        def fail_continuation(*args, **kwargs):
+            if args[0] == failing_url:
+                return mock_requests_get('unknown url')
+            return mock_requests_get(*args, **kwargs)
+
+        checkpoint_path = os.path.join(self.data_dir.name,
+            download.CHECKPOINT_FILE)
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name):
+
+            mock_get.side_effect = fail_continuation
+            with self.assertRaises(exceptions.ApiError):
+                download.download_entries_csv()
+
+            checkpoint = download.Checkpoint.load(checkpoint_path)
+            self.assertTrue(checkpoint.tags['id_a']['done'])
+            self.assertEqual(checkpoint.tags['id_b'], {'continuation': '1',
+                'done': False, 'items': 2, 'newest': 1530631149285})
+            mock_set.assert_not_called()
+            mock_set_tags.assert_called_once_with({'id_a': 1530631149285})
+
+            # Simulate rows written after the checkpoint was saved
+            filepath = os.path.join(self.data_dir.name, checkpoint.filename)
+            with open(filepath, 'a', encoding='utf-8') as f:
+                f.write('"partial row')
+
+            mock_get.reset_mock()
+            mock_get.side_effect = mock_requests_get
+            filename = download.download_entries_csv()
+
+        self.assertEqual(filename, checkpoint.filename)
+        self.assertEqual([c.args[0] for c in mock_get.call_args_list], [
+            'https://cloud.feedly.com/v3/tags', failing_url])
+        self.assertFalse(os.path.exists(checkpoint_path))
+        mock_set.assert_called_once_with(checkpoint.downloaded)
+
+        with open(filepath, newline='', encoding='utf-8') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+
+        self.assertEqual([row['tag_id'] for row in rows],
+            ['id_a', 'id_b', 'id_b', 'id_b', 'id_b'])
+
+    @patch('feedstream.fetch.requests.Session.post',
+        side_effect=mock_requests_post_mget)
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.settings.download_incremental', True)
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv_resume_incremental(self, mock_set,
+        mock_set_tags, mock_get, mock_post):
+
+        """
+        Test that an incremental download saves the ids of each tag with the
+        seen ids once the tag is done, keeps only the ids of the tag in
+        progress in the checkpoint, and resumes with the seen ids it saved.
+
+        """
+
+        failing_url = ('https://cloud.feedly.com/v3/streams/ids'
+            '?streamId=id_b&continuation=1&count=10000')
+
+        def fail_continuation(*args, **kwargs):
+            if args[0] == failing_url:
+                return mock_requests_get_ids('unknown url')
+            return mock_requests_get_ids(*args, **kwargs)
+
+        seen_ids_file = os.path.join(self.data_dir.name, 'seen_ids.json')
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name), \
+            patch('feedstream.download.settings.state_dir',
+                self.data_dir.name), \
+            patch('feedstream.download.settings.seen_ids_file',
+                seen_ids_file):
+
+            download.set_seen_ids({'id_a': {'e1'}, 'id_b': {'e3', 'old'}})
+
+            mock_get.side_effect = fail_continuation
+            with self.assertRaises(exceptions.ApiError):
+                download.download_entries_csv()
+
+            checkpoint = download.Checkpoint.load(os.path.join(
+                self.data_dir.name, download.CHECKPOINT_FILE))
+            self.assertTrue(checkpoint.tags['id_a']['done'])
+            self.assertNotIn('ids', checkpoint.tags['id_a'])
+            self.assertEqual(checkpoint.tags['id_b']['ids'], ['e2', 'e3'])
+            self.assertEqual(download.get_seen_ids(),
+                {'id_a': {'e1', 'e2'}, 'id_b': {'e3', 'old'}})
+
+            mock_get.side_effect = mock_requests_get_ids
+            filename = download.download_entries_csv()
+            rows = self.read_rows(filename)
+
+            self.assertEqual(download.get_seen_ids(),
+                {'id_a': {'e1', 'e2'}, 'id_b': {'e2', 'e3', 'e4'}})
+
+        self.assertEqual([(row['tag_id'], row['article_id']) for row in rows],
+            [('id_a', 'e2'), ('id_b', 'e2'), ('id_b', 'e4')])
+
+    def read_rows(self, filename, compression='none'):
+
+        """Read the rows of a csv in the data directory."""
+
+        filepath = os.path.join(self.data_dir.name, filename)
+
+        if compression == 'gzip':
+            csvfile = gzip.open(filepath, 'rt', newline='', encoding='utf-8')
+        elif compression == 'zstd':
+            reader = download.zstandard.ZstdDecompressor().stream_reader(
+                open(filepath, 'rb'), read_across_frames=True)
+            csvfile = io.TextIOWrapper(reader, newline='', encoding='utf-8')
+        else:
+            csvfile = open(filepath, newline='', encoding='utf-8')
+
+        with csvfile:
+            return list(csv.DictReader(csvfile))
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv_compressed(self, mock_set, mock_set_tags,
+        mock_get):
+
+        """
+        Test that download_entries_csv writes a compressed csv which reads
+        back as a single stream, with gzip and with zstd if it is installed.
+
+        """
+
+        compressions = {'gzip': '.csv.gz'}
+        if download.zstandard is not None:
+            compressions['zstd'] = '.csv.zst'
+
+        for compression, extension in compressions.items():
+
+            with patch('feedstream.download.settings.data_dir',
+                self.data_dir.name), \
+                patch('feedstream.download.settings.csv_compression',
+                    compression):
+                filename = download.download_entries_csv()
+
+            self.assertTrue(filename.endswith(extension))
+            rows = self.read_rows(filename, compression)
+            self.assertEqual(len(rows), 5)
+            self.assertEqual(list(rows[0].keys()), data.FIELDNAMES)
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv_rotate(self, mock_set, mock_set_tags,
+        mock_get):
+
+        """
+        Test that download_entries_csv starts a new file with a header once
+        the current file has csv_rotate_rows rows, between pages.
+
+        """
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name), \
+            patch('feedstream.download.settings.csv_rotate_rows', 2):
+            filename = download.download_entries_csv()
+
+        part = filename.replace('.csv', '-2.csv')
+        self.assertEqual(len(self.read_rows(filename)), 3)
+        self.assertEqual(len(self.read_rows(part)), 2)
+        self.assertEqual(len(os.listdir(self.data_dir.name)), 2)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.settings.csv_compression', 'gzip')
+    @patch('feedstream.download.settings.csv_rotate_rows', 1)
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_csv_resume_compressed(self, mock_set,
+        mock_set_tags, mock_get):
+
+        """
+        Test that a compressed and rotated download resumes in the file where
+        it failed, and that every file reads back as a single gzip stream.
+
+        """
+
+        failing_url = ('https://cloud.feedly.com/v3/streams/contents'
+            '?streamId=id_b&continuation=1&count=1000')
+
+        def fail_continuation(*args, **kwargs):
+            if args[0] == failing_url:
+                return mock_requests_get('unknown url')
+            return mock_requests_get(*args, **kwargs)
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name):
+
+            mock_get.side_effect = fail_continuation
+            with self.assertRaises(exceptions.ApiError):
+                download.download_entries_csv()
+
+            # Simulate a partial gzip member written after the checkpoint
+            checkpoint = download.Checkpoint.load(os.path.join(
+                self.data_dir.name, download.CHECKPOINT_FILE))
+            self.assertEqual(checkpoint.part, 2)
+            filepath = os.path.join(self.data_dir.name,
+                checkpoint.get_part_filename())
+            with open(filepath, 'ab') as f:
+                f.write(gzip.compress(b'"partial row')[:10])
+
+            mock_get.side_effect = mock_requests_get
+            filename = download.download_entries_csv()
+
+        parts = [filename, filename.replace('.csv', '-2.csv'),
+            filename.replace('.csv', '-3.csv')]
+        self.assertEqual([len(self.read_rows(part, 'gzip'))
+            for part in parts], [1, 2, 2])
+
+    def test_checkpoint_load_old_format(self):
+
+        """
+        Test that a checkpoint saved before csv downloads were compressed or
+        rotated loads as an uncompressed download in a single file.
+
+        """
+
+        checkpoint_path = os.path.join(self.data_dir.name,
+            download.CHECKPOINT_FILE)
+
+        with open(checkpoint_path, 'w') as f:
+            f.write(json.dumps({
+                'filename': 'file.csv',
+                'downloaded': 200,
+                'since': {'id_a': None, 'id_b': None},
+                'offset': 30,
+                'tags': {
+                    'id_a': {'continuation': None, 'done': True,
+                        'items': 3, 'newest': 150},
+                    'id_b': {'continuation': '1', 'done': False,
+                        'items': 2, 'newest': 120}}}))
+
+        checkpoint = download.Checkpoint.load(checkpoint_path)
+        self.assertEqual(checkpoint.compression, 'none')
+        self.assertEqual(checkpoint.part, 1)
+        self.assertEqual(checkpoint.part_items, 5)
+        self.assertEqual(checkpoint.offset, 30)
+        self.assertEqual(checkpoint.get_part_filename(), 'file.csv')
+
+    def test_checkpoint_restore_seen_ids(self):
+
+        """
+        Test that a checkpoint restores the seen ids of the tags which are
+        done, keeping the old ids when the download was only for new entries.
+
+        """
+
+        checkpoint = download.Checkpoint('path', 'file.csv', 200,
+            since={'id_a': 100, 'id_b': 100})
+        checkpoint.record_page('id_a', {'items': [], 'ids': ['e3']}, [], 10)
+        checkpoint.record_page('id_b', {'items': [], 'ids': ['e4'],
+            'continuation': '1'}, [], 20)
+
+        seen = {'id_a': {'e1'}, 'id_b': {'e2'}}
+        checkpoint.restore_seen_ids(seen)
+        self.assertEqual(seen, {'id_a': {'e1', 'e3'}, 'id_b': {'e2'}})
+        self.assertEqual(checkpoint.offset, 20)
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+
+@unittest.skipIf(download.pyarrow is None, 'pyarrow is not installed')
+class TestDownloadEntriesParquet(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+
+    def check_table(self, table):
+
+        """Check a table read back from a download has typed columns."""
+
+        pyarrow = download.pyarrow
+        self.assertEqual(table.column_names, data.FIELDNAMES)
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.schema.field('pub_date').type,
+            pyarrow.date32())
+        self.assertEqual(table.schema.field('keywords').type,
+            pyarrow.list_(pyarrow.string()))
+
+        row = table.slice(0, 1).to_pylist()[0]
+        self.assertIsInstance(row['add_date'], datetime.date)
+        self.assertIsInstance(row['add_time'], datetime.time)
+        self.assertIsInstance(row['keywords'], list)
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_parquet(self, mock_set, mock_set_tags,
+        mock_get):
+
+        """
+        Test that download_entries_parquet writes a row for each item in row
+        groups of at most ROW_GROUP_SIZE rows, with typed columns, and
+        records the timestamps once the file is closed and can be read.
+
+        """
+
+        def check_closed(timestamps):
+            filename, = os.listdir(self.data_dir.name)
+            download.pyarrow.parquet.ParquetFile(
+                os.path.join(self.data_dir.name, filename))
+
+        mock_set_tags.side_effect = check_closed
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name), \
+            patch('feedstream.download.ROW_GROUP_SIZE', 2):
+            filename = download.download_entries_parquet()
+
+        self.assertTrue(filename.endswith('.parquet'))
+        filepath = os.path.join(self.data_dir.name, filename)
+
+        parquet_file = download.pyarrow.parquet.ParquetFile(filepath)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        self.check_table(parquet_file.read())
+        mock_set.assert_called_once()
+        mock_set_tags.assert_called_once_with(
+            {'id_a': 1530631149285, 'id_b': 1530631149285})
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.set_tag_timestamps')
+    @patch('feedstream.download.set_last_downloaded')
+    def test_download_entries_arrow(self, mock_set, mock_set_tags,
+        mock_get):
+
+        """
+        Test that download_entries_arrow writes an Arrow IPC file with a row
+        for each item and typed columns.
+
+        """
+
+        with patch('feedstream.download.settings.data_dir',
+            self.data_dir.name):
+            filename = download.download_entries_arrow()
+
+        self.assertTrue(filename.endswith('.arrow'))
+        filepath = os.path.join(self.data_dir.name, filename)
+        self.check_table(download.pyarrow.ipc.open_file(filepath).read_all())
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+
+class TestDownloadEntriesDf(unittest.TestCase):
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_download_entries_df(self, mock_get):
+
+        """
+        Test that download_entries_df returns a timestamp and a dataframe with
+        a row for each item and a column for each field.
+
+        """
+
+        timestamp, df = download.download_entries_df()
+        self.assertIsInstance(timestamp, int)
+        self.assertEqual(list(df.columns), data.FIELDNAMES)
+        self.assertEqual(len(df), 5)
+        self.assertEqual(list(df['tag_id']),
+            ['id_a', 'id_b', 'id_b', 'id_b', 'id_b'])
+
+
+class TestEntryColumns(unittest.TestCase):
+
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_to_dataframe(self):
+
+        """
+        Test that EntryColumns builds a dataframe with typed columns and the
+        same values as the items, including missing values.
+
+        """
+
+        mock_entry = get_mock_entry()
+        missing_entry = get_mock_entry()
+        del(missing_entry['published'])
+        del(missing_entry['actionTimestamp'])
+        del(missing_entry['origin'])
+
+        items = [
+            data.parse_item('id_a', 'lab_a', mock_entry, flatten=True),
+            data.parse_item('id_b', 'lab_b', missing_entry, flatten=True),
+            data.parse_item('id_a', 'lab_a', mock_entry, flatten=True)]
+
+        columns = download.EntryColumns()
+        for item in items:
+            columns.append(item)
+
+        df = columns.to_dataframe()
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(list(df.columns), data.FIELDNAMES)
+
+        self.assertEqual(df['tag_id'].dtype, 'category')
+        self.assertEqual(df['tag_label'].dtype, 'category')
+        self.assertEqual(df['publisher'].dtype, 'category')
+        self.assertEqual(df['add_date'].dtype.kind, 'M')
+        self.assertEqual(df['pub_date'].dtype.kind, 'M')
+        self.assertEqual(str(df['add_timestamp'].dtype), 'Int64')
+
+        self.assertEqual(list(df['tag_id']), ['id_a', 'id_b', 'id_a'])
+        self.assertEqual(df['add_timestamp'][0], 1530631149285)
+        self.assertTrue(pandas.isna(df['add_timestamp'][1]))
+        self.assertEqual(df['pub_date'][0].date(), datetime.date(2018, 7, 3))
+        self.assertTrue(pandas.isna(df['pub_date'][1]))
+        self.assertTrue(pandas.isna(df['publisher'][1]))
+        self.assertEqual(df['title'][2], 'Title')
+
+    def test_to_dataframe_int64(self):
+
+        """
+        Test that add_timestamp is a plain int64 column when no timestamps are
+        missing.
+
+        """
+
+        columns = download.EntryColumns()
+        columns.append(data.parse_item('id', 'lab', get_mock_entry(), True))
+        df = columns.to_dataframe()
+        self.assertEqual(df['add_timestamp'].dtype, 'int64')
+
+
 class TestTimestampFunctions(unittest.TestCase):
 
     """
@@ -178,12 +940,85 @@ class TestTimestampFunctions(unittest.TestCase):
         self.timestamp_file = 'timestamp.txt'
         open(self.timestamp_file, 'a').close()
 
-    @patch('feedstream.download.TIMESTAMP_FILE', 'timestamp.txt')
+    @patch('feedstream.download.settings.timestamp_file', 'timestamp.txt')
     def test_get_and_set_last_downloaded(self):
 
         download.set_last_downloaded(self.timestamp)
         timestamp = download.get_last_downloaded()
         self.assertEqual(timestamp, self.timestamp)
 
+    def test_get_and_set_tag_timestamps(self):
+
+        """
+        Test that tag timestamps are written to and read from the tag
+        timestamps file.
+
+        """
+
+        with tempfile.TemporaryDirectory() as timestamp_dir:
+
+            tag_timestamps_file = os.path.join(timestamp_dir, 'tags.json')
+
+            with patch('feedstream.download.settings.timestamp_dir',
+                timestamp_dir), \
+                patch('feedstream.download.settings.tag_timestamps_file',
+                    tag_timestamps_file):
+
+                self.assertIsNone(download.get_tag_timestamps())
+                download.set_tag_timestamps({'id_a': 100})
+                self.assertEqual(download.get_tag_timestamps(),
+                    {'id_a': 100})
+
+    @patch('feedstream.download.settings.download_new', True)
+    @patch('feedstream.download.get_last_downloaded', lambda: 50)
+    def test_get_since(self):
+
+        """
+        Test that each tag is downloaded from its own timestamp, that new
+        tags are downloaded in full, and that the last download timestamp is
+        used if there are no tag timestamps.
+
+        """
+
+        tags = [{'id': 'id_a'}, {'id': 'id_b'}]
+
+        with patch('feedstream.download.get_tag_timestamps',
+            lambda: {'id_a': 100, 'id_c': 300}):
+            self.assertEqual(download._get_since(tags),
+                {'id_a': 100, 'id_b': None})
+
+        with patch('feedstream.download.get_tag_timestamps', lambda: None):
+            self.assertEqual(download._get_since(tags),
+                {'id_a': 50, 'id_b': 50})
+
+        with patch('feedstream.download.settings.download_new', False):
+            self.assertEqual(download._get_since(tags),
+                {'id_a': None, 'id_b': None})
+
+    def test_checkpoint_tag_timestamps(self):
+
+        """
+        Test that a checkpoint gives each tag which is done the timestamp of
+        its newest item, or the timestamp it was downloaded from if it has no
+        newer items, and that tags which are not done keep the timestamp
+        they were downloaded from.
+
+        """
+
+        checkpoint = download.Checkpoint('path', 'file.csv', 200,
+            since={'id_a': 100, 'id_b': 100, 'id_c': None, 'id_d': 100,
+                'id_e': 100})
+        checkpoint.record_page('id_a', {'items': []}, [
+            {'add_timestamp': 150},
+            {'add_timestamp': None},
+            {'add_timestamp': 120}], 10)
+        checkpoint.record_page('id_b', {'items': []}, [], 10)
+        checkpoint.record_page('id_c', {'items': []}, [], 10)
+        checkpoint.record_page('id_d', {'items': [], 'continuation': '1'},
+            [{'add_timestamp': 150}], 10)
+
+        self.assertEqual(checkpoint.get_tag_timestamps(),
+            {'id_a': 150, 'id_b': 100, 'id_d': 100, 'id_e': 100})
+
     def tearDown(self):
         os.remove(self.timestamp_file)
@@ -2,17 +2,479 @@
 
 # Imports ---------------------------------------------------------------------
 
+import http.server
 import json
+import threading
+import time
 import unittest
 import feedstream.exceptions as exceptions
 import feedstream.fetch as fetch
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+# Mocks -----------------------------------------------------------------------
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        content = b'[]'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlowMockHandler(MockHandler):
+
+    def do_GET(self):
+        time.sleep(0.5)
+        super().do_GET()
 
 # Tests -----------------------------------------------------------------------
 
+class TestClient(unittest.TestCase):
+
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    def test_get_auth_headers(self):
+
+        """
+        Test that the client reuses its authorization headers until the
+        access token changes.
+
+        """
+
+        client = fetch.Client(1)
+        headers = client.get_auth_headers()
+        self.assertEqual(headers, {'Authorization': 'OAuth access token'})
+        self.assertIs(client.get_auth_headers(), headers)
+
+        with patch('feedstream.fetch.settings.access_token', 'new token'):
+            self.assertEqual(client.get_auth_headers(),
+                {'Authorization': 'OAuth new token'})
+
+    def test_connection_reuse(self):
+
+        """
+        Test that the client reuses a kept alive connection for repeated
+        requests to the same host, and counts the reuse.
+
+        """
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), MockHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        client = fetch.Client(1)
+        url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+
+        try:
+            for i in range(3):
+                self.assertTrue(client.get(url).ok)
+            self.assertEqual(client.get_stats(),
+                {'requests': 3, 'connections': 1, 'reused': 2, 'retries': 0})
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+    @patch('feedstream.fetch.RETRY_LIMIT', 0)
+    def test_request_timeout(self):
+
+        """
+        Test that the client gives up on a request once the server has not
+        responded within the client's timeout.
+
+        """
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), SlowMockHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        client = fetch.Client(1, timeout=(1.0, 0.1))
+        url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+
+        try:
+            with self.assertRaises(fetch.requests.exceptions.Timeout):
+                client.get(url)
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_default_timeout(self):
+
+        """
+        Test that the client's adapter sends requests with REQUEST_TIMEOUT
+        unless a request sets its own timeout.
+
+        """
+
+        client = fetch.Client(1)
+
+        with patch('feedstream.fetch.requests.adapters.HTTPAdapter.send') \
+            as mock_send:
+            client.adapter.send('request')
+            client.adapter.send('request', timeout=5.0)
+
+        self.assertEqual(mock_send.call_args_list[0].kwargs['timeout'],
+            fetch.REQUEST_TIMEOUT)
+        self.assertEqual(mock_send.call_args_list[1].kwargs['timeout'], 5.0)
+
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+
+        """Replace the clock with one that only advances while sleeping."""
+
+        self.now = 0.0
+
+        def sleep(seconds):
+            self.now += seconds
+
+        self.patches = [
+            patch('feedstream.fetch.time.monotonic', lambda: self.now),
+            patch('feedstream.fetch.time.sleep', MagicMock(side_effect=sleep))]
+
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def get_response(self, status_code, headers=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.ok = status_code == 200
+        response.headers = headers or {}
+        return response
+
+    @patch('feedstream.fetch.requests.Session.get')
+    def test_retry_server_error(self, mock_get):
+
+        """
+        Test that the client retries a request after a server error, with a
+        backoff no longer than RETRY_BACKOFF for the first retry.
+
+        """
+
+        mock_get.side_effect = [
+            self.get_response(503),
+            self.get_response(200)]
+
+        client = fetch.Client(1)
+        response = client.get('url')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(client.get_stats()['retries'], 1)
+        self.assertLessEqual(self.now, fetch.RETRY_BACKOFF)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    def test_retry_after(self, mock_get):
+
+        """
+        Test that the client waits for the delay in a Retry-After header
+        before retrying a throttled request.
+
+        """
+
+        mock_get.side_effect = [
+            self.get_response(429, {'Retry-After': '7'}),
+            self.get_response(200)]
+
+        client = fetch.Client(1)
+        response = client.get('url')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.now, 7.0)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    def test_retry_connection_error(self, mock_get):
+
+        """Test that the client retries a request which fails to connect."""
+
+        mock_get.side_effect = [
+            fetch.requests.exceptions.ConnectionError(),
+            self.get_response(200)]
+
+        client = fetch.Client(1)
+        self.assertEqual(client.get('url').status_code, 200)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('feedstream.fetch.requests.Session.get')
+    def test_retry_limit(self, mock_get):
+
+        """
+        Test that the client returns the last response once it has retried a
+        request RETRY_LIMIT times.
+
+        """
+
+        mock_get.return_value = self.get_response(500)
+
+        client = fetch.Client(1)
+        self.assertEqual(client.get('url').status_code, 500)
+        self.assertEqual(mock_get.call_count, fetch.RETRY_LIMIT + 1)
+
+    def test_get_backoff(self):
+
+        """Test that backoff delays stay within their exponential bounds."""
+
+        for attempt in range(10):
+            delay = fetch.get_backoff(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(
+                fetch.RETRY_BACKOFF * 2 ** attempt, fetch.RETRY_BACKOFF_MAX))
+
+    def test_rate_limiter(self):
+
+        """
+        Test that the rate limiter lets through the requests left in the
+        window and then waits for the window to reset.
+
+        """
+
+        limiter = fetch.RateLimiter()
+        limiter.acquire()
+        limiter.release({
+            'X-RateLimit-Count': '8',
+            'X-RateLimit-Limit': '10',
+            'X-RateLimit-Reset': '60'})
+
+        self.assertEqual(limiter.tokens, 2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(self.now, 0.0)
+
+        limiter.acquire()
+        self.assertEqual(self.now, 60.0)
+        self.assertIsNone(limiter.tokens)
+
+    def test_rate_limiter_max_wait(self):
+
+        """
+        Test that the rate limiter raises an ApiError rather than wait longer
+        than RATE_LIMIT_MAX_WAIT.
+
+        """
+
+        limiter = fetch.RateLimiter()
+        limiter.block(fetch.RATE_LIMIT_MAX_WAIT + 1)
+
+        with self.assertRaises(exceptions.ApiError):
+            limiter.acquire()
+
+
+class TestTokenRefresh(unittest.TestCase):
+
+    def get_response(self, token, **kwargs):
+
+        """
+        Get a mock response which is an expired token error for the old
+        token and ok for any other.
+
+        """
+
+        response = MagicMock()
+        response.headers = {}
+
+        if kwargs['headers'] == {'Authorization': 'OAuth old token'}:
+            response.status_code = 401
+            response.ok = False
+            response.content = json.dumps({'errorCode': 401,
+                'errorId': 'id', 'errorMessage': 'token expired: old'}
+                ).encode('utf-8')
+        else:
+            response.status_code = 200
+            response.ok = True
+            response.content = b'[]'
+
+        return response
+
+    def refresh(self):
+        fetch.settings.access_token = 'new token'
+
+    @patch('feedstream.fetch.fetch_access_token')
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.enterprise', True)
+    def test_refresh_expired_token(self, mock_get, mock_fetch_token):
+
+        """
+        Test that the client refreshes an expired token and sends only the
+        failed request again with the new token.
+
+        """
+
+        mock_get.side_effect = self.get_response
+        mock_fetch_token.side_effect = self.refresh
+
+        client = fetch.Client(1)
+        self.assertEqual(client.get('url').status_code, 200)
+        mock_fetch_token.assert_called_once_with()
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_called_with('url',
+            headers={'Authorization': 'OAuth new token'})
+
+    @patch('feedstream.fetch.time.sleep')
+    @patch('feedstream.fetch.fetch_access_token')
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.enterprise', True)
+    def test_refresh_expired_token_last_attempt(self, mock_get,
+        mock_fetch_token, mock_sleep):
+
+        """
+        Test that when the token expires on the last attempt the request is
+        still sent again with the new token, and that sending it again is
+        not counted as a retry.
+
+        """
+
+        server_error = MagicMock()
+        server_error.status_code = 500
+        server_error.ok = False
+        server_error.headers = {}
+
+        responses = [server_error] * fetch.RETRY_LIMIT
+
+        def get_response(*args, **kwargs):
+            if len(responses) > 0:
+                return responses.pop()
+            return self.get_response(*args, **kwargs)
+
+        mock_get.side_effect = get_response
+        mock_fetch_token.side_effect = self.refresh
+
+        client = fetch.Client(1)
+        self.assertEqual(client.get('url').status_code, 200)
+        mock_fetch_token.assert_called_once_with()
+        self.assertEqual(mock_get.call_count, fetch.RETRY_LIMIT + 2)
+        self.assertEqual(client.get_stats()['retries'], fetch.RETRY_LIMIT)
+
+    @patch('feedstream.fetch.fetch_access_token')
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.enterprise', True)
+    def test_refresh_expired_token_concurrent(self, mock_get,
+        mock_fetch_token):
+
+        """
+        Test that when concurrent requests fail with an expired token the
+        token is only refreshed once.
+
+        """
+
+        barrier = threading.Barrier(4)
+
+        def get_response(*args, **kwargs):
+            response = self.get_response(*args, **kwargs)
+            if response.status_code == 401:
+                barrier.wait(timeout=5)
+            return response
+
+        mock_get.side_effect = get_response
+        mock_fetch_token.side_effect = self.refresh
+
+        client = fetch.Client(4)
+        threads = [threading.Thread(target=client.get, args=('url',))
+            for i in range(4)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_fetch_token.assert_called_once_with()
+        self.assertEqual(mock_get.call_count, 8)
+
+    @patch('feedstream.fetch.fetch_access_token')
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.enterprise', True)
+    def test_refresh_token_before_expiry(self, mock_get, mock_fetch_token):
+
+        """
+        Test that the client refreshes a token which is about to expire
+        before sending a request with it.
+
+        """
+
+        def refresh():
+            self.refresh()
+            client.set_token_expiry(3600)
+
+        mock_get.side_effect = self.get_response
+        mock_fetch_token.side_effect = refresh
+
+        client = fetch.Client(1)
+        client.set_token_expiry(fetch.TOKEN_REFRESH_MARGIN / 2)
+
+        self.assertEqual(client.get('url').status_code, 200)
+        self.assertEqual(client.get('url').status_code, 200)
+        mock_fetch_token.assert_called_once_with()
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('feedstream.fetch.fetch_access_token')
+    @patch('feedstream.fetch.requests.Session.get')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    def test_no_refresh_without_enterprise(self, mock_get, mock_fetch_token):
+
+        """
+        Test that the client returns an expired token error without trying
+        to refresh the token for accounts which are not enterprise accounts.
+
+        """
+
+        mock_get.side_effect = self.get_response
+
+        client = fetch.Client(1)
+        self.assertEqual(client.get('url').status_code, 401)
+        mock_fetch_token.assert_not_called()
+
+    @patch('feedstream.fetch.settings.save')
+    @patch('feedstream.fetch.requests.Session.post')
+    @patch('feedstream.fetch.settings.access_token', 'old token')
+    @patch('feedstream.fetch.settings.refresh_token', 'refresh token',
+        create=True)
+    @patch('feedstream.fetch.settings.enterprise', True)
+    def test_fetch_access_token(self, mock_post, mock_save):
+
+        """
+        Test that fetch_access_token saves the new token and passes its
+        expiry to the client.
+
+        """
+
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.ok = True
+        mock_post.return_value.headers = {}
+        mock_post.return_value.content = json.dumps({
+            'access_token': 'new token', 'expires_in': 3600}).encode('utf-8')
+
+        client = fetch.Client(1)
+
+        with patch('feedstream.fetch._client', client):
+            fetch.fetch_access_token()
+
+        self.assertEqual(fetch.settings.access_token, 'new token')
+        mock_save.assert_called_once_with()
+        self.assertIsNotNone(client.token_expires_at)
+        self.assertFalse(client.is_token_expiring())
+
+
 class TestFetchTagIds(unittest.TestCase):
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     @patch('feedstream.fetch.settings.access_token', 'access token')
     @patch('feedstream.fetch.settings.enterprise', False)
     def test_fetch_tag_ids(self, mock_get):
@@ -27,13 +489,14 @@ class TestFetchTagIds(unittest.TestCase):
         headers = {'Authorization': 'OAuth {0}'.format('access token')}
 
         mock_get.return_value.ok = True
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url).encode('utf-8')
 
         response = fetch.fetch_tag_ids()
         self.assertEqual(response[0]['url'], url)
         mock_get.assert_called_once_with(url, headers=headers)
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     @patch('feedstream.fetch.settings.access_token', 'access token')
     @patch('feedstream.fetch.settings.enterprise', True)
     def test_fetch_tag_ids(self, mock_get):
@@ -48,13 +511,14 @@ class TestFetchTagIds(unittest.TestCase):
         headers = {'Authorization': 'OAuth {0}'.format('access token')}
 
         mock_get.return_value.ok = True
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url).encode('utf-8')
 
         response = fetch.fetch_tag_ids()
         self.assertEqual(response[0]['url'], url)
         mock_get.assert_called_once_with(url, headers=headers)
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     def test_fetch_tag_ids_api_error(self, mock_get):
 
         """
@@ -64,9 +528,9 @@ class TestFetchTagIds(unittest.TestCase):
         """
 
         mock_get.return_value.ok = False
-        mock_get.return_value.text = '{0}{1}'.format(
+        mock_get.return_value.content = '{0}{1}'.format(
             '{"errorCode":404,"errorId":"ap3int-sv2.2018070302.2773846",',
-            '"errorMessage":"API handler not found"}')
+            '"errorMessage":"API handler not found"}').encode('utf-8')
 
         with self.assertRaises(exceptions.ApiError):
             response = fetch.fetch_tag_ids()
@@ -74,7 +538,7 @@ class TestFetchTagIds(unittest.TestCase):
 
 class TestFetchTagEntryIds(unittest.TestCase):
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     @patch('feedstream.fetch.settings.access_token', 'access token')
     def test_fetch_tag_entry_ids(self, mock_get):
 
@@ -99,37 +563,42 @@ class TestFetchTagEntryIds(unittest.TestCase):
         mock_get.return_value.ok = True
 
         # Test with just a tag id
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_tag)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_tag).encode('utf-8')
         response = fetch.fetch_tag_entry_ids(tag_id)
         self.assertEqual(response[0]['url'], url_tag)
         mock_get.assert_called_with(url_tag, headers=headers)
 
         # Test with since argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_sin)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_sin).encode('utf-8')
         response = fetch.fetch_tag_entry_ids(tag_id, since=1)
         self.assertEqual(response[0]['url'], url_sin)
         mock_get.assert_called_with(url_sin, headers=headers)
 
         # Test with continuation argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_con)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_con).encode('utf-8')
         response = fetch.fetch_tag_entry_ids(tag_id, continuation=2)
         self.assertEqual(response[0]['url'], url_con)
         mock_get.assert_called_with(url_con, headers=headers)
 
         # Test with count argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_cou)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_cou).encode('utf-8')
         response = fetch.fetch_tag_entry_ids(tag_id, count=3)
         self.assertEqual(response[0]['url'], url_cou)
         mock_get.assert_called_with(url_cou, headers=headers)
 
         # Test with all arguments
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_all)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_all).encode('utf-8')
         response = fetch.fetch_tag_entry_ids(tag_id,
             since=1, continuation=2, count=3)
         self.assertEqual(response[0]['url'], url_all)
         mock_get.assert_called_with(url_all, headers=headers)
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     def test_fetch_tag_entry_ids_api_error(self, mock_get):
 
         """
@@ -139,9 +608,9 @@ class TestFetchTagEntryIds(unittest.TestCase):
         """
 
         mock_get.return_value.ok = False
-        mock_get.return_value.text = '{0}{1}'.format(
+        mock_get.return_value.content = '{0}{1}'.format(
             '{"errorCode":404,"errorId":"ap3int-sv2.2018070302.2773846",',
-            '"errorMessage":"API handler not found"}')
+            '"errorMessage":"API handler not found"}').encode('utf-8')
 
         with self.assertRaises(exceptions.ApiError):
             response = fetch.fetch_tag_entry_ids('tag_id')
@@ -149,7 +618,7 @@ class TestFetchTagEntryIds(unittest.TestCase):
 
 class TestFetchEntry(unittest.TestCase):
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     @patch('feedstream.fetch.settings.access_token', 'access token')
     def test_fetch_tag_ids(self, mock_get):
 
@@ -163,13 +632,14 @@ class TestFetchEntry(unittest.TestCase):
         headers = {'Authorization': 'OAuth {0}'.format('access token')}
 
         mock_get.return_value.ok = True
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url).encode('utf-8')
 
         response = fetch.fetch_entry('entry_id')
         self.assertEqual(response['url'], url)
         mock_get.assert_called_once_with(url, headers=headers)
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     def test_fetch_entry_api_error(self, mock_get):
 
         """
@@ -179,16 +649,16 @@ class TestFetchEntry(unittest.TestCase):
         """
 
         mock_get.return_value.ok = False
-        mock_get.return_value.text = '{0}{1}'.format(
+        mock_get.return_value.content = '{0}{1}'.format(
             '{"errorCode":404,"errorId":"ap3int-sv2.2018070302.2773846",',
-            '"errorMessage":"API handler not found"}')
+            '"errorMessage":"API handler not found"}').encode('utf-8')
 
         with self.assertRaises(exceptions.ApiError):
             response = fetch.fetch_entry('entry_id')
 
 class TestFetchTagEntries(unittest.TestCase):
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     @patch('feedstream.fetch.settings.access_token', 'access token')
     def test_fetch_tag_entries(self, mock_get):
 
@@ -213,37 +683,42 @@ class TestFetchTagEntries(unittest.TestCase):
         mock_get.return_value.ok = True
 
         # Test with just a tag id
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_tag)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_tag).encode('utf-8')
         response = fetch.fetch_tag_entries(tag_id)
         self.assertEqual(response[0]['url'], url_tag)
         mock_get.assert_called_with(url_tag, headers=headers)
 
         # Test with since argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_sin)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_sin).encode('utf-8')
         response = fetch.fetch_tag_entries(tag_id, since=1)
         self.assertEqual(response[0]['url'], url_sin)
         mock_get.assert_called_with(url_sin, headers=headers)
 
         # Test with continuation argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_con)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_con).encode('utf-8')
         response = fetch.fetch_tag_entries(tag_id, continuation=2)
         self.assertEqual(response[0]['url'], url_con)
         mock_get.assert_called_with(url_con, headers=headers)
 
         # Test with count argument
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_cou)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_cou).encode('utf-8')
         response = fetch.fetch_tag_entries(tag_id, count=3)
         self.assertEqual(response[0]['url'], url_cou)
         mock_get.assert_called_with(url_cou, headers=headers)
 
         # Test with all arguments
-        mock_get.return_value.text = '[{{"url": "{0}"}}]'.format(url_all)
+        mock_get.return_value.content = '[{{"url": "{0}"}}]'.format(
+            url_all).encode('utf-8')
         response = fetch.fetch_tag_entries(tag_id,
             since=1, continuation=2, count=3)
         self.assertEqual(response[0]['url'], url_all)
         mock_get.assert_called_with(url_all, headers=headers)
 
-    @patch('feedstream.fetch.requests.get')
+    @patch('feedstream.fetch.requests.Session.get')
     def test_fetch_tag_entries_api_error(self, mock_get):
 
         """
@@ -253,9 +728,197 @@ class TestFetchTagEntries(unittest.TestCase):
         """
 
         mock_get.return_value.ok = False
-        mock_get.return_value.text = json.dumps({
+        mock_get.return_value.content = json.dumps({
             'errorCode': 404, 'errorId': 'ap3int-sv2.2018070302.2773846',
-            'errorMessage': 'API handler not found'})
+            'errorMessage': 'API handler not found'}).encode('utf-8')
 
         with self.assertRaises(exceptions.ApiError):
             response = fetch.fetch_tag_entries('tag_id')
+
+
+class TestFetchEntries(unittest.TestCase):
+
+    @patch('feedstream.fetch.requests.Session.post')
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.ENTRIES_BATCH_SIZE', 2)
+    def test_fetch_entries(self, mock_post):
+
+        """
+        Test that fetch_entries posts the ids in chunks of the batch size to
+        the bulk entries endpoint, and returns the entries in the order of the
+        given ids, leaving out ids with no entry.
+
+        """
+
+        url = 'https://cloud.feedly.com/v3/entries/.mget'
+        headers = {'Authorization': 'OAuth {0}'.format('access token')}
+
+        def mock_mget(*args, **kwargs):
+            response = MagicMock()
+            response.ok = True
+            response.content = json.dumps([{'id': entry_id}
+                for entry_id in reversed(kwargs['json']) if entry_id != 'x']
+                ).encode('utf-8')
+            return response
+
+        mock_post.side_effect = mock_mget
+        ids = ['a', 'b', 'c', 'x', 'e']
+
+        for workers in [1, 3]:
+
+            mock_post.reset_mock()
+            response = fetch.fetch_entries(ids, workers=workers)
+
+            self.assertEqual([entry['id'] for entry in response],
+                ['a', 'b', 'c', 'e'])
+            self.assertEqual(mock_post.call_count, 3)
+            mock_post.assert_any_call(url,
+                data=None, json=['a', 'b'], headers=headers)
+            mock_post.assert_any_call(url,
+                data=None, json=['c', 'x'], headers=headers)
+            mock_post.assert_any_call(url,
+                data=None, json=['e'], headers=headers)
+
+    @patch('feedstream.fetch.requests.Session.post')
+    def test_fetch_entries_api_error(self, mock_post):
+
+        """
+        Test that fetch_entries raises an ApiError when the response status is
+        not ok.
+
+        """
+
+        mock_post.return_value.ok = False
+        mock_post.return_value.content = json.dumps({
+            'errorCode': 404, 'errorId': 'ap3int-sv2.2018070302.2773846',
+            'errorMessage': 'API handler not found'}).encode('utf-8')
+
+        with self.assertRaises(exceptions.ApiError):
+            response = fetch.fetch_entries(['entry_id'])
+
+
+class TestPaginator(unittest.TestCase):
+
+    def test_paginator_adapts_count(self):
+
+        """
+        Test that a paginator halves its count after slow or large pages, not
+        below MIN_COUNT, and doubles it back to the maximum after fast pages.
+
+        """
+
+        paginator = fetch.Paginator(1000)
+        self.assertEqual(paginator.count, 1000)
+
+        paginator.record('tag_a', fetch.PAGE_TARGET_SECONDS + 1, 100)
+        self.assertEqual(paginator.count, 500)
+
+        paginator.record('tag_a', 0.1, fetch.PAGE_MAX_BYTES + 1)
+        self.assertEqual(paginator.count, 250)
+
+        for i in range(10):
+            paginator.record('tag_b', fetch.PAGE_TARGET_SECONDS + 1, 100)
+        self.assertEqual(paginator.count, fetch.MIN_COUNT)
+
+        paginator.record('tag_b', fetch.PAGE_TARGET_SECONDS * 0.75, 100)
+        self.assertEqual(paginator.count, fetch.MIN_COUNT)
+
+        for i in range(10):
+            paginator.record('tag_b', 0.1, 100)
+        self.assertEqual(paginator.count, 1000)
+
+    def test_paginator_stats(self):
+
+        """
+        Test that a paginator records the pages, seconds and bytes for each
+        tag, passes its count to the fetch function, and resets.
+
+        """
+
+        paginator = fetch.Paginator(1000)
+        func = MagicMock(return_value={'items': []})
+
+        with patch('feedstream.fetch.get_last_response_size',
+            return_value=10):
+            paginator.fetch_page(func, 'tag_a', since=5, continuation='c')
+            paginator.fetch_page(func, 'tag_a')
+
+        func.assert_any_call('tag_a', since=5, continuation='c', count=1000)
+        stats = paginator.get_stats()
+        self.assertEqual(list(stats.keys()), ['tag_a'])
+        self.assertEqual(stats['tag_a']['pages'], 2)
+        self.assertEqual(stats['tag_a']['bytes'], 20)
+
+        paginator.count = 100
+        paginator.reset()
+        self.assertEqual(paginator.count, 1000)
+        self.assertEqual(paginator.get_stats(), {})
+
+
+class TestJsonBackend(unittest.TestCase):
+
+    def tearDown(self):
+        fetch.set_json_backend()
+
+    def test_default_json_backend(self):
+
+        """
+        Test that the default json backend is the first of the backends which
+        is installed.
+
+        """
+
+        fetch.set_json_backend()
+        if fetch.orjson is not None:
+            self.assertEqual(fetch.get_json_backend(), 'orjson')
+        elif fetch.ujson is not None:
+            self.assertEqual(fetch.get_json_backend(), 'ujson')
+        else:
+            self.assertEqual(fetch.get_json_backend(), 'json')
+
+    def test_set_json_backend(self):
+
+        """
+        Test that every installed backend decodes a response from its bytes,
+        and that unknown or missing backends are rejected.
+
+        """
+
+        response = MagicMock()
+        response.ok = True
+        response.content = json.dumps(
+            {'items': [{'title': 'café'}]}).encode('utf-8')
+
+        for name in fetch.JSON_BACKENDS:
+            if fetch._get_json_module(name) is None:
+                with self.assertRaises(ImportError):
+                    fetch.set_json_backend(name)
+                continue
+            fetch.set_json_backend(name)
+            self.assertEqual(fetch.get_json_backend(), name)
+            self.assertEqual(fetch._decode_response(response),
+                {'items': [{'title': 'café'}]})
+            self.assertEqual(fetch.get_last_response_size(),
+                len(response.content))
+
+        with self.assertRaises(ValueError):
+            fetch.set_json_backend('simplejson')
+
+    def test_decode_non_json_error(self):
+
+        """
+        Test that an error response which is not json raises an ApiError
+        with the decoded body as its message.
+
+        """
+
+        response = MagicMock()
+        response.ok = False
+        response.status_code = 502
+        response.content = b'Bad Gateway'
+
+        with self.assertRaises(exceptions.ApiError) as cm:
+            fetch._decode_response(response)
+
+        self.assertEqual(cm.exception.status_code, 502)
+        self.assertEqual(cm.exception.api_msg, 'Bad Gateway')
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import json
+import requests
+import unittest
+import pandas
+import feedstream.download as download
+import feedstream.fetch as fetch
+import feedstream.mail as mail
+from unittest.mock import MagicMock, patch
+
+# Mocks -----------------------------------------------------------------------
+
+def get_mock_articles():
+
+    """
+    Get a dataframe of articles in three tags, built in the same way as the
+    dataframe from download_entries_df. Article a_2 is in tags tag_a and
+    tag_b, and article a_4 is in all three tags.
+
+    """
+
+    tags = [
+        ('tag_a', ['a_1', 'a_2', 'a_4']),
+        ('tag_b', ['a_2', 'a_3', 'a_4']),
+        ('tag_c', ['a_4', 'a_5'])]
+
+    columns = download.EntryColumns()
+    timestamp = 1000
+
+    for tag_id, article_ids in tags:
+        for article_id in article_ids:
+            columns.append({
+                'tag_id': tag_id,
+                'tag_label': tag_id.upper(),
+                'add_timestamp': timestamp,
+                'add_date': None,
+                'add_time': None,
+                'pub_date': None,
+                'publisher': None,
+                'url': 'http://{0}.com'.format(article_id),
+                'title': article_id,
+                'author': None,
+                'summary': None,
+                'full_content': None,
+                'short_content': None,
+                'keywords': None,
+                'comments': None,
+                'highlights': None,
+                'article_id': article_id})
+            timestamp -= 1
+
+    return columns.to_dataframe()
+
+
+def get_mock_users():
+
+    return [
+        {'email_address': 'one@domain.com', 'tag_ids': ['tag_a', 'tag_b']},
+        {'email_address': 'two@domain.com', 'tag_ids': ['tag_c']},
+        {'email_address': 'three@domain.com', 'tag_ids': ['tag_b', 'tag_a']},
+        {'email_address': 'four@domain.com', 'tag_ids': ['tag_x']},
+        {'email_address': 'five@domain.com', 'tag_ids': []}]
+
+# Tests -----------------------------------------------------------------------
+
+class TestGetArticlesByUser(unittest.TestCase):
+
+    def test_get_articles_by_user(self):
+
+        """
+        Test that each user gets the unique articles in their tags in the
+        order of the articles dataframe, as selected one user at a time.
+
+        """
+
+        articles = get_mock_articles()
+        users = get_mock_users()
+        users_articles = mail.get_articles_by_user(users, articles)
+
+        self.assertEqual(list(users_articles.keys()),
+            [user['email_address'] for user in users])
+
+        for user in users:
+            expected = articles.loc[articles['tag_id'].isin(
+                user['tag_ids'])].drop_duplicates(['article_id'])
+            pandas.testing.assert_frame_equal(
+                users_articles[user['email_address']], expected)
+
+        self.assertEqual(
+            list(users_articles['one@domain.com']['article_id']),
+            ['a_1', 'a_2', 'a_4', 'a_3'])
+        self.assertEqual(
+            list(users_articles['two@domain.com']['article_id']),
+            ['a_4', 'a_5'])
+        self.assertEqual(len(users_articles['four@domain.com']), 0)
+        self.assertEqual(len(users_articles['five@domain.com']), 0)
+
+    def test_get_articles_by_user_shared(self):
+
+        """
+        Test that users who follow the same set of tags share one dataframe.
+
+        """
+
+        users_articles = mail.get_articles_by_user(
+            get_mock_users(), get_mock_articles())
+
+        self.assertIs(users_articles['one@domain.com'],
+            users_articles['three@domain.com'])
+        self.assertIsNot(users_articles['one@domain.com'],
+            users_articles['two@domain.com'])
+
+
+class TestCreateEmailBody(unittest.TestCase):
+
+    def setUp(self):
+
+        self.write_patcher = patch('feedstream.mail._write_email')
+        self.mock_write = self.write_patcher.start()
+
+    def tearDown(self):
+        self.write_patcher.stop()
+
+    def test_create_email_body(self):
+
+        """
+        Test that an email shows each tag once with its articles, starting
+        with the tag of the first article, and is written to the production
+        mail directory.
+
+        """
+
+        articles = get_mock_articles()
+        users_articles = mail.get_articles_by_user(
+            get_mock_users(), articles)
+        body = mail.create_email_body(
+            'one@domain.com', users_articles['one@domain.com'])
+
+        self.assertEqual(body.count('<h3>'), 2)
+        self.assertLess(body.index('<h3>TAG_A</h3>'),
+            body.index('<h3>TAG_B</h3>'))
+        self.assertEqual(body.count('<h4>'), 4)
+        self.assertLess(body.index('>a_4</a>'), body.index('<h3>TAG_B</h3>'))
+        self.mock_write.assert_called_once_with('one@domain.com', body)
+
+        body = mail.create_email_body('six@domain.com', articles.iloc[[0]])
+        self.assertEqual(body.count('<h3>'), 1)
+        self.assertIn('<h3>TAG_A</h3>', body)
+
+        self.assertIsNone(
+            mail.create_email_body('five@domain.com', articles.iloc[[]]))
+
+    def test_create_email_body_grouped(self):
+
+        """
+        Test that articles are grouped by tag when the rows for a tag are not
+        together, with tags in the order they first appear.
+
+        """
+
+        articles = get_mock_articles().iloc[[4, 0, 6, 5, 1]]
+        body = mail.create_email_body('one@domain.com', articles)
+
+        self.assertEqual(body.count('<h3>'), 3)
+        positions = [body.index(text) for text in [
+            '<h3>TAG_B</h3>', '>a_3</a>', '>a_4</a>',
+            '<h3>TAG_A</h3>', '>a_1</a>', '>a_2</a>',
+            '<h3>TAG_C</h3>']]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_get_emails_by_user(self):
+
+        """
+        Test that users who follow the same tags share one email body, and
+        that an email is written for each user with articles.
+
+        """
+
+        users_articles = mail.get_articles_by_user(
+            get_mock_users(), get_mock_articles())
+        users_emails = mail.get_emails_by_user(users_articles)
+
+        self.assertIs(users_emails['one@domain.com'],
+            users_emails['three@domain.com'])
+        self.assertIn('<h3>TAG_C</h3>', users_emails['two@domain.com'])
+        self.assertIsNone(users_emails['four@domain.com'])
+        self.assertIsNone(users_emails['five@domain.com'])
+        self.assertEqual(self.mock_write.call_count, 3)
+
+    def test_renderer_cache(self):
+
+        """
+        Test that a renderer renders each article once, and each tag once
+        for each distinct set of its articles.
+
+        """
+
+        articles = get_mock_articles()
+        users_articles = mail.get_articles_by_user(
+            get_mock_users(), articles)
+        renderer = mail.EmailRenderer()
+
+        for email_address in ['one@domain.com', 'two@domain.com']:
+            renderer.render(users_articles[email_address])
+
+        renderer.render(articles.iloc[[5, 6, 7]])
+
+        self.assertEqual(sorted(renderer.items),
+            ['a_1', 'a_2', 'a_3', 'a_4', 'a_5'])
+        self.assertEqual(sorted(renderer.tags), [
+            ('tag_a', ('a_1', 'a_2', 'a_4')),
+            ('tag_b', ('a_3',)),
+            ('tag_b', ('a_4',)),
+            ('tag_c', ('a_4', 'a_5'))])
+
+
+class TestMailshot(unittest.TestCase):
+
+    def setUp(self):
+
+        self.users_emails = {
+            'user_{0}@domain.com'.format(i): '<p>{0}</p>'.format(i)
+            for i in range(5)}
+
+    def test_get_mailshot_batches(self):
+
+        """
+        Test that a mailshot is split into batches of recipients, each with
+        a payload in the same form as the whole mailshot.
+
+        """
+
+        batches = list(mail.get_mailshot_batches(
+            'Subject', self.users_emails, batch_size=2))
+
+        self.assertEqual([len(addresses) for addresses, payload in batches],
+            [2, 2, 1])
+
+        recipients = []
+        for addresses, payload in batches:
+            mailshot_data = json.loads(payload)
+            self.assertEqual(mailshot_data['subject'], 'Subject')
+            self.assertEqual([r['email'] for r in
+                mailshot_data['recipients']], addresses)
+            recipients.extend(mailshot_data['recipients'])
+
+        self.assertEqual(recipients, json.loads(mail.get_mailshot_data(
+            'Subject', self.users_emails))['recipients'])
+
+    def test_get_mailshot_batches_size(self):
+
+        """Test that a batch size of less than one raises a ValueError."""
+
+        for batch_size in [0, -1]:
+            with self.assertRaises(ValueError):
+                list(mail.get_mailshot_batches(
+                    'Subject', self.users_emails, batch_size=batch_size))
+
+    @patch('feedstream.mail.settings.mailer_endpoint', 'http://mailer')
+    @patch('feedstream.mail.requests.Session.post')
+    def test_send_mailshot_batches(self, mock_post):
+
+        """
+        Test that every batch is sent to the mailer endpoint, and that a
+        batch which fails or cannot connect is reported without stopping
+        the others.
+
+        """
+
+        def mock_mailer(url, data=None):
+            recipients = json.loads(data)['recipients']
+            emails = [r['email'] for r in recipients]
+            if 'user_2@domain.com' in emails:
+                raise requests.ConnectionError('connection refused')
+            response = MagicMock()
+            response.ok = 'user_4@domain.com' not in emails
+            response.status_code = 200 if response.ok else 500
+            response.text = 'mailer error'
+            return response
+
+        mock_post.side_effect = mock_mailer
+
+        results = mail.send_mailshot_batches('Subject', self.users_emails,
+            batch_size=2, workers=2)
+
+        self.assertEqual(mock_post.call_count, 3)
+        mock_post.assert_any_call('http://mailer', data=mail.get_mailshot_data(
+            'Subject', {'user_4@domain.com': '<p>4</p>'}))
+
+        self.assertEqual([r['batch'] for r in results], [0, 1, 2])
+        self.assertEqual([r['ok'] for r in results], [True, False, False])
+        self.assertEqual([r['status_code'] for r in results], [200, None, 500])
+        self.assertEqual(results[0]['recipients'],
+            ['user_0@domain.com', 'user_1@domain.com'])
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(results[1]['error'], 'connection refused')
+        self.assertEqual(results[2]['error'], 'mailer error')
+
+    def test_get_session(self):
+
+        """
+        Test that the mailer and the API client get their sessions from the
+        same helper, each with its own headers.
+
+        """
+
+        session = fetch.get_session(2, {'Content-Type': 'application/json'})
+        adapter = session.get_adapter('http://mailer')
+
+        self.assertIsInstance(adapter, fetch.TimeoutAdapter)
+        self.assertEqual(adapter.timeout, fetch.REQUEST_TIMEOUT)
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+        self.assertEqual(session.headers['Content-Type'], 'application/json')
+
+        client = fetch.Client(2)
+        self.assertIsInstance(client.adapter, fetch.TimeoutAdapter)
+        self.assertEqual(client.session.headers['Accept-Encoding'],
+            'gzip, deflate')
+        self.assertNotIn('Content-Type', client.session.headers)
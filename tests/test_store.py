@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+# Imports ---------------------------------------------------------------------
+
+import datetime
+import os
+import tempfile
+import unittest
+import feedstream.data as data
+import feedstream.store as store
+from unittest.mock import patch
+from tests.test_data import get_mock_entry
+from tests.test_download import mock_requests_get
+
+# Mocks -----------------------------------------------------------------------
+
+def get_mock_items():
+
+    """
+    Get flattened items for two articles, one of which appears in two tags.
+
+    """
+
+    entry_a = get_mock_entry()
+    entry_b = get_mock_entry()
+    entry_b['id'] = 'entry_b'
+    entry_b['actionTimestamp'] = entry_a['actionTimestamp'] + 1000
+
+    return data.parse_items('id_a', 'lab_a', [entry_a], flatten=True) + \
+        data.parse_items('id_b', 'lab_b', [entry_a, entry_b], flatten=True)
+
+# Tests -----------------------------------------------------------------------
+
+class TestArticleStore(unittest.TestCase):
+
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def setUp(self):
+        self.store = store.ArticleStore(':memory:')
+        self.items = get_mock_items()
+        self.store.add_items(self.items)
+
+    def test_add_items_deduplicates(self):
+
+        """
+        Test that an article in several tags is stored once, and that
+        storing the same items again updates rather than duplicates them.
+
+        """
+
+        article_id = self.items[0]['article_id']
+        self.assertEqual(self.store.count_articles(), 2)
+        self.assertEqual(self.store.get_article_tags(article_id),
+            ['id_a', 'id_b'])
+
+        for item in self.items[:2]:
+            item['title'] = 'New title'
+        self.store.add_items(self.items)
+
+        self.assertEqual(self.store.count_articles(), 2)
+        self.assertEqual(len(self.store.get_items()), 3)
+        self.assertEqual(self.store.get_article(article_id)['title'],
+            'New title')
+
+    def test_get_article(self):
+
+        """Test that get_article returns the stored fields of an article."""
+
+        article = self.store.get_article(self.items[0]['article_id'])
+        self.assertEqual(article['url'], self.items[0]['url'])
+        self.assertIsInstance(article['pub_date'], datetime.date)
+        self.assertIsNone(self.store.get_article('missing'))
+
+    def test_get_tags(self):
+
+        """Test that get_tags returns tags in the order they were stored."""
+
+        self.assertEqual(self.store.get_tags(),
+            [('id_a', 'lab_a'), ('id_b', 'lab_b')])
+
+    def test_get_seen_ids(self):
+
+        """Test that get_seen_ids returns the article ids for each tag."""
+
+        article_id = self.items[0]['article_id']
+        self.assertEqual(self.store.get_seen_ids(), {
+            'id_a': {article_id},
+            'id_b': {article_id, 'entry_b'}})
+
+    def test_get_tag_timestamps(self):
+
+        """
+        Test that get_tag_timestamps returns the newest add timestamp for
+        each tag.
+
+        """
+
+        timestamp = self.items[0]['add_timestamp']
+        self.assertEqual(self.store.get_tag_timestamps(), {
+            'id_a': timestamp,
+            'id_b': timestamp + 1000})
+
+    def test_get_items(self):
+
+        """
+        Test that get_items returns items in the form they were stored,
+        ordered by tag and then from the most recently added.
+
+        """
+
+        items = self.store.get_items()
+        self.assertEqual(items, [self.items[0], self.items[2], self.items[1]])
+
+    def test_get_items_filters(self):
+
+        """
+        Test that get_items filters by tag and timestamp, and returns each
+        article once for its first tag if unique is True.
+
+        """
+
+        article_id = self.items[0]['article_id']
+
+        self.assertEqual(
+            [i['article_id'] for i in self.store.get_items(unique=True)],
+            [article_id, 'entry_b'])
+        self.assertEqual(
+            [i['tag_id'] for i in self.store.get_items(unique=True)],
+            ['id_a', 'id_b'])
+        self.assertEqual(
+            [i['article_id'] for i in self.store.get_items(['id_b'])],
+            ['entry_b', article_id])
+        self.assertEqual(
+            [i['article_id'] for i in self.store.get_items(
+                since=self.items[0]['add_timestamp'])],
+            ['entry_b'])
+
+    def test_get_items_df(self):
+
+        """
+        Test that get_items_df returns a dataframe with a row for each item
+        and a column for each field.
+
+        """
+
+        df = self.store.get_items_df(unique=True)
+        self.assertEqual(list(df.columns), data.FIELDNAMES)
+        self.assertEqual(len(df), 2)
+
+    def tearDown(self):
+        self.store.close()
+
+
+class TestDownloadEntriesStore(unittest.TestCase):
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', False)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    def test_download_entries_store(self, mock_get):
+
+        """
+        Test that download_entries_store stores every item downloaded, and
+        stores each article once.
+
+        """
+
+        with tempfile.TemporaryDirectory() as data_dir:
+
+            with patch('feedstream.store.settings.data_dir', data_dir):
+                count = store.download_entries_store()
+
+            self.assertTrue(os.path.exists(
+                os.path.join(data_dir, store.DB_FILE)))
+
+            with store.ArticleStore(os.path.join(data_dir, store.DB_FILE)) \
+                as article_store:
+                self.assertEqual(count, 5)
+                self.assertEqual(article_store.count_articles(), 1)
+                self.assertEqual(len(article_store.get_items()), 2)
+
+    @patch('feedstream.fetch.requests.Session.get',
+        side_effect=mock_requests_get)
+    @patch('feedstream.fetch.settings.access_token', 'access token')
+    @patch('feedstream.fetch.settings.enterprise', False)
+    @patch('feedstream.fetch.settings.download_new', True)
+    @patch('feedstream.data.settings.timezone', 'Europe/London')
+    @patch('feedstream.download.get_tag_timestamps',
+        lambda: {'id_a': 200, 'id_b': 200})
+    @patch('feedstream.download.get_last_downloaded', lambda: 200)
+    def test_download_entries_store_new(self, mock_get):
+
+        """
+        Test that download_entries_store downloads each tag from the newest
+        article in the store rather than the timestamps recorded by the file
+        downloads, and downloads tags with no stored articles in full.
+
+        """
+
+        item = get_mock_items()[0]
+        item['add_timestamp'] = 100
+
+        with store.ArticleStore(':memory:') as article_store:
+            article_store.add_items([item])
+            count = store.download_entries_store(article_store)
+
+        urls = [c.args[0] for c in mock_get.call_args_list]
+        contents_url = 'https://cloud.feedly.com/v3/streams/contents'
+        self.assertEqual(urls[1:], [
+            contents_url + '?streamId=id_a&newerThan=100&count=1000',
+            contents_url + '?streamId=id_b&count=1000',
+            contents_url + '?streamId=id_b&continuation=1&count=1000'])
+        self.assertEqual(count, 5)